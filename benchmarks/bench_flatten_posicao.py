@@ -0,0 +1,77 @@
+# benchmarks/bench_flatten_posicao.py
+"""Micro-benchmark: loop aninhado antigo de etl_cycle x core/flatten_posicao.
+
+Uso:
+    python benchmarks/bench_flatten_posicao.py [--fixture posicao.json.gz] [--vehicles 15000]
+
+Sem --fixture gera um /Posicao sintético (benchmarks/fixtures.py).
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from benchmarks.fixtures import load_fixture, make_posicao
+from core.flatten_posicao import flatten_posicao
+
+
+def legacy_rows(data):
+    """Cópia do loop original de main_posicoes.etl_cycle"""
+    hr = data.get('hr', 'N/A')
+    rows_to_insert = []
+    for line in data.get('l', []):
+        line_c = line.get("c")
+        line_cl = line.get("cl")
+        line_sl = line.get("sl")
+        line_lt0 = line.get("lt0")
+        line_lt1 = line.get("lt1")
+        for vehicle in line.get('vs', []):
+            rows_to_insert.append({
+                "fetch_time": datetime.now(timezone.utc).isoformat(),
+                "hr": hr,
+                "line_c": line_c,
+                "line_cl": line_cl,
+                "line_sl": line_sl,
+                "line_lt0": line_lt0,
+                "line_lt1": line_lt1,
+                "vehicle_p": vehicle.get("p"),
+                "vehicle_a": vehicle.get("a"),
+                "vehicle_ta": vehicle.get("ta"),
+                "vehicle_py": vehicle.get("py"),
+                "vehicle_px": vehicle.get("px")
+            })
+    return rows_to_insert
+
+
+def bench(fn, data, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(data)
+        times.append(time.perf_counter() - t0)
+    times.sort()
+    return times[len(times) // 2], times[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixture", help="/Posicao gravado (.json ou .json.gz)")
+    parser.add_argument("--vehicles", type=int, default=15000, help="tamanho da frota sintética")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    data = load_fixture(args.fixture) if args.fixture else make_posicao(args.vehicles)
+    n = sum(len(line.get('vs') or ()) for line in data.get('l', []))
+    print(f"Fixture: {args.fixture or 'sintético'} | {len(data.get('l', []))} linhas | {n} veículos")
+
+    for name, fn in [("loop antigo", legacy_rows), ("flatten_posicao", flatten_posicao)]:
+        med, best = bench(fn, data, args.repeat)
+        print(f"{name:<16} mediana {med * 1000:7.2f} ms | melhor {best * 1000:7.2f} ms | {n / med:,.0f} veículos/s")
+
+
+if __name__ == '__main__':
+    main()
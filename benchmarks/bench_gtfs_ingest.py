@@ -0,0 +1,85 @@
+# benchmarks/bench_gtfs_ingest.py
+"""Benchmark: pico de memória (RSS) e tempo por arquivo GTFS, pandas x streaming.
+
+Uso:
+    python benchmarks/bench_gtfs_ingest.py [--gtfs-dir data/gtfs] [--files stops.txt ...] [--chunk-mb 100]
+
+Cada (arquivo, modo) roda num subprocesso próprio para que ru_maxrss meça só aquele
+caminho. O "upload" é simulado lendo o stream em blocos do tamanho do chunk resumable
+de load_table_from_file (100 MB), sem rede.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+LOAD_DATE = "2024-01-01"
+
+
+def _drain(f, chunk_bytes):
+    total = 0
+    while True:
+        chunk = f.read(chunk_bytes)
+        if not chunk:
+            return total
+        total += len(chunk)
+
+
+def _worker(path, mode, chunk_bytes):
+    from core.gtfs_csv import open_load_date_stream, write_temp_csv_pandas
+
+    t0 = time.perf_counter()
+    if mode == 'pandas':
+        temp_csv = write_temp_csv_pandas(path, LOAD_DATE)
+        try:
+            with open(temp_csv, 'rb') as f:
+                nbytes = _drain(f, chunk_bytes)
+        finally:
+            os.remove(temp_csv)
+    else:
+        with open_load_date_stream(path, LOAD_DATE) as f:
+            nbytes = _drain(f, chunk_bytes)
+    wall = time.perf_counter() - t0
+    # ru_maxrss: KB no Linux
+    print(json.dumps({"wall_s": wall, "bytes": nbytes,
+                      "maxrss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--gtfs-dir", default=os.path.join(project_root, "data", "gtfs"))
+    parser.add_argument("--files", nargs="*", help="arquivos .txt (padrão: todos do diretório)")
+    parser.add_argument("--chunk-mb", type=int, default=100, help="tamanho do bloco lido pelo upload simulado")
+    parser.add_argument("--worker", nargs=2, metavar=("PATH", "MODE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    chunk_bytes = args.chunk_mb * 1024 * 1024
+    if args.worker:
+        _worker(args.worker[0], args.worker[1], chunk_bytes)
+        return
+
+    files = args.files or sorted(f for f in os.listdir(args.gtfs_dir) if f.endswith('.txt'))
+    print(f"{'arquivo':<22}{'MB':>8} | {'pandas RSS':>11}{'tempo':>9} | {'stream RSS':>11}{'tempo':>9}")
+    for name in files:
+        path = name if os.path.isabs(name) else os.path.join(args.gtfs_dir, name)
+        size_mb = os.path.getsize(path) / 1e6
+        res = {}
+        for mode in ('pandas', 'stream'):
+            out = subprocess.run(
+                [sys.executable, __file__, "--chunk-mb", str(args.chunk_mb), "--worker", path, mode],
+                check=True, capture_output=True, text=True
+            ).stdout
+            res[mode] = json.loads(out.strip().splitlines()[-1])
+        print(f"{os.path.basename(path):<22}{size_mb:>8.1f} | "
+              f"{res['pandas']['maxrss_mb']:>8.0f} MB{res['pandas']['wall_s']:>8.2f}s | "
+              f"{res['stream']['maxrss_mb']:>8.0f} MB{res['stream']['wall_s']:>8.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+# benchmarks/bench_map_match.py
+"""Benchmark: map-matching da frota sobre os shapes, índice de segmentos x loop por veículo.
+
+Uso:
+    python benchmarks/bench_map_match.py [--vehicles 15000] [--cell-m 200] [--simplify-m 2] [--noise-m 15]
+
+Compila um store GTFS temporário com um shapes.txt sintético (benchmarks/fixtures.py),
+põe cada veículo sobre um shape da sua linha/sentido com ruído de GPS e compara
+ShapeMatcher com a projeção ponto a ponto contra todos os segmentos dos shapes da
+rota (traçado original, sem simplificação).
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from benchmarks.fixtures import GTFS_PATH, make_posicao, make_shapes
+from core.flatten_posicao import flatten_posicao
+from core.geo import LocalProjection, haversine_m
+from core.gtfs_store import build_store, open_store
+from core.map_match import ShapeMatcher, sl_to_direction
+
+
+def route_shapes(store):
+    """(route_idx, direction) → lista de shape_id das viagens"""
+    a, s = store.a, store.strings
+    out = {}
+    for t in range(len(a['trip_id'])):
+        out.setdefault((int(a['trip_route'][t]), int(a['trip_direction'][t])), set()).add(s[a['trip_shape_id'][t]])
+    return {k: sorted(v) for k, v in out.items()}
+
+
+def place_on_shapes(store, columns, shapes_of, noise_m, seed=0):
+    """Move cada veículo para um ponto de um shape da sua rota/sentido + ruído gaussiano"""
+    rng = random.Random(seed)
+    route_idx = store.route_indices(columns["line_c"])
+    direction = sl_to_direction(columns["line_sl"])
+    lat, lon = columns["vehicle_py"].copy(), columns["vehicle_px"].copy()
+    noise = noise_m / 111195.0
+    for i in range(len(lat)):
+        shapes = shapes_of.get((int(route_idx[i]), int(direction[i])))
+        if not shapes:
+            continue
+        s_lat, s_lon, _ = store.shape_points(rng.choice(shapes))
+        j = rng.randrange(len(s_lat))
+        lat[i] = s_lat[j] + rng.gauss(0, noise)
+        lon[i] = s_lon[j] + rng.gauss(0, noise)
+    columns["vehicle_py"], columns["vehicle_px"] = lat, lon
+    return route_idx, direction
+
+
+def per_vehicle(store, shapes_of, lat, lon, route_idx, direction, max_snap_m):
+    """Referência: um loop Python por veículo, projetando em cada segmento dos shapes da rota"""
+    proj = LocalProjection(float(np.mean(store.a['shape_pt_lat'])), float(np.mean(store.a['shape_pt_lon'])))
+    cache = {}
+    along = np.full(len(lat), np.nan)
+    snap = np.full(len(lat), np.nan)
+    for i in range(len(lat)):
+        best = (np.inf, np.nan)
+        for shape_id in shapes_of.get((int(route_idx[i]), int(direction[i])), ()):
+            if shape_id not in cache:
+                s_lat, s_lon, _ = store.shape_points(shape_id)
+                x, y = proj.to_xy(s_lat, s_lon)
+                cum = np.concatenate([[0.0], np.cumsum(haversine_m(s_lat[:-1], s_lon[:-1], s_lat[1:], s_lon[1:]))])
+                cache[shape_id] = (x, y, cum)
+            x, y, cum = cache[shape_id]
+            px, py = proj.to_xy(lat[i], lon[i])
+            dx, dy = np.diff(x), np.diff(y)
+            seg2 = np.maximum(dx * dx + dy * dy, 1e-12)
+            t = np.clip(((px - x[:-1]) * dx + (py - y[:-1]) * dy) / seg2, 0, 1)
+            d = np.hypot(px - (x[:-1] + t * dx), py - (y[:-1] + t * dy))
+            k = int(np.argmin(d))
+            if d[k] < best[0]:
+                best = (d[k], cum[k] + t[k] * (cum[k + 1] - cum[k]))
+        if best[0] <= max_snap_m:
+            snap[i], along[i] = best
+    return along, snap
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vehicles", type=int, default=15000)
+    parser.add_argument("--points-per-shape", type=int, default=500)
+    parser.add_argument("--cell-m", type=float, default=200.0)
+    parser.add_argument("--max-snap-m", type=float, default=150.0)
+    parser.add_argument("--simplify-m", type=float, default=2.0)
+    parser.add_argument("--noise-m", type=float, default=15.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        gtfs_dir = os.path.join(tmp, "gtfs")
+        shutil.copytree(GTFS_PATH, gtfs_dir)
+        make_shapes(os.path.join(gtfs_dir, "shapes.txt"), n_points=args.points_per_shape)
+        build_store(gtfs_dir, os.path.join(tmp, "store"))
+        store = open_store(os.path.join(tmp, "store"))
+
+        columns = flatten_posicao(make_posicao(args.vehicles))
+        shapes_of = route_shapes(store)
+        route_idx, direction = place_on_shapes(store, columns, shapes_of, args.noise_m)
+        lat, lon = columns["vehicle_py"], columns["vehicle_px"]
+        print(f"{len(lat)} veículos x {len(store.a['shape_pt_shape'])} pontos de shape | "
+              f"célula {args.cell_m:.0f} m | snap até {args.max_snap_m:.0f} m | simplificação {args.simplify_m} m")
+
+        t0 = time.perf_counter()
+        matcher = ShapeMatcher(store, cell_m=args.cell_m, max_snap_m=args.max_snap_m, simplify_m=args.simplify_m)
+        print(f"build do índice       {(time.perf_counter() - t0) * 1000:8.1f} ms "
+              f"({len(matcher)} segmentos, {len(matcher._seg)} entradas na grade)")
+
+        times = []
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            shape, along, snap = matcher.match(lat, lon, route_idx, direction)
+            times.append(time.perf_counter() - t0)
+        print(f"índice (mediana)      {sorted(times)[len(times) // 2] * 1000:8.1f} ms")
+
+        t0 = time.perf_counter()
+        ref_along, ref_snap = per_vehicle(store, shapes_of, lat, lon, route_idx, direction, args.max_snap_m)
+        print(f"loop por veículo      {(time.perf_counter() - t0) * 1000:8.1f} ms")
+
+        both = np.isfinite(along) & np.isfinite(ref_along)
+        err = np.abs(along[both] - ref_along[both])
+        print(f"casados: {np.isfinite(along).mean() * 100:.1f}% (referência {np.isfinite(ref_along).mean() * 100:.1f}%) | "
+              f"|Δ distância ao longo| p50 {np.percentile(err, 50):.1f} m p99 {np.percentile(err, 99):.1f} m | "
+              f"snap mediano {np.nanmedian(snap):.1f} m")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
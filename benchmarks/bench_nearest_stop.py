@@ -0,0 +1,85 @@
+# benchmarks/bench_nearest_stop.py
+"""Benchmark: parada mais próxima por veículo, índice em grade x força bruta (haversine).
+
+Uso:
+    python benchmarks/bench_nearest_stop.py [--fixture posicao.json.gz] [--vehicles 15000] [--cell-m 250]
+
+Usa o store GTFS local (data/gtfs_store/, compilado na hora num diretório temporário
+se ainda não existir) e confere que os dois métodos devolvem as mesmas paradas.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from benchmarks.fixtures import GTFS_PATH, load_fixture, make_posicao
+from core.flatten_posicao import flatten_posicao
+from core.geo import haversine_m
+from core.gtfs_store import build_store, open_store
+from core.spatial_index import NearestStopIndex
+
+STORE_PATH = os.path.join(project_root, "data", "gtfs_store")
+
+
+def brute_force(stop_lat, stop_lon, stop_ids, lat, lon, max_dist_m, chunk=256):
+    """Haversine de cada veículo contra todas as paradas (equivale ao JOIN + ROW_NUMBER da VIEW 2)"""
+    ids = np.full(len(lat), -1, dtype=np.int64)
+    dist = np.full(len(lat), np.nan)
+    for i in range(0, len(lat), chunk):
+        d = haversine_m(lat[i:i + chunk, None], lon[i:i + chunk, None], stop_lat[None, :], stop_lon[None, :])
+        j = np.argmin(d, axis=1)
+        best = d[np.arange(len(j)), j]
+        ok = best <= max_dist_m
+        ids[i:i + chunk][ok] = stop_ids[j[ok]]
+        dist[i:i + chunk][ok] = best[ok]
+    return ids, dist
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixture", help="/Posicao gravado (.json ou .json.gz)")
+    parser.add_argument("--vehicles", type=int, default=15000)
+    parser.add_argument("--cell-m", type=float, default=250.0)
+    parser.add_argument("--max-dist-m", type=float, default=1000.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    store = open_store(STORE_PATH)
+    if store is None:
+        tmp = tempfile.mkdtemp()
+        build_store(GTFS_PATH, os.path.join(tmp, "store"))
+        store = open_store(os.path.join(tmp, "store"))
+
+    data = load_fixture(args.fixture) if args.fixture else make_posicao(args.vehicles)
+    columns = flatten_posicao(data)
+    lat, lon = columns["vehicle_py"], columns["vehicle_px"]
+    print(f"{len(lat)} veículos x {len(store.a['stop_id'])} paradas | célula {args.cell_m:.0f} m | raio {args.max_dist_m:.0f} m")
+
+    t0 = time.perf_counter()
+    index = NearestStopIndex(store, cell_m=args.cell_m)
+    print(f"build do índice       {(time.perf_counter() - t0) * 1000:8.1f} ms")
+
+    times = []
+    for _ in range(args.repeat):
+        t0 = time.perf_counter()
+        ids, dist = index.nearest(lat, lon, max_dist_m=args.max_dist_m)
+        times.append(time.perf_counter() - t0)
+    print(f"grade (mediana)       {sorted(times)[len(times) // 2] * 1000:8.1f} ms")
+
+    t0 = time.perf_counter()
+    stop_lat, stop_lon = np.asarray(store.a['stop_lat']), np.asarray(store.a['stop_lon'])
+    ref_ids, ref_dist = brute_force(stop_lat, stop_lon, np.asarray(store.a['stop_id']), lat, lon, args.max_dist_m)
+    print(f"força bruta           {(time.perf_counter() - t0) * 1000:8.1f} ms")
+
+    same = (ids == ref_ids) | np.isclose(dist, ref_dist, atol=0.01)  # empate de distância
+    print(f"iguais: {same.mean() * 100:.2f}% | com parada a <{args.max_dist_m:.0f} m: {(ids >= 0).mean() * 100:.1f}%")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,404 @@
+# benchmarks/bench_pipelines.py
+"""Benchmark ponta a ponta: etl_cycle (posições) e enrich_cycle (linhas, paradas) sem rede.
+
+Uso:
+    python benchmarks/bench_pipelines.py [--fleet 15000] [--scales 1,2,5,10] [--cycles 5]
+        [--latency-ms 0] [--posicao-latency-ms 0] [--load-latency-ms 0] [--format parquet] [--no-gzip]
+        [--pipelines posicoes,linhas,paradas] [--json resultados.json] [-v]
+
+Para cada escala (frota = fleet x escala) o processo pai sobe benchmarks/fake_sptrans.py
+(API Olho Vivo local, veículos sobre os shapes sintéticos de um store GTFS temporário)
+e roda as pipelines num subprocesso, com config e clientes injetados por
+core.clients.set_clients: base_url no servidor local, bigquery.Client trocado por
+benchmarks/fake_bigquery.py, spool/caches/arquivo num diretório temporário e
+batch_max_age_s = 0 (um LOAD JOB por ciclo). O subprocesso isola o pico de memória
+(ru_maxrss) de cada escala.
+
+Cada ciclo roda numa thread do core/scheduler.py, como em run_all.py (SQLite e
+demais estados criados no import são usados fora da thread principal); ciclos que
+terminam com erro são contados e sinalizados no relatório.
+
+Cada etapa é cronometrada envolvendo a função da pipeline; o primeiro ciclo de
+posições (monta os índices de paradas/shapes) sai como "frio" e fica fora dos
+percentis. Linhas roda duas vezes (truncate completo, depois incremental sem
+mudanças) e paradas duas (cache vazio, depois cache quente).
+"""
+import argparse
+import copy
+import json
+import logging
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from benchmarks.fixtures import GTFS_PATH, make_posicao, make_shapes
+
+PIPELINES = ("posicoes", "linhas", "paradas")
+
+
+# === PROCESSO PAI: store GTFS, servidor fake e um subprocesso por escala ===
+def snap_to_shapes(store, payload, noise_m=15.0, seed=0):
+    """Põe cada veículo do payload num ponto de um shape da sua linha/sentido (+ ruído)"""
+    from benchmarks.bench_map_match import route_shapes
+    from core.map_match import sl_to_direction
+
+    rng = random.Random(seed)
+    shapes_of = route_shapes(store)
+    points = {}
+    noise = noise_m / 111195.0
+    for line in payload["l"]:
+        route_idx = int(store.route_indices(np.array([line["c"]], dtype=object))[0])
+        direction = int(sl_to_direction(np.array([line["sl"]]))[0])
+        shapes = shapes_of.get((route_idx, direction))
+        if not shapes:
+            continue
+        for v in line["vs"]:
+            shape_id = rng.choice(shapes)
+            if shape_id not in points:
+                points[shape_id] = store.shape_points(shape_id)[:2]
+            lat, lon = points[shape_id]
+            j = rng.randrange(len(lat))
+            v["py"] = float(lat[j]) + rng.gauss(0, noise)
+            v["px"] = float(lon[j]) + rng.gauss(0, noise)
+    return payload
+
+
+def build_bench_store(tmp, points_per_shape):
+    from core.gtfs_store import build_store, open_store
+
+    gtfs_dir = os.path.join(tmp, "gtfs")
+    shutil.copytree(GTFS_PATH, gtfs_dir)
+    make_shapes(os.path.join(gtfs_dir, "shapes.txt"), n_points=points_per_shape)
+    store_dir = os.path.join(tmp, "store")
+    build_store(gtfs_dir, store_dir)
+    return store_dir, open_store(store_dir)
+
+
+def run_scale(args, fleet, store_dir, store, tmp):
+    from benchmarks.fake_sptrans import FakeSPTransServer
+
+    t0 = time.perf_counter()
+    payload = snap_to_shapes(store, make_posicao(fleet, seed=args.seed), seed=args.seed)
+    server = FakeSPTransServer(
+        payload=payload, n_snapshots=args.cycles + 1, latency_ms=args.latency_ms,
+        posicao_latency_ms=args.posicao_latency_ms, stops_per_line=args.stops_per_line, seed=args.seed,
+        gzip=not args.no_gzip
+    ).start()
+    setup_s = time.perf_counter() - t0
+    try:
+        work_dir = tempfile.mkdtemp(dir=tmp)
+        cmd = [sys.executable, os.path.abspath(__file__),
+               "--cycles", str(args.cycles), "--load-latency-ms", str(args.load_latency_ms),
+               "--rate-per-s", str(args.rate_per_s), "--pipelines", args.pipelines,
+               "--worker", server.url, store_dir, work_dir]
+        if args.format:
+            cmd += ["--format", args.format]
+        if args.verbose:
+            cmd.append("-v")
+        out = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=None if args.verbose else subprocess.PIPE,
+                             text=True).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+    finally:
+        server.stop()
+    result["fleet"] = fleet
+    result["api_calls"] = server.calls
+    result["snapshot_mb"] = len(server.snapshots[0]) / 1e6
+    result["snapshot_wire_mb"] = len((server.snapshots_gz or server.snapshots)[0]) / 1e6
+    result["setup_s"] = setup_s
+    return result
+
+
+# === SUBPROCESSO: pipelines reais sobre os stand-ins ===
+class StageTimer:
+    """Envolve funções das pipelines e guarda a duração (s) de cada chamada por etapa"""
+
+    def __init__(self):
+        self.samples = {}
+        self.rows = {}
+
+    def add(self, stage, seconds):
+        self.samples.setdefault(stage, []).append(seconds)
+
+    def wrap(self, owner, name, stage, on_result=None):
+        fn = getattr(owner, name)
+
+        def timed(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - t0)
+            if on_result is not None:
+                on_result(result)
+            return result
+
+        setattr(owner, name, timed)
+
+    def wrap_load(self, module, pipeline):
+        """load_json_to_bigquery: total e também encode/upload+job das stats devolvidas"""
+        def split(stats):
+            if stats:
+                self.add(f"{pipeline}.load.encode", stats['encode_s'])
+                self.add(f"{pipeline}.load.job", stats['load_s'])
+        self.wrap(module, "load_json_to_bigquery", f"{pipeline}.load", split)
+
+    def count_rows(self, stage):
+        from core.load_job import num_rows
+
+        def count(result):
+            self.rows[stage] = self.rows.get(stage, 0) + (num_rows(result) if result is not None else 0)
+        return count
+
+    def reset(self):
+        self.samples.clear()
+        self.rows.clear()
+
+    def percentiles(self):
+        out = {}
+        for stage, values in sorted(self.samples.items()):
+            ms = np.asarray(values) * 1000
+            out[stage] = {"n": len(ms), "p50": float(np.percentile(ms, 50)), "p90": float(np.percentile(ms, 90)),
+                          "p99": float(np.percentile(ms, 99)), "max": float(ms.max())}
+        return out
+
+
+def maxrss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB no Linux
+
+
+def bench_config(config, args, url, work_dir):
+    """Cópia da config do repositório apontando API, spool e caches para o ambiente local"""
+    config = copy.deepcopy(config)
+    config['sptrans'] = dict(config.get('sptrans', {}), base_url=url, token="bench")
+    config['bigquery'] = dict(config.get('bigquery', {}), project_id="bench", dataset_id="sptrans")
+    config.pop('proxy', None)
+    if args.format:
+        config.setdefault('load', {})['source_format'] = args.format
+    config.setdefault('fetch', {})['rate_per_s'] = args.rate_per_s
+    posicoes = config.setdefault('posicoes', {})
+    posicoes['batch_max_age_s'] = 0
+    posicoes['spool_dir'] = os.path.join(work_dir, "spool", "posicoes")
+    posicoes.setdefault('headway', {})['spool_dir'] = os.path.join(work_dir, "spool", "headway")
+    posicoes.setdefault('archive', {})['dir'] = os.path.join(work_dir, "archive")
+    config.setdefault('line_index', {})['path'] = os.path.join(work_dir, "cache", "line_index.sqlite")
+    config.setdefault('linhas', {})['fingerprint_path'] = os.path.join(work_dir, "cache", "linhas_fingerprints.sqlite")
+    config.setdefault('paradas', {})['cache_path'] = os.path.join(work_dir, "cache", "paradas.sqlite")
+    config['metrics'] = dict(config.get('metrics', {}), jsonl_path=os.path.join(work_dir, "metrics.jsonl"), port=None)
+    return config
+
+
+def scheduled_run(name, fn):
+    """Executa fn uma vez numa thread do Scheduler (tick imediato) e devolve a duração (s)"""
+    from core.scheduler import Scheduler
+
+    done = threading.Event()
+    elapsed = []
+
+    def run():
+        t0 = time.perf_counter()
+        try:
+            fn()
+        finally:
+            elapsed.append(time.perf_counter() - t0)
+            done.set()
+
+    scheduler = Scheduler()
+    scheduler.add(name, run, 3600)
+    loop = threading.Thread(target=scheduler.run_forever, name="bench-scheduler", daemon=True)
+    loop.start()
+    done.wait()
+    scheduler.stop()
+    loop.join()
+    return elapsed[0]
+
+
+def cycle_errors(pipeline):
+    from core.clients import get_metrics
+    return get_metrics().value("sptrans_cycles_total", pipeline=pipeline, outcome="error")
+
+
+def _worker(args):
+    url, store_dir, work_dir = args.worker
+    # Antes de importar as pipelines: o basicConfig delas vira no-op e os FileHandler
+    # (delay=True) nunca abrem logs/ no projeto; tudo vai para o stderr
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s | %(levelname)s | %(message)s', handlers=[logging.StreamHandler(sys.stderr)])
+
+    from benchmarks.fake_bigquery import FakeBigQuery, FakeBigQueryClient
+    from core import clients
+    from core.gtfs_store import open_store
+
+    config = bench_config(clients.get_config(), args, url, work_dir)
+    sink = FakeBigQuery(load_latency_ms=args.load_latency_ms)
+    clients.set_clients(config=config, bigquery_client=FakeBigQueryClient(sink), gtfs_store=open_store(store_dir))
+    dataset = f"{config['bigquery']['project_id']}.{config['bigquery']['dataset_id']}"
+
+    def loaded(table):
+        return sink.summary().get(f"{dataset}.{table}", {}).get("rows", 0)
+
+    timer = StageTimer()
+    pipelines = args.pipelines.split(',')
+    result = {"pipelines": {}, "stages": {}}
+
+    if "posicoes" in pipelines:
+        from pipelines.posicoes import main_posicoes as m
+        timer.wrap(m.sptrans_client, "get_posicao_bytes", "posicoes.api.posicao")
+        timer.wrap(m, "archive_snapshot", "posicoes.archive")
+        timer.wrap(m, "flatten_posicao", "posicoes.flatten", timer.count_rows("posicoes"))
+        timer.wrap(m, "update_vehicle_state", "posicoes.vehicle_state")
+        timer.wrap(m, "add_nearest_stop", "posicoes.nearest_stop")
+        timer.wrap(m, "add_map_match", "posicoes.map_match")
+        timer.wrap(m, "add_headway", "posicoes.headway")
+        timer.wrap_load(m, "posicoes")
+
+        cold_s = scheduled_run("posicoes", m.etl_cycle)
+        timer.reset()
+        table_rows = loaded(config['bigquery']['table_id'])
+        cycles = []
+        for _ in range(args.cycles):
+            cycles.append(scheduled_run("posicoes", m.etl_cycle))
+            timer.add("posicoes.cycle", cycles[-1])
+        rows = timer.rows.get("posicoes", 0)
+        result["pipelines"]["posicoes"] = {
+            "cycles": len(cycles), "cold_s": cold_s, "wall_s": sum(cycles), "rows": rows,
+            "rows_s": rows / sum(cycles) if cycles else 0.0,
+            "loaded_rows": loaded(config['bigquery']['table_id']) - table_rows, "maxrss_mb": maxrss_mb(),
+            "cycle_errors": cycle_errors("posicoes"),
+        }
+        result["stages"].update(timer.percentiles())
+        timer.reset()
+
+    if "linhas" in pipelines:
+        from pipelines.linhas import enrich_linhas as m
+        if "posicoes" not in pipelines:
+            m.line_index.add_linhas([line[0] for line in _gtfs_lines()])
+        timer.wrap(m, "buscar_dados_linha", "linhas.api.linha")
+        timer.wrap(m, "carregar_linhas", "linhas.carregar")
+        timer.wrap_load(m, "linhas")
+        runs = []
+        for _ in range(2):  # truncate completo, depois incremental (sem mudanças)
+            runs.append(scheduled_run("linhas", m.enrich_cycle))
+        rows = loaded("sptrans_linhas")
+        result["pipelines"]["linhas"] = {
+            "cold_s": runs[0], "warm_s": runs[1], "rows": rows, "rows_s": rows / runs[0],
+            "loaded_rows": rows + loaded("sptrans_linhas_changes"), "maxrss_mb": maxrss_mb(),
+            "cycle_errors": cycle_errors("linhas"),
+        }
+        result["stages"].update(timer.percentiles())
+        timer.reset()
+
+    if "paradas" in pipelines:
+        from pipelines.paradas import enrich_paradas as m
+        if not m.line_index.linhas_com_cl():
+            from benchmarks.fake_sptrans import line_cl
+            m.line_index.add_linhas_cl((c, line_cl(c, sl)) for c, _, _ in _gtfs_lines() for sl in (1, 2))
+        timer.wrap(m, "buscar_paradas_por_linha", "paradas.api.paradas")
+        timer.wrap_load(m, "paradas")
+        runs, rows = [], []
+        for _ in range(2):  # cache vazio, depois cache quente
+            before = loaded("sptrans_paradas")
+            runs.append(scheduled_run("paradas", m.enrich_cycle))
+            rows.append(loaded("sptrans_paradas") - before)
+        result["pipelines"]["paradas"] = {
+            "cold_s": runs[0], "warm_s": runs[1], "rows": rows[0], "rows_s": rows[0] / runs[0],
+            "loaded_rows": sum(rows), "maxrss_mb": maxrss_mb(),
+            "cycle_errors": cycle_errors("paradas"),
+        }
+        result["stages"].update(timer.percentiles())
+
+    result["maxrss_mb"] = maxrss_mb()
+    result["sink"] = sink.summary()
+    print(json.dumps(result))
+
+
+def _gtfs_lines():
+    from benchmarks.fixtures import gtfs_lines
+    return gtfs_lines()
+
+
+# === RELATÓRIO ===
+def report(result, scale):
+    p = result["pipelines"]
+    stages = result["stages"]
+    print(f"\nfrota {result['fleet']} ({scale:g}x) | /Posicao {result['snapshot_mb']:.1f} MB "
+          f"({result['snapshot_wire_mb']:.1f} MB na rede) | "
+          f"RSS pico {result['maxrss_mb']:.0f} MB | chamadas à API {result['api_calls']}")
+    if "posicoes" in p:
+        cycle = stages.get("posicoes.cycle", {})
+        print(f"  posições: {p['posicoes']['rows_s']:,.0f} linhas/s | ciclo p50 {cycle.get('p50', 0):.0f} ms "
+              f"p99 {cycle.get('p99', 0):.0f} ms | frio {p['posicoes']['cold_s']:.1f}s | "
+              f"{p['posicoes']['loaded_rows']} linhas carregadas | RSS {p['posicoes']['maxrss_mb']:.0f} MB")
+    if "linhas" in p:
+        print(f"  linhas:   {p['linhas']['rows_s']:,.0f} linhas/s | truncate {p['linhas']['cold_s']:.2f}s | "
+              f"incremental {p['linhas']['warm_s']:.2f}s | {p['linhas']['rows']} registros")
+    if "paradas" in p:
+        print(f"  paradas:  {p['paradas']['rows_s']:,.0f} linhas/s | cache vazio {p['paradas']['cold_s']:.2f}s | "
+              f"cache quente {p['paradas']['warm_s']:.2f}s | {p['paradas']['rows']} registros")
+    failed = {name: r["cycle_errors"] for name, r in p.items() if r.get("cycle_errors")}
+    if failed:
+        print(f"  ATENÇÃO: ciclos com erro por pipeline {failed} (ver -v)")
+    errors = sum(t["errors"] for t in result["sink"].values())
+    if errors:
+        print(f"  ATENÇÃO: {errors} LOAD JOBs com erro no sink fake")
+    print(f"  {'etapa':<28}{'n':>5}{'p50':>10}{'p90':>10}{'p99':>10}{'máx':>10}  (ms)")
+    for stage, s in stages.items():
+        print(f"  {stage:<28}{s['n']:>5}{s['p50']:>10.1f}{s['p90']:>10.1f}{s['p99']:>10.1f}{s['max']:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fleet", type=int, default=15000, help="veículos na escala 1x (frota atual de SP)")
+    parser.add_argument("--scales", default="1,2,5,10", help="multiplicadores da frota, separados por vírgula")
+    parser.add_argument("--cycles", type=int, default=5, help="ciclos de posições medidos (além do frio)")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="latência de cada resposta da API fake")
+    parser.add_argument("--posicao-latency-ms", type=float, default=None, help="latência só de /Posicao")
+    parser.add_argument("--load-latency-ms", type=float, default=0.0, help="espera simulada em job.result()")
+    parser.add_argument("--no-gzip", action="store_true", help="API fake serve /Posicao sem compressão")
+    parser.add_argument("--format", choices=("ndjson", "parquet"), help="load.source_format (padrão: config.json)")
+    parser.add_argument("--rate-per-s", type=float, default=1000.0, help="fetch.rate_per_s contra a API fake")
+    parser.add_argument("--stops-per-line", type=int, default=40)
+    parser.add_argument("--points-per-shape", type=int, default=500)
+    parser.add_argument("--pipelines", default=",".join(PIPELINES))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="grava os resultados brutos neste arquivo")
+    parser.add_argument("-v", "--verbose", action="store_true", help="logs das pipelines no stderr")
+    parser.add_argument("--worker", nargs=3, metavar=("URL", "STORE", "WORK_DIR"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        _worker(args)
+        return
+
+    unknown = set(args.pipelines.split(',')) - set(PIPELINES)
+    if unknown:
+        parser.error(f"pipelines desconhecidas: {', '.join(sorted(unknown))}")
+    scales = [float(s) for s in args.scales.split(',')]
+    tmp = tempfile.mkdtemp()
+    results = []
+    try:
+        store_dir, store = build_bench_store(tmp, args.points_per_shape)
+        for scale in scales:
+            result = run_scale(args, int(args.fleet * scale), store_dir, store, tmp)
+            result["scale"] = scale
+            report(result, scale)
+            results.append(result)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+# benchmarks/fake_bigquery.py
+"""Stand-in local de bigquery.Client para benchmarks: LOAD JOBs e queries sem rede.
+
+load_table_from_file lê o arquivo inteiro em blocos (como o upload resumable),
+confere o modo binário e conta linhas (NDJSON: quebras de linha; Parquet: metadados
+do rodapé). query() devolve um job sem linhas.
+"""
+import io
+import threading
+import time
+from datetime import datetime, timezone
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+UPLOAD_CHUNK_BYTES = 100 * 1024 * 1024  # chunk do upload resumable do google-cloud-bigquery
+
+
+class FakeJob:
+    def __init__(self, job_id, output_rows=0, latency_s=0.0, error=None):
+        self.job_id = job_id
+        self.output_rows = output_rows
+        self.total_bytes_processed = 0
+        self.errors = [{"message": error}] if error else None
+        self._latency_s = latency_s
+        self._error = error
+        self._rows = []
+        self.started = self.ended = None
+
+    def result(self, timeout=None):
+        self.started = datetime.now(timezone.utc)
+        if self._latency_s:
+            time.sleep(self._latency_s)
+        self.ended = datetime.now(timezone.utc)
+        if self._error:
+            raise RuntimeError(self._error)
+        return self._rows if self._rows is not None else self
+
+    def __iter__(self):
+        return iter(self._rows)
+
+
+class FakeBigQuery:
+    """Imita os métodos de bigquery.Client que as pipelines usam.
+
+    load_latency_ms simula a espera do job.result(); fail_every=k faz 1 a cada k
+    loads falhar (testa spool/retry). loads guarda (tabela, linhas, bytes, formato).
+    """
+
+    def __init__(self, load_latency_ms=0.0, fail_every=0):
+        self.load_latency_s = load_latency_ms / 1000.0
+        self.fail_every = fail_every
+        self.loads = []
+        self.queries = []
+        self._lock = threading.Lock()
+
+    def load_table_from_file(self, file_obj, destination, job_config=None, size=None, rewind=False, **kwargs):
+        mode = getattr(file_obj, "mode", "rb")
+        if "b" not in mode:
+            raise ValueError(f"Cannot upload files opened in text mode: use open(filename, mode='rb'), got {mode!r}")
+        if rewind:
+            file_obj.seek(0)
+        source_format = str(getattr(job_config, "source_format", None) or "CSV").upper()
+        nbytes, newlines = 0, 0
+        parquet = io.BytesIO() if "PARQUET" in source_format else None
+        while True:
+            chunk = file_obj.read(UPLOAD_CHUNK_BYTES if size is None else min(UPLOAD_CHUNK_BYTES, size - nbytes))
+            if not chunk:
+                break
+            nbytes += len(chunk)
+            if parquet is not None:
+                parquet.write(chunk)
+            else:
+                newlines += chunk.count(b"\n")
+            if size is not None and nbytes >= size:
+                break
+        if parquet is not None:
+            rows = pq.ParquetFile(parquet).metadata.num_rows if pq is not None else 0
+        elif "CSV" in source_format:
+            rows = max(newlines - int(getattr(job_config, "skip_leading_rows", 0) or 0), 0)
+        else:
+            rows = newlines
+        with self._lock:
+            n = len(self.loads) + 1
+            error = f"fake load failure #{n}" if self.fail_every and n % self.fail_every == 0 else None
+            self.loads.append({"table": str(destination), "rows": rows, "bytes": nbytes,
+                               "format": source_format, "error": error})
+        return FakeJob(f"load-{n}", output_rows=0 if error else rows, latency_s=self.load_latency_s, error=error)
+
+    def query(self, sql, job_config=None, **kwargs):
+        with self._lock:
+            self.queries.append(sql)
+        job = FakeJob(f"query-{len(self.queries)}")
+        return job
+
+    def get_table(self, table_ref):
+        return table_ref
+
+    def create_table(self, table, exists_ok=False):
+        return table
+
+    def update_table(self, table, fields):
+        return table
+
+    def summary(self):
+        """Linhas, bytes e nº de loads por tabela (sem o decorador de partição)"""
+        out = {}
+        for load in self.loads:
+            entry = out.setdefault(load["table"].split("$")[0], {"loads": 0, "rows": 0, "bytes": 0, "errors": 0})
+            entry["loads"] += 1
+            entry["rows"] += load["rows"]
+            entry["bytes"] += load["bytes"]
+            entry["errors"] += load["error"] is not None
+        return out
+
+
+class FakeBigQueryClient:
+    """Mesmo formato de core.bigquery_client.BigQueryClient (atributo .client)"""
+
+    def __init__(self, client):
+        self.client = client
@@ -0,0 +1,177 @@
+# benchmarks/fake_sptrans.py
+"""Servidor HTTP local que imita a API Olho Vivo para benchmarks (sem rede).
+
+Rotas: POST /Login/Autenticar, GET /Posicao, /Linha/Buscar e
+/Parada/BuscarParadasPorLinha. Sem o cookie do login as rotas de dados devolvem
+401, como a API real. /Posicao alterna entre snapshots pré-codificados (vehicle_ta
+avançando a cada um), então o servidor não pesa no tempo medido; com gzip=True
+(padrão) eles também vão pré-comprimidos a quem pede Accept-Encoding: gzip.
+"""
+import gzip
+import json
+import random
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from benchmarks.fixtures import LAT_RANGE, LON_RANGE, make_posicao
+
+COOKIE = "apiCredentials=bench"
+
+
+def line_cl(line_c, sl):
+    """cl estável por (line_c, sentido), no formato da API (sentido 2 = cl + 32768)"""
+    return zlib.crc32(line_c.encode('utf-8')) % 32768 + (sl - 1) * 32768
+
+
+def posicao_snapshots(payload, n_snapshots, step_s=60, jitter_m=30.0, seed=0):
+    """Variações de um /Posicao: vehicle_ta + step_s a cada snapshot e posição com ruído"""
+    rng = random.Random(seed)
+    jitter = jitter_m / 111195.0
+    out = []
+    for k in range(n_snapshots):
+        snapshot = {"hr": payload["hr"], "l": []}
+        for line in payload["l"]:
+            vs = []
+            for v in line["vs"]:
+                ta = datetime.strptime(v["ta"], "%Y-%m-%dT%H:%M:%SZ") + timedelta(seconds=k * step_s)
+                vs.append(dict(v, ta=ta.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                               py=v["py"] + rng.gauss(0, jitter), px=v["px"] + rng.gauss(0, jitter)))
+            snapshot["l"].append(dict(line, vs=vs))
+        out.append(json.dumps(snapshot, ensure_ascii=False).encode('utf-8'))
+    return out
+
+
+def gzip_bytes(body):
+    """gzip nível 6, o padrão de servidores como IIS/nginx"""
+    return gzip.compress(body, compresslevel=6, mtime=0)
+
+
+class FakeSPTransServer:
+    """ThreadingHTTPServer em 127.0.0.1 (porta livre) numa thread daemon.
+
+    latency_ms atrasa cada resposta (posicao_latency_ms só /Posicao, se dado);
+    stops_per_line paradas sintéticas por cl em /Parada/BuscarParadasPorLinha.
+    gzip=False serve /Posicao sem compressão (mede o custo de rede sem gzip).
+    """
+
+    def __init__(self, fleet=15000, n_snapshots=5, latency_ms=0.0, posicao_latency_ms=None,
+                 stops_per_line=40, seed=0, payload=None, gzip=True):
+        payload = payload or make_posicao(fleet, seed=seed)
+        self.snapshots = posicao_snapshots(payload, n_snapshots, seed=seed)
+        self.snapshots_gz = [gzip_bytes(body) for body in self.snapshots] if gzip else None
+        self.latency_s = latency_ms / 1000.0
+        self.posicao_latency_s = self.latency_s if posicao_latency_ms is None else posicao_latency_ms / 1000.0
+        self.stops_per_line = stops_per_line
+        self.lines = {line["c"]: (line["lt0"], line["lt1"]) for line in payload["l"]}
+        self.calls = {}
+        self._next = 0
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-sptrans", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _count(self, route):
+        with self._lock:
+            self.calls[route] = self.calls.get(route, 0) + 1
+
+    def next_posicao(self, accept_gzip=False):
+        """(corpo, comprimido?) do próximo snapshot"""
+        with self._lock:
+            k = self._next % len(self.snapshots)
+            self._next += 1
+        if accept_gzip and self.snapshots_gz is not None:
+            return self.snapshots_gz[k], True
+        return self.snapshots[k], False
+
+    def linha(self, termo):
+        if termo not in self.lines:
+            return []
+        lt0, lt1 = self.lines[termo]
+        lt, tl = (termo.split('-') + ['10'])[:2]
+        return [{"cl": line_cl(termo, sl), "lc": False, "lt": lt, "sl": sl, "tl": int(tl) if tl.isdigit() else 10,
+                 "tp": lt0, "ts": lt1} for sl in (1, 2)]
+
+    def paradas(self, cl):
+        rng = random.Random(cl)
+        return [{"cp": 100000 + rng.randrange(900000), "np": f"PARADA {i}", "ed": "",
+                 "py": rng.uniform(*LAT_RANGE), "px": rng.uniform(*LON_RANGE)}
+                for i in range(self.stops_per_line)]
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, como a API real
+            disable_nagle_algorithm = True  # cabeçalho e corpo saem em writes separados
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, body, content_type="application/json; charset=utf-8", cookie=None,
+                      encoding=None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                if encoding:
+                    self.send_header("Content-Encoding", encoding)
+                self.send_header("Content-Length", str(len(body)))
+                if cookie:
+                    self.send_header("Set-Cookie", f"{cookie}; Path=/")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _authorized(self):
+                return COOKIE in (self.headers.get("Cookie") or "")
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                if url.path.endswith("/Login/Autenticar"):
+                    server._count("login")
+                    time.sleep(server.latency_s)
+                    self._send(200, b"true", cookie=COOKIE)
+                else:
+                    self._send(404, b"{}")
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                if not self._authorized():
+                    self._send(401, b'{"Message":"Authorization has been denied for this request."}')
+                    return
+                if url.path.endswith("/Posicao"):
+                    server._count("posicao")
+                    time.sleep(server.posicao_latency_s)
+                    body, gz = server.next_posicao("gzip" in (self.headers.get("Accept-Encoding") or ""))
+                    self._send(200, body, encoding="gzip" if gz else None)
+                elif url.path.endswith("/Linha/Buscar"):
+                    server._count("linha")
+                    time.sleep(server.latency_s)
+                    termo = (query.get("termosBusca") or [""])[0]
+                    self._send(200, json.dumps(server.linha(termo)).encode('utf-8'))
+                elif url.path.endswith("/Parada/BuscarParadasPorLinha"):
+                    server._count("paradas")
+                    time.sleep(server.latency_s)
+                    cl = int((query.get("codigoLinha") or ["0"])[0])
+                    self._send(200, json.dumps(server.paradas(cl)).encode('utf-8'))
+                else:
+                    self._send(404, b"{}")
+
+        return Handler
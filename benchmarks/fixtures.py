@@ -0,0 +1,90 @@
+# benchmarks/fixtures.py
+import csv
+import gzip
+import json
+import math
+import os
+import random
+from datetime import datetime, timedelta, timezone
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GTFS_PATH = os.path.join(project_root, "data", "gtfs")
+
+# Caixa aproximada da Grande São Paulo
+LAT_RANGE = (-23.80, -23.40)
+LON_RANGE = (-46.85, -46.40)
+
+
+def load_fixture(path):
+    """Lê um /Posicao gravado (.json ou .json.gz)"""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_fixture(data, path):
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'wt', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+
+
+def gtfs_lines(gtfs_path=GTFS_PATH):
+    """(route_short_name, lt0, lt1) a partir de routes.txt"""
+    lines = []
+    with open(os.path.join(gtfs_path, "routes.txt"), encoding='utf-8-sig', newline='') as f:
+        for row in csv.DictReader(f):
+            parts = row['route_long_name'].split(' - ', 1)
+            lines.append((row['route_short_name'], parts[0], parts[-1]))
+    return lines
+
+
+def make_posicao(n_vehicles=15000, seed=0, now=None, gtfs_path=GTFS_PATH):
+    """Gera um payload sintético no formato de /Posicao com n_vehicles veículos"""
+    rng = random.Random(seed)
+    now = now or datetime.now(timezone.utc)
+    lines = gtfs_lines(gtfs_path)
+    by_line = {}
+    for i in range(n_vehicles):
+        by_line.setdefault((rng.randrange(len(lines)), rng.choice((1, 2))), []).append(i)
+
+    payload = {"hr": now.astimezone(timezone(timedelta(hours=-3))).strftime("%H:%M"), "l": []}
+    for (idx, sl), vehicles in by_line.items():
+        c, lt0, lt1 = lines[idx]
+        payload["l"].append({
+            "c": c,
+            "cl": 1000 + idx * 2 + (sl - 1) * 32768,
+            "sl": sl,
+            "lt0": lt0,
+            "lt1": lt1,
+            "qv": len(vehicles),
+            "vs": [{
+                "p": 10000 + v,
+                "a": rng.random() < 0.9,
+                "ta": (now - timedelta(seconds=rng.randrange(120))).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "py": rng.uniform(*LAT_RANGE),
+                "px": rng.uniform(*LON_RANGE),
+                "sv": None,
+                "is": None,
+            } for v in vehicles],
+        })
+    return payload
+
+
+def make_shapes(path, n_points=500, step_m=25.0, seed=0, gtfs_path=GTFS_PATH):
+    """Grava um shapes.txt sintético (passeio aleatório suave) para os shape_id de trips.txt"""
+    rng = random.Random(seed)
+    with open(os.path.join(gtfs_path, "trips.txt"), encoding='utf-8-sig', newline='') as f:
+        shape_ids = sorted({row['shape_id'] for row in csv.DictReader(f) if row.get('shape_id')})
+    deg_lat = step_m / 111195.0
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        w = csv.writer(f)
+        w.writerow(["shape_id", "shape_pt_lat", "shape_pt_lon", "shape_pt_sequence", "shape_dist_traveled"])
+        for shape_id in shape_ids:
+            lat, lon = rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)
+            heading = rng.uniform(0, 6.283)
+            for seq in range(1, n_points + 1):
+                w.writerow([shape_id, f"{lat:.6f}", f"{lon:.6f}", seq, ""])
+                heading += rng.gauss(0, 0.15)
+                lat += deg_lat * math.cos(heading)
+                lon += deg_lat * math.sin(heading) / math.cos(math.radians(lat))
+    return shape_ids
@@ -3,16 +3,22 @@ import pandas as pd
 from google.cloud import bigquery
 import tempfile
 import os
+from core.load_job import load_parquet_to_bigquery
 
 class BigQueryClient:
     def __init__(self, credentials_file, project_id):
         self.client = bigquery.Client.from_service_account_json(credentials_file, project=project_id)
 
-    def insert_rows(self, table_id, rows_to_insert):
+    def insert_rows(self, table_id, rows_to_insert, schema=None):
+        """Com schema (core/schemas.py) carrega via Parquet; sem schema mantém o CSV"""
         if not rows_to_insert:
             print("Nenhum dado para inserir.")
             return []
 
+        if schema is not None:
+            stats = load_parquet_to_bigquery(self.client, table_id, rows_to_insert, schema)
+            return [stats['error']] if stats and stats['error'] else []
+
         # Converter para DataFrame
         df = pd.DataFrame(rows_to_insert)
 
@@ -0,0 +1,146 @@
+# core/clients.py
+import os
+import threading
+
+from core.config_loader import load_config
+from core.bigquery_client import BigQueryClient
+from core.sptrans_client import SPTransClient, RetryBudget
+from core.fetch_engine import FetchEngine
+from core.gtfs_store import GtfsStore, META_FILE
+from core.metrics import Metrics
+
+# Clientes compartilhados por processo: com run_all.py as pipelines rodam no mesmo
+# interpretador e reutilizam um único bigquery.Client, requests.Session e FetchEngine.
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+config_path = os.path.join(project_root, "core", "config.json")
+
+_lock = threading.Lock()
+_config = None
+_sptrans_client = None
+_bigquery_client = None
+_fetch_engine = None
+_gtfs_store = None
+_gtfs_store_mtime = None  # 'injected' quando vem de set_clients (sem reload)
+_metrics = None
+
+
+def get_config():
+    global _config
+    with _lock:
+        if _config is None:
+            _config = load_config(config_path)
+            if _config is None:
+                raise FileNotFoundError(f"config.json não encontrado em {config_path}")
+        return _config
+
+
+def get_metrics():
+    """Métricas do processo (core/metrics.py): JSONL por ciclo + endpoint Prometheus"""
+    global _metrics
+    metrics_config = get_config().get('metrics', {})
+    with _lock:
+        if _metrics is None:
+            enabled = metrics_config.get('enabled', True)
+            jsonl_path = metrics_config.get('jsonl_path', 'logs/metrics.jsonl')
+            _metrics = Metrics(
+                jsonl_path=os.path.join(project_root, jsonl_path) if enabled and jsonl_path else None,
+                jsonl_max_bytes=int(metrics_config.get('jsonl_max_mb', 10) * 1024 * 1024),
+                jsonl_backups=metrics_config.get('jsonl_backups', 5),
+                port=metrics_config.get('port') if enabled else None,
+                host=metrics_config.get('host', '127.0.0.1')
+            )
+        return _metrics
+
+
+def get_sptrans_client():
+    global _sptrans_client
+    config = get_config()
+    metrics = get_metrics()
+    transport = config['sptrans'].get('transport', {})
+    # Um pool para todos os endpoints: workers do FetchEngine + /Posicao + login
+    pool_maxsize = transport.get('pool_maxsize') or config.get('fetch', {}).get('max_workers', 16) + 2
+    with _lock:
+        if _sptrans_client is None:
+            _sptrans_client = SPTransClient(
+                base_url=config['sptrans']['base_url'],
+                token=config['sptrans']['token'],
+                proxies=config.get('proxy'),
+                metrics=metrics,
+                pool_maxsize=pool_maxsize,
+                timeout=(transport.get('connect_timeout_s', 5), transport.get('read_timeout_s', 30)),
+                max_retries=transport.get('max_retries', 3),
+                backoff_s=transport.get('backoff_s', 0.5),
+                backoff_max_s=transport.get('backoff_max_s', 10),
+                retry_budget=RetryBudget(
+                    ratio=transport.get('retry_budget_ratio', 0.1),
+                    burst=transport.get('retry_budget_burst', 10)
+                )
+            )
+        return _sptrans_client
+
+
+def get_bigquery_client():
+    global _bigquery_client
+    config = get_config()
+    with _lock:
+        if _bigquery_client is None:
+            _bigquery_client = BigQueryClient(
+                credentials_file=config['bigquery']['credentials_file'],
+                project_id=config['bigquery']['project_id']
+            )
+        return _bigquery_client
+
+
+def get_fetch_engine():
+    global _fetch_engine
+    sptrans_client = get_sptrans_client()
+    fetch_config = get_config().get('fetch', {})
+    with _lock:
+        if _fetch_engine is None:
+            _fetch_engine = FetchEngine(
+                sptrans_client,
+                max_workers=fetch_config.get('max_workers', 16),
+                rate_per_s=fetch_config.get('rate_per_s', 30)
+            )
+        return _fetch_engine
+
+
+def gtfs_store_path():
+    return os.path.join(project_root, get_config().get('gtfs', {}).get('store_path', 'data/gtfs_store'))
+
+
+def get_gtfs_store():
+    """Store GTFS local (mmap) ou None se ainda não compilado; reabre após um novo build"""
+    global _gtfs_store, _gtfs_store_mtime
+    if _gtfs_store_mtime == 'injected':
+        return _gtfs_store
+    path = gtfs_store_path()
+    try:
+        mtime = os.stat(os.path.join(path, META_FILE)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    with _lock:
+        if _gtfs_store is None or mtime != _gtfs_store_mtime:
+            _gtfs_store = GtfsStore(path)
+            _gtfs_store_mtime = mtime
+        return _gtfs_store
+
+
+def set_clients(config=None, sptrans_client=None, bigquery_client=None, fetch_engine=None, gtfs_store=None,
+                metrics=None):
+    """Injeta config/clientes (benchmarks, stand-ins locais) antes de importar as pipelines"""
+    global _config, _sptrans_client, _bigquery_client, _fetch_engine, _gtfs_store, _gtfs_store_mtime, _metrics
+    with _lock:
+        if config is not None:
+            _config = config
+        if metrics is not None:
+            _metrics = metrics
+        if sptrans_client is not None:
+            _sptrans_client = sptrans_client
+        if bigquery_client is not None:
+            _bigquery_client = bigquery_client
+        if fetch_engine is not None:
+            _fetch_engine = fetch_engine
+        if gtfs_store is not None:
+            _gtfs_store = gtfs_store
+            _gtfs_store_mtime = 'injected'
@@ -0,0 +1,88 @@
+# core/fetch_engine.py
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from core.metrics import run_in_context
+
+
+class TokenBucket:
+    """Rate limiter thread-safe: até `rate` requisições/s com rajadas de até `capacity`"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class FetchEngine:
+    """Chamadas concorrentes à API Olho Vivo sobre um SPTransClient.
+
+    Pool de threads limitado (max_workers) + TokenBucket no lugar do sleep fixo; cada
+    tentativa HTTP (inclusive retries do transporte) consome uma ficha.
+    Um 401 dispara uma única reautenticação para todas as requisições em voo:
+    quem chega depois vê que a geração do login já mudou e só repete a chamada.
+    Conexões, timeout e retries vêm do transporte do SPTransClient (pool_maxsize
+    deve cobrir max_workers; core/clients.py dimensiona os dois juntos).
+    """
+
+    def __init__(self, sptrans_client, max_workers=16, rate_per_s=30, timeout=None):
+        self.client = sptrans_client
+        self.max_workers = max_workers
+        self.timeout = timeout  # None: timeout do cliente
+        self.bucket = TokenBucket(rate_per_s)
+        self._auth_lock = threading.Lock()
+        self._auth_generation = 0
+
+    def _reauthenticate(self, seen_generation):
+        with self._auth_lock:
+            if self._auth_generation == seen_generation:
+                self.client.authenticate()
+                self._auth_generation += 1
+
+    def get_json(self, url, label=None):
+        """GET com rate limit; no 401 reautentica (uma vez por onda) e repete uma vez"""
+        label = label or url
+        for attempt in range(2):
+            generation = self._auth_generation
+            try:
+                # Uma ficha do bucket por tentativa (retries de 429/5xx do transporte inclusive)
+                response = self.client.send("GET", url, timeout=self.timeout, before_attempt=self.bucket.acquire)
+            except Exception as e:
+                print(f"Exceção ao buscar {label}: {e}")
+                return None
+            if response.status_code == 200:
+                try:
+                    return self.client.loads(response.content, self.client.endpoint(url))
+                except ValueError as e:
+                    print(f"JSON inválido para {label}: {e}")
+                    return None
+            if response.status_code in (401, 403) and attempt == 0:
+                print(f"Token expirado ({label}). Reautenticando...")
+                self._reauthenticate(generation)
+                continue
+            print(f"Erro {response.status_code} para {label}: {response.text}")
+            return None
+        return None
+
+    def map(self, fn, items):
+        """Aplica fn a cada item em paralelo; devolve [(item, resultado)] na ordem de items.
+        As threads herdam o contexto de quem chamou (chamadas contam no ciclo de métricas)."""
+        items = list(items)
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="fetch") as pool:
+            results = list(pool.map(run_in_context(fn), items))
+        return list(zip(items, results))
@@ -0,0 +1,63 @@
+# core/fingerprint_index.py
+import os
+import sqlite3
+import threading
+import time
+
+from core.response_cache import ResponseCache
+
+
+def rows_fingerprint(rows, ignore=("fetch_time",)):
+    """sha256 canônico de um conjunto de linhas, ignorando colunas voláteis"""
+    canonical = sorted(
+        (tuple(sorted((k, v) for k, v in row.items() if k not in ignore)) for row in rows),
+        key=repr
+    )
+    return ResponseCache.content_hash(canonical)
+
+
+class FingerprintIndex:
+    """Índice local (SQLite) do último conjunto de linhas carregado por chave (ex.: line_c).
+
+    diff() compara os fingerprints atuais com os carregados; commit() só deve ser
+    chamado depois que o LOAD JOB correspondente terminou sem erro. Usável de qualquer
+    thread (o Scheduler roda cada ciclo numa thread nova).
+    """
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS fingerprints (
+                key TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                loaded_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value REAL)")
+        self._conn.commit()
+
+    def diff(self, fingerprints):
+        """Chaves novas ou com fingerprint diferente do último load"""
+        with self._lock:
+            loaded = dict(self._conn.execute("SELECT key, fingerprint FROM fingerprints"))
+        return [key for key, fp in fingerprints.items() if loaded.get(str(key)) != fp]
+
+    def commit(self, fingerprints, replace_all=False, now=None):
+        now = now or time.time()
+        with self._lock:
+            if replace_all:
+                self._conn.execute("DELETE FROM fingerprints")
+                self._conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('last_full_load', ?)", (now,))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO fingerprints (key, fingerprint, loaded_at) VALUES (?, ?, ?)",
+                [(str(key), fp, now) for key, fp in fingerprints.items()]
+            )
+            self._conn.commit()
+
+    @property
+    def last_full_load(self):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE name = 'last_full_load'").fetchone()
+        return row[0] if row else None
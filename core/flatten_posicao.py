@@ -0,0 +1,58 @@
+# core/flatten_posicao.py
+from datetime import datetime, timezone
+import numpy as np
+
+# Ordem das colunas = schema de sptrans_posicoes (core/schemas.py); colunas de
+# enriquecimento (velocidade/rumo, parada mais próxima) são anexadas depois em main_posicoes
+POSICAO_COLUMNS = [
+    "fetch_time", "hr",
+    "line_c", "line_cl", "line_sl", "line_lt0", "line_lt1",
+    "vehicle_p", "vehicle_a", "vehicle_ta", "vehicle_py", "vehicle_px",
+]
+
+_LINE_KEYS = [("line_c", "c"), ("line_cl", "cl"), ("line_sl", "sl"), ("line_lt0", "lt0"), ("line_lt1", "lt1")]
+_VEHICLE_KEYS = ["p", "a", "ta", "py", "px"]
+
+
+def flatten_posicao(data, fetch_time=None):
+    """Achata o JSON de /Posicao em colunas (arrays numpy) numa passada.
+
+    fetch_time é calculado uma vez por snapshot; campos da linha (c, cl, sl, lt0, lt1)
+    são repetidos por np.repeat conforme o nº de veículos de cada linha.
+    """
+    if fetch_time is None:
+        fetch_time = datetime.now(timezone.utc).isoformat()
+    lines = data.get('l') or []
+
+    counts = np.empty(len(lines), dtype=np.int64)
+    line_values = []
+    vehicles = []
+    for i, line in enumerate(lines):
+        vs = line.get('vs') or ()
+        counts[i] = len(vs)
+        line_values.append(tuple(line.get(k) for _, k in _LINE_KEYS))
+        vehicles.extend(vs)
+    n = len(vehicles)
+
+    columns = {
+        "fetch_time": np.full(n, fetch_time, dtype=object),
+        "hr": np.full(n, data.get('hr', 'N/A'), dtype=object),
+    }
+
+    # Campos da linha: um valor por linha, broadcast por np.repeat
+    line_cols = list(zip(*line_values)) if line_values else [()] * len(_LINE_KEYS)
+    for (name, _), values in zip(_LINE_KEYS, line_cols):
+        arr = np.empty(len(values), dtype=object)
+        arr[:] = values
+        columns[name] = np.repeat(arr, counts)
+
+    # Campos do veículo: uma passada, transposta com zip
+    vehicle_cols = list(zip(*[tuple(v.get(k) for k in _VEHICLE_KEYS) for v in vehicles])) if n else [()] * len(_VEHICLE_KEYS)
+    p, a, ta, py, px = vehicle_cols
+    columns["vehicle_p"] = np.array(p, dtype=object)
+    columns["vehicle_a"] = np.array(a, dtype=object)
+    columns["vehicle_ta"] = np.array(ta, dtype=object)
+    columns["vehicle_py"] = np.array(py, dtype=np.float64)
+    columns["vehicle_px"] = np.array(px, dtype=np.float64)
+
+    return {name: columns[name] for name in POSICAO_COLUMNS}
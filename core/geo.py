@@ -0,0 +1,38 @@
+# core/geo.py
+import numpy as np
+
+EARTH_RADIUS_M = 6371008.8  # raio médio (IUGG)
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Distância em metros (vetorizada, broadcast numpy)"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class LocalProjection:
+    """Projeção equiretangular em metros em torno de lat0 (erro desprezível na escala de uma cidade)"""
+
+    def __init__(self, lat0, lon0=0.0):
+        self.lat0 = float(lat0)
+        self.lon0 = float(lon0)
+        self._kx = np.radians(1.0) * EARTH_RADIUS_M * np.cos(np.radians(self.lat0))
+        self._ky = np.radians(1.0) * EARTH_RADIUS_M
+
+    def to_xy(self, lat, lon):
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        return (lon - self.lon0) * self._kx, (lat - self.lat0) * self._ky
+
+    def to_latlon(self, x, y):
+        return np.asarray(y) / self._ky + self.lat0, np.asarray(x) / self._kx + self.lon0
+
+
+def bearing_deg(lat1, lon1, lat2, lon2):
+    """Rumo inicial de (lat1, lon1) para (lat2, lon2) em graus [0, 360), 0 = norte (vetorizado)"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+    dlon = lon2 - lon1
+    x = np.sin(dlon) * np.cos(lat2)
+    y = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(dlon)
+    return np.degrees(np.arctan2(x, y)) % 360.0
@@ -0,0 +1,102 @@
+# core/gtfs_csv.py
+import io
+import os
+
+UTF8_BOM = b'\xef\xbb\xbf'
+STREAM_BUFFER_SIZE = 1024 * 1024  # 1 MB
+
+
+class LoadDateCSVStream(io.RawIOBase):
+    """Arquivo GTFS (CSV) + coluna load_date, gerado sob demanda para o upload.
+
+    Lê o arquivo linha a linha em bytes e acrescenta `,load_date` ao fim de cada
+    registro, sem DataFrame nem CSV temporário: memória constante qualquer que seja
+    o tamanho. Registros com quebra de linha dentro de aspas são respeitados pela
+    paridade de aspas (RFC 4180: aspas escapadas "" não alteram a paridade).
+    """
+
+    mode = 'rb'
+
+    def __init__(self, path, load_date, lines_per_chunk=8192):
+        self._file = open(path, 'rb')
+        self._suffix = b',' + load_date.encode('ascii') + b'\n'
+        self._lines_per_chunk = lines_per_chunk
+        self._chunks = self._generate()
+        self._pending = memoryview(b'')
+        self._pos = 0
+        self.rows = 0  # registros de dados emitidos (sem header)
+
+    def _generate(self):
+        out = []
+        partial = []  # Linhas de um registro com quebra de linha entre aspas
+        odd_quotes = False
+        header = True
+        for line in self._file:
+            if header and line.startswith(UTF8_BOM):
+                line = line[len(UTF8_BOM):]
+            if line.count(b'"') % 2:
+                odd_quotes = not odd_quotes
+            if odd_quotes:
+                partial.append(line)  # Campo entre aspas continua na próxima linha
+                continue
+            body = line.rstrip(b'\r\n')
+            if partial:
+                body = b''.join(partial) + body
+                partial = []
+            if not body:
+                continue  # Linha em branco
+            if header:
+                out.append(body + b',load_date\n')
+                header = False
+            else:
+                out.append(body + self._suffix)
+                self.rows += 1
+            if len(out) >= self._lines_per_chunk:
+                yield b''.join(out)
+                out = []
+        if partial:
+            out.append(b''.join(partial).rstrip(b'\r\n') + self._suffix)  # Aspas sem fechar no EOF
+            self.rows += 1
+        if out:
+            yield b''.join(out)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        view = memoryview(b).cast('B')
+        n = 0
+        while n < len(view):
+            if not self._pending:
+                chunk = next(self._chunks, None)
+                if chunk is None:
+                    break
+                self._pending = memoryview(chunk)
+            k = min(len(view) - n, len(self._pending))
+            view[n:n + k] = self._pending[:k]
+            self._pending = self._pending[k:]  # Fatia de memoryview: sem cópia
+            n += k
+        self._pos += n
+        return n
+
+    def tell(self):
+        return self._pos
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+def open_load_date_stream(path, load_date):
+    """Stream binário bufferizado pronto para load_table_from_file (modo 'rb', tell())"""
+    return io.BufferedReader(LoadDateCSVStream(path, load_date), buffer_size=STREAM_BUFFER_SIZE)
+
+
+def write_temp_csv_pandas(csv_path, load_date):
+    """Caminho antigo: DataFrame (dtype=str) + load_date → <arquivo>_temp.csv"""
+    import pandas as pd
+    df = pd.read_csv(csv_path, dtype=str, low_memory=False)  # low_memory=False para arquivos grandes
+    df['load_date'] = load_date
+    temp_csv = os.path.splitext(csv_path)[0] + '_temp.csv'
+    df.to_csv(temp_csv, index=False)
+    return temp_csv
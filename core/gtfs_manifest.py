@@ -0,0 +1,60 @@
+# core/gtfs_manifest.py
+import hashlib
+import json
+import os
+import time
+
+HASH_CHUNK_SIZE = 1024 * 1024  # 1 MB
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class GtfsManifest:
+    """Manifesto (JSON) do último ingest GTFS: sha256, tamanho e mtime por arquivo.
+
+    changed() só recalcula o hash quando tamanho ou mtime mudaram; um arquivo
+    reescrito com o mesmo conteúdo (ex.: ZIP extraído de novo) não é recarregado.
+    commit() grava só os arquivos cujo LOAD JOB terminou sem erro.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f).get('files', {})
+
+    def fingerprint(self, path):
+        """{sha256, size, mtime_ns} atual; reaproveita o hash se tamanho/mtime não mudaram"""
+        st = os.stat(path)
+        name = os.path.basename(path)
+        old = self.entries.get(name)
+        if old and old['size'] == st.st_size and old['mtime_ns'] == st.st_mtime_ns:
+            return dict(old)
+        return {"sha256": file_sha256(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+    def changed(self, paths):
+        """(arquivos novos/alterados, fingerprints atuais) para uma lista de caminhos"""
+        current = {os.path.basename(p): self.fingerprint(p) for p in paths}
+        changed = [name for name, fp in current.items()
+                   if self.entries.get(name, {}).get('sha256') != fp['sha256']]
+        return changed, current
+
+    def commit(self, fingerprints):
+        """Atualiza as entradas carregadas e grava o manifesto de forma atômica"""
+        now = time.time()
+        for name, fp in fingerprints.items():
+            self.entries[name] = dict(fp, ingested_at=now)
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({"files": self.entries}, f, indent=2, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
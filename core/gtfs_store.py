@@ -0,0 +1,387 @@
+# core/gtfs_store.py
+import csv
+import json
+import os
+import shutil
+import time
+from datetime import datetime, time as dtime
+
+import numpy as np
+
+STORE_VERSION = 1
+META_FILE = "meta.json"
+# Arquivos obrigatórios / opcionais do data/gtfs/ que entram no store
+STORE_SOURCES = ("routes.txt", "trips.txt", "stops.txt", "frequencies.txt")
+OPTIONAL_SOURCES = ("shapes.txt", "stop_times.txt")
+# SPTrans fecha as janelas de frequencies em HH:59:00; o minuto final ainda vale
+HEADWAY_GAP_TOLERANCE_S = 60
+
+
+def parse_gtfs_time(value):
+    """'HH:MM:SS' (pode passar de 24h) → segundos desde a meia-noite do dia de serviço"""
+    h, m, s = value.strip().split(':')
+    return int(h) * 3600 + int(m) * 60 + int(s)
+
+
+def _seconds_of_day(t):
+    if isinstance(t, datetime):
+        t = t.time()
+    if isinstance(t, dtime):
+        return t.hour * 3600 + t.minute * 60 + t.second
+    if isinstance(t, str):
+        return parse_gtfs_time(t)
+    return int(t)
+
+
+def _read_csv(path):
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        yield from csv.DictReader(f)
+
+
+def _offsets(sorted_keys, n):
+    """Offsets CSR: linhas da chave k em [off[k], off[k + 1]) para chaves já ordenadas"""
+    return np.searchsorted(sorted_keys, np.arange(n + 1), side='left').astype(np.int64)
+
+
+class _Interner:
+    def __init__(self):
+        self.ids = {}
+
+    def add(self, value):
+        value = value or ''
+        sid = self.ids.get(value)
+        if sid is None:
+            sid = self.ids[value] = len(self.ids)
+        return sid
+
+    def finalize(self):
+        """Ordena lexicograficamente: id de string crescente == ordem das strings"""
+        ordered = sorted(self.ids)
+        remap = np.empty(len(ordered), dtype=np.int32)
+        for new_id, value in enumerate(ordered):
+            remap[self.ids[value]] = new_id
+        encoded = [v.encode('utf-8') for v in ordered]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        blob = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        return remap, blob, offsets
+
+
+def build_store(gtfs_dir, out_dir):
+    """Compila os .txt do GTFS em arrays .npy (mmap) + tabela de strings internadas.
+
+    Escreve num diretório temporário e troca o anterior ao final, então um leitor
+    nunca vê um store pela metade. Devolve o meta (contagens, tempo de build).
+    """
+    t0 = time.monotonic()
+    missing = [f for f in STORE_SOURCES if not os.path.exists(os.path.join(gtfs_dir, f))]
+    if missing:
+        raise FileNotFoundError(f"GTFS incompleto em {gtfs_dir}: faltam {', '.join(missing)}")
+
+    strings = _Interner()
+    arrays = {}
+
+    # routes: ordem do arquivo; route_idx = linha
+    routes = list(_read_csv(os.path.join(gtfs_dir, "routes.txt")))
+    route_idx_by_id = {r['route_id']: i for i, r in enumerate(routes)}
+    arrays['route_id'] = np.array([strings.add(r['route_id']) for r in routes], dtype=np.int32)
+    arrays['route_short_name'] = np.array([strings.add(r.get('route_short_name')) for r in routes], dtype=np.int32)
+    arrays['route_long_name'] = np.array([strings.add(r.get('route_long_name')) for r in routes], dtype=np.int32)
+    arrays['route_color'] = np.array([strings.add(r.get('route_color')) for r in routes], dtype=np.int32)
+    arrays['route_text_color'] = np.array([strings.add(r.get('route_text_color')) for r in routes], dtype=np.int32)
+    arrays['route_type'] = np.array([int(r.get('route_type') or -1) for r in routes], dtype=np.int16)
+
+    # trips: ordenadas por route_idx → CSR route_trips_off
+    trips = [t for t in _read_csv(os.path.join(gtfs_dir, "trips.txt")) if t['route_id'] in route_idx_by_id]
+    trips.sort(key=lambda t: route_idx_by_id[t['route_id']])
+    trip_idx_by_id = {t['trip_id']: i for i, t in enumerate(trips)}
+    arrays['trip_id'] = np.array([strings.add(t['trip_id']) for t in trips], dtype=np.int32)
+    arrays['trip_route'] = np.array([route_idx_by_id[t['route_id']] for t in trips], dtype=np.int32)
+    arrays['trip_service_id'] = np.array([strings.add(t.get('service_id')) for t in trips], dtype=np.int32)
+    arrays['trip_headsign'] = np.array([strings.add(t.get('trip_headsign')) for t in trips], dtype=np.int32)
+    arrays['trip_shape_id'] = np.array([strings.add(t.get('shape_id')) for t in trips], dtype=np.int32)
+    arrays['trip_direction'] = np.array([int(t.get('direction_id') or -1) for t in trips], dtype=np.int8)
+    arrays['route_trips_off'] = _offsets(arrays['trip_route'], len(routes))
+
+    # stops: ordenadas por stop_id (inteiro na SPTrans) → busca binária
+    stops = sorted(_read_csv(os.path.join(gtfs_dir, "stops.txt")), key=lambda s: int(s['stop_id']))
+    arrays['stop_id'] = np.array([int(s['stop_id']) for s in stops], dtype=np.int64)
+    arrays['stop_name'] = np.array([strings.add(s.get('stop_name')) for s in stops], dtype=np.int32)
+    arrays['stop_desc'] = np.array([strings.add(s.get('stop_desc')) for s in stops], dtype=np.int32)
+    arrays['stop_lat'] = np.array([float(s['stop_lat']) for s in stops], dtype=np.float64)
+    arrays['stop_lon'] = np.array([float(s['stop_lon']) for s in stops], dtype=np.float64)
+
+    # frequencies: ordenadas por (trip_idx, start) → CSR trip_freq_off
+    freqs = sorted(
+        (trip_idx_by_id[f['trip_id']], parse_gtfs_time(f['start_time']), parse_gtfs_time(f['end_time']), int(f['headway_secs']))
+        for f in _read_csv(os.path.join(gtfs_dir, "frequencies.txt")) if f['trip_id'] in trip_idx_by_id
+    )
+    freq = np.array(freqs, dtype=np.int32).reshape(-1, 4)
+    arrays['freq_trip'], arrays['freq_start'], arrays['freq_end'], arrays['freq_headway'] = (
+        np.ascontiguousarray(freq[:, i]) for i in range(4))
+    arrays['trip_freq_off'] = _offsets(arrays['freq_trip'], len(trips))
+
+    optional = []
+    shapes_path = os.path.join(gtfs_dir, "shapes.txt")
+    if os.path.exists(shapes_path):
+        # shapes: ordenados por (shape_id, sequência) → CSR por id de string do shape_id
+        pts = sorted(
+            (strings.add(s['shape_id']), int(s['shape_pt_sequence']), float(s['shape_pt_lat']),
+             float(s['shape_pt_lon']), float(s.get('shape_dist_traveled') or 'nan'))
+            for s in _read_csv(shapes_path)
+        )
+        arrays['shape_pt_shape'] = np.array([p[0] for p in pts], dtype=np.int32)
+        arrays['shape_pt_lat'] = np.array([p[2] for p in pts], dtype=np.float64)
+        arrays['shape_pt_lon'] = np.array([p[3] for p in pts], dtype=np.float64)
+        arrays['shape_pt_dist'] = np.array([p[4] for p in pts], dtype=np.float64)
+        optional.append("shapes")
+
+    stop_times_path = os.path.join(gtfs_dir, "stop_times.txt")
+    if os.path.exists(stop_times_path):
+        stop_pos = {int(s): i for i, s in enumerate(arrays['stop_id'].tolist())}
+        sts = sorted(
+            (trip_idx_by_id[st['trip_id']], int(st['stop_sequence']), stop_pos.get(int(st['stop_id']), -1),
+             parse_gtfs_time(st['arrival_time']) if st.get('arrival_time') else -1,
+             parse_gtfs_time(st['departure_time']) if st.get('departure_time') else -1)
+            for st in _read_csv(stop_times_path) if st['trip_id'] in trip_idx_by_id
+        )
+        st_arr = np.array(sts, dtype=np.int32).reshape(-1, 5)
+        arrays['st_trip'], arrays['st_seq'], arrays['st_stop'], arrays['st_arrival'], arrays['st_departure'] = (
+            np.ascontiguousarray(st_arr[:, i]) for i in range(5))
+        arrays['trip_st_off'] = _offsets(arrays['st_trip'], len(trips))
+        optional.append("stop_times")
+
+    # Ids de string definitivos (ordem lexicográfica) + arrays ordenados por string
+    remap, blob, offsets = strings.finalize()
+    string_columns = [name for name in arrays if name in (
+        'route_id', 'route_short_name', 'route_long_name', 'route_color', 'route_text_color', 'trip_id',
+        'trip_service_id', 'trip_headsign', 'trip_shape_id', 'stop_name', 'stop_desc', 'shape_pt_shape')]
+    for name in string_columns:
+        arrays[name] = remap[arrays[name]]
+    arrays['strings_blob'] = blob
+    arrays['strings_off'] = offsets
+    arrays['route_by_short_name'] = np.argsort(arrays['route_short_name'], kind='stable').astype(np.int32)
+    arrays['route_by_id'] = np.argsort(arrays['route_id'], kind='stable').astype(np.int32)
+    arrays['trip_by_id'] = np.argsort(arrays['trip_id'], kind='stable').astype(np.int32)
+    if 'shape_pt_shape' in arrays:
+        order = np.lexsort((np.arange(len(arrays['shape_pt_shape'])), arrays['shape_pt_shape']))
+        for name in ('shape_pt_shape', 'shape_pt_lat', 'shape_pt_lon', 'shape_pt_dist'):
+            arrays[name] = np.ascontiguousarray(arrays[name][order])
+
+    meta = {
+        "version": STORE_VERSION,
+        "built_at": datetime.now().isoformat(timespec='seconds'),
+        "build_s": None,
+        "counts": {"routes": len(routes), "trips": len(trips), "stops": len(stops),
+                   "frequencies": len(freqs), "strings": len(offsets) - 1},
+        "optional": optional,
+        "arrays": sorted(arrays),
+    }
+    if "shapes" in optional:
+        meta["counts"]["shape_points"] = len(arrays['shape_pt_shape'])
+    if "stop_times" in optional:
+        meta["counts"]["stop_times"] = len(arrays['st_trip'])
+
+    out_dir = os.path.abspath(out_dir)
+    tmp_dir = out_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for name, arr in arrays.items():
+        np.save(os.path.join(tmp_dir, f"{name}.npy"), np.ascontiguousarray(arr))
+    meta["build_s"] = round(time.monotonic() - t0, 3)
+    with open(os.path.join(tmp_dir, META_FILE), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+
+    old_dir = out_dir + ".old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(out_dir):
+        os.replace(out_dir, old_dir)
+    os.replace(tmp_dir, out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)  # leitores com mmap aberto mantêm os arquivos antigos
+    return meta
+
+
+class StringTable:
+    """Strings internadas (utf-8 concatenado + offsets); id crescente == ordem lexicográfica"""
+
+    def __init__(self, blob, offsets):
+        self._blob = blob
+        self._off = offsets
+
+    def __len__(self):
+        return len(self._off) - 1
+
+    def __getitem__(self, sid):
+        return bytes(self._blob[self._off[sid]:self._off[sid + 1]]).decode('utf-8')
+
+    def find(self, value):
+        """id da string (busca binária) ou -1"""
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self[mid] < value:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < len(self) and self[lo] == value else -1
+
+
+class GtfsStore:
+    """Store GTFS compilado (build_store) aberto com np.load(mmap_mode='r').
+
+    Abrir só mapeia os arquivos: o custo é de milissegundos e as páginas são
+    carregadas sob demanda. Consultas devolvem dicts com strings decodificadas.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != STORE_VERSION:
+            raise ValueError(f"Store GTFS versão {self.meta.get('version')} != {STORE_VERSION}: rode build_gtfs_store.py")
+        self.a = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r') for name in self.meta["arrays"]}
+        self.strings = StringTable(self.a['strings_blob'], self.a['strings_off'])
+        self._route_idx_by_short_name = None
+
+    @property
+    def has_shapes(self):
+        return "shapes" in self.meta["optional"]
+
+    @property
+    def has_stop_times(self):
+        return "stop_times" in self.meta["optional"]
+
+    def _find_sorted(self, order, column, value):
+        """Linhas cuja coluna (id de string) == value, via índice ordenado `order`"""
+        sid = self.strings.find(value)
+        if sid < 0:
+            return []
+        keys = self.a[column][order]
+        lo, hi = np.searchsorted(keys, sid, side='left'), np.searchsorted(keys, sid, side='right')
+        return [int(i) for i in order[lo:hi]]
+
+    # === ROUTES ===
+    def route(self, idx):
+        a, s = self.a, self.strings
+        return {
+            "route_idx": idx,
+            "route_id": s[a['route_id'][idx]],
+            "route_short_name": s[a['route_short_name'][idx]],
+            "route_long_name": s[a['route_long_name'][idx]],
+            "route_type": int(a['route_type'][idx]),
+            "route_color": s[a['route_color'][idx]],
+            "route_text_color": s[a['route_text_color'][idx]],
+        }
+
+    def route_idx(self, route_id):
+        idx = self._find_sorted(self.a['route_by_id'], 'route_id', route_id)
+        return idx[0] if idx else -1
+
+    def route_by_short_name(self, short_name):
+        """Rota pelo route_short_name (= line_c do Olho Vivo) ou None"""
+        idx = self._find_sorted(self.a['route_by_short_name'], 'route_short_name', short_name)
+        return self.route(idx[0]) if idx else None
+
+    def route_indices(self, short_names):
+        """Vetorizado: route_idx por route_short_name (-1 se ausente), ex.: line_c de um snapshot"""
+        if self._route_idx_by_short_name is None:
+            s, names = self.strings, self.a['route_short_name']
+            self._route_idx_by_short_name = {s[names[i]]: i for i in range(len(names) - 1, -1, -1)}
+        lookup = self._route_idx_by_short_name
+        return np.fromiter((lookup.get(n, -1) for n in short_names), dtype=np.int32, count=len(short_names))
+
+    # === TRIPS ===
+    def trip(self, idx):
+        a, s = self.a, self.strings
+        return {
+            "trip_idx": idx,
+            "trip_id": s[a['trip_id'][idx]],
+            "route_id": s[a['route_id'][a['trip_route'][idx]]],
+            "service_id": s[a['trip_service_id'][idx]],
+            "trip_headsign": s[a['trip_headsign'][idx]],
+            "direction_id": int(a['trip_direction'][idx]),
+            "shape_id": s[a['trip_shape_id'][idx]],
+        }
+
+    def trip_idx(self, trip_id):
+        idx = self._find_sorted(self.a['trip_by_id'], 'trip_id', trip_id)
+        return idx[0] if idx else -1
+
+    def trip_range(self, route_idx):
+        off = self.a['route_trips_off']
+        return int(off[route_idx]), int(off[route_idx + 1])
+
+    def trips_by_route(self, route_id):
+        """Viagens de uma rota (route_id)"""
+        route_idx = self.route_idx(route_id)
+        if route_idx < 0:
+            return []
+        return [self.trip(i) for i in range(*self.trip_range(route_idx))]
+
+    # === STOPS ===
+    def stop_idx(self, stop_id):
+        ids = self.a['stop_id']
+        i = int(np.searchsorted(ids, int(stop_id)))
+        return i if i < len(ids) and ids[i] == int(stop_id) else -1
+
+    def stop(self, stop_id):
+        """Parada pelo stop_id (= cp do Olho Vivo) ou None"""
+        i = self.stop_idx(stop_id)
+        if i < 0:
+            return None
+        a, s = self.a, self.strings
+        return {
+            "stop_id": int(a['stop_id'][i]),
+            "stop_name": s[a['stop_name'][i]],
+            "stop_desc": s[a['stop_desc'][i]],
+            "stop_lat": float(a['stop_lat'][i]),
+            "stop_lon": float(a['stop_lon'][i]),
+        }
+
+    # === FREQUENCIES ===
+    def headway(self, trip_id, t, gap_tolerance_s=HEADWAY_GAP_TOLERANCE_S):
+        """headway_secs programado da viagem no horário t (segundos, 'HH:MM:SS', time ou datetime)"""
+        trip_idx = self.trip_idx(trip_id)
+        if trip_idx < 0:
+            return None
+        off = self.a['trip_freq_off']
+        lo, hi = int(off[trip_idx]), int(off[trip_idx + 1])
+        secs = _seconds_of_day(t)
+        i = lo + int(np.searchsorted(self.a['freq_start'][lo:hi], secs, side='right')) - 1
+        if i < lo or secs >= self.a['freq_end'][i] + gap_tolerance_s:
+            return None
+        return int(self.a['freq_headway'][i])
+
+    # === SHAPES / STOP_TIMES (opcionais) ===
+    def shape_points(self, shape_id):
+        """(lat, lon, dist_traveled) do shape em ordem de sequência; arrays vazios se ausente"""
+        if not self.has_shapes:
+            raise LookupError("Store GTFS sem shapes.txt")
+        sid = self.strings.find(shape_id)
+        keys = self.a['shape_pt_shape']
+        lo, hi = np.searchsorted(keys, sid, side='left'), np.searchsorted(keys, sid, side='right')
+        if sid < 0:
+            lo = hi = 0
+        return self.a['shape_pt_lat'][lo:hi], self.a['shape_pt_lon'][lo:hi], self.a['shape_pt_dist'][lo:hi]
+
+    def stop_times(self, trip_id):
+        """Paradas da viagem em ordem: stop_idx (linha em stops), chegada e partida em segundos"""
+        if not self.has_stop_times:
+            raise LookupError("Store GTFS sem stop_times.txt")
+        trip_idx = self.trip_idx(trip_id)
+        if trip_idx < 0:
+            return []
+        off = self.a['trip_st_off']
+        lo, hi = int(off[trip_idx]), int(off[trip_idx + 1])
+        stop_ids = self.a['stop_id']
+        return [{"stop_sequence": int(self.a['st_seq'][i]),
+                 "stop_id": int(stop_ids[self.a['st_stop'][i]]) if self.a['st_stop'][i] >= 0 else None,
+                 "arrival_s": int(self.a['st_arrival'][i]), "departure_s": int(self.a['st_departure'][i])}
+                for i in range(lo, hi)]
+
+
+def open_store(path):
+    """GtfsStore aberto ou None se o store ainda não foi compilado"""
+    if not os.path.exists(os.path.join(path, META_FILE)):
+        return None
+    return GtfsStore(path)
@@ -0,0 +1,193 @@
+# core/headway.py
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from core.gtfs_store import HEADWAY_GAP_TOLERANCE_S
+from core.map_match import N_DIRECTIONS, sl_to_direction
+
+DAY_S = 24 * 3600
+SPAN_S = 2 * DAY_S  # horários GTFS passam de 24:00:00 (viagens da madrugada)
+SAO_PAULO_TZ = timezone(timedelta(hours=-3))  # sem horário de verão desde 2019
+
+HEADWAY_COLUMNS = [
+    "fetch_time", "hr", "line_c", "line_sl", "vehicles", "gaps",
+    "headway_p50_s", "headway_mean_s", "headway_min_s", "headway_max_s", "headway_cv",
+    "scheduled_headway_s", "headway_ratio", "bunched",
+]
+
+
+class ScheduledHeadwayIndex:
+    """headway_secs programado (frequencies.txt) por (rota, sentido), com busca binária.
+
+    As faixas de todas as viagens de um grupo viram uma linha do tempo de intervalos
+    disjuntos, com breakpoints ordenados pela chave grupo * SPAN_S + segundo do dia;
+    onde faixas se sobrepõem (ex.: service_id diferentes) vale o menor headway. Cada
+    faixa vale até end_time + gap_tolerance_s, como GtfsStore.headway().
+    """
+
+    def __init__(self, store, gap_tolerance_s=HEADWAY_GAP_TOLERANCE_S):
+        a = store.a
+        trip = np.asarray(a['freq_trip'], dtype=np.int64)
+        route = np.asarray(a['trip_route'], dtype=np.int64)[trip]
+        direction = np.asarray(a['trip_direction'], dtype=np.int64)[trip]
+        start = np.asarray(a['freq_start'], dtype=np.int64)
+        end = np.minimum(np.asarray(a['freq_end'], dtype=np.int64) + gap_tolerance_s, SPAN_S)
+        headway = np.asarray(a['freq_headway'], dtype=np.int64)
+
+        # direction_id ausente vale para os dois sentidos
+        both = direction < 0
+        group = np.concatenate([route[~both] * N_DIRECTIONS + direction[~both],
+                                route[both] * N_DIRECTIONS, route[both] * N_DIRECTIONS + 1])
+        start, end, headway = (np.concatenate([v[~both], v[both], v[both]]) for v in (start, end, headway))
+        ok = end > start
+        k_start, k_end = group[ok] * SPAN_S + start[ok], group[ok] * SPAN_S + end[ok]
+
+        # Intervalo elementar k = [keys[k], keys[k + 1]); cada faixa cobre [i0, i1)
+        self.keys = np.unique(np.concatenate([k_start, k_end]))
+        i0, i1 = np.searchsorted(self.keys, k_start), np.searchsorted(self.keys, k_end)
+        counts = i1 - i0
+        covered = np.repeat(i0 - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())
+        best = np.full(len(self.keys), np.iinfo(np.int64).max)
+        np.minimum.at(best, covered, np.repeat(headway[ok], counts))
+        self.values = np.where(best == np.iinfo(np.int64).max, -1, best)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _lookup(self, group, secs):
+        key = group * SPAN_S + secs
+        i = np.searchsorted(self.keys, key, side='right') - 1
+        ok = (group >= 0) & (i >= 0) & (secs >= 0) & (secs < SPAN_S)
+        i = np.maximum(i, 0)
+        ok &= (self.keys[i] // SPAN_S) == group if len(self.keys) else False
+        return np.where(ok, self.values[i] if len(self.keys) else -1, -1)
+
+    def headway(self, route_idx, direction, secs):
+        """headway_secs programado por posição (-1 sem faixa); secs = segundo do dia (escalar ou array)"""
+        route_idx = np.asarray(route_idx, dtype=np.int64)
+        direction = np.asarray(direction, dtype=np.int64)
+        secs = np.broadcast_to(np.asarray(secs, dtype=np.int64), route_idx.shape)
+        ok = (route_idx >= 0) & (direction >= 0) & (direction < N_DIRECTIONS)
+        group = np.where(ok, route_idx * N_DIRECTIONS + direction, -1)
+        out = self._lookup(group, secs)
+        # Madrugada: 00:30 também é 24:30 do dia de serviço anterior
+        late = out < 0
+        if late.any():
+            out[late] = self._lookup(group[late], secs[late] + DAY_S)
+        return out
+
+
+def snapshot_seconds(columns):
+    """Segundo do dia (hora de São Paulo) do snapshot: campo hr da API ou fetch_time"""
+    hr = columns["hr"][0] if len(columns["hr"]) else None
+    try:
+        hh, mm = str(hr).split(':')[:2]
+        return int(hh) * 3600 + int(mm) * 60
+    except ValueError:
+        t = datetime.fromisoformat(str(columns["fetch_time"][0])).astimezone(SAO_PAULO_TZ)
+        return t.hour * 3600 + t.minute * 60 + t.second
+
+
+def observed_headways(columns, default_speed_kmh=15.0, min_speed_kmh=5.0):
+    """Headway observado (s) de cada veículo até o da frente na mesma linha, sentido e shape.
+
+    Usa as colunas de map-matching (shape_id, shape_dist_m): veículos ordenados pela
+    distância ao longo do shape, gap em metros dividido pela velocidade do veículo de
+    trás (speed_smooth_kmh, speed_kmh ou default_speed_kmh, no mínimo min_speed_kmh).
+    Devolve (gap_m, headway_s) por linha do snapshot; NaN para o líder e não casados.
+    """
+    n = len(columns["line_c"])
+    gap = np.full(n, np.nan)
+    along = np.asarray(columns.get("shape_dist_m", np.full(n, np.nan)), dtype=np.float64)
+    direction = sl_to_direction(columns["line_sl"])
+    matched = np.flatnonzero(np.isfinite(along) & (direction >= 0))
+    if len(matched) < 2:
+        return gap, np.full(n, np.nan)
+
+    _, line = np.unique(columns["line_c"][matched].astype(str), return_inverse=True)
+    _, shape = np.unique(columns["shape_id"][matched].astype(str), return_inverse=True)
+    group = (line.astype(np.int64) * N_DIRECTIONS + direction[matched]) * (int(shape.max()) + 1) + shape
+    sort = np.lexsort((along[matched], group))
+    order, group = matched[sort], group[sort]
+    same = group[:-1] == group[1:]
+    follower, leader = order[:-1][same], order[1:][same]
+    gap[follower] = along[leader] - along[follower]
+
+    speed = np.full(n, np.nan)
+    for name in ("speed_smooth_kmh", "speed_kmh"):
+        if name in columns:
+            missing = np.isnan(speed)
+            speed[missing] = np.asarray(columns[name], dtype=np.float64)[missing]
+    speed = np.where(np.isnan(speed), default_speed_kmh, speed)
+    speed = np.maximum(speed, min_speed_kmh)
+    return gap, gap / (speed / 3.6)
+
+
+def headway_table(columns, route_idx, scheduled_index=None, bunching_ratio=0.25,
+                  default_speed_kmh=15.0, min_speed_kmh=5.0):
+    """Tabela de aderência de headway por (line_c, line_sl) de um snapshot, em colunas.
+
+    Uma linha por linha/sentido com pelo menos um par de veículos consecutivos:
+    estatísticas do headway observado (observed_headways), headway programado no
+    horário do snapshot (scheduled_index), razão mediana/programado e nº de pares
+    "bunched" (headway < bunching_ratio * programado).
+    """
+    _, headway = observed_headways(columns, default_speed_kmh, min_speed_kmh)
+    direction = sl_to_direction(columns["line_sl"])
+    rows = np.flatnonzero(np.isfinite(headway))
+    if not len(rows):
+        return {name: np.empty(0, dtype=object) for name in HEADWAY_COLUMNS}
+
+    # Grupos (line_c, sentido); headways ordenados dentro de cada grupo
+    line_c = columns["line_c"][rows].astype(str)
+    names, line = np.unique(line_c, return_inverse=True)
+    group = line.astype(np.int64) * N_DIRECTIONS + direction[rows]
+    sort = np.lexsort((headway[rows], group))
+    rows, group, h = rows[sort], group[sort], headway[rows][sort]
+    keys, first, gaps = np.unique(group, return_index=True, return_counts=True)
+    last = first + gaps - 1
+    p50 = (h[first + (gaps - 1) // 2] + h[first + gaps // 2]) / 2
+    mean = np.add.reduceat(h, first) / gaps
+    var = np.maximum(np.add.reduceat(h * h, first) / gaps - mean * mean, 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cv = np.where(mean > 0, np.sqrt(var) / mean, np.nan)
+
+    # Veículos casados por grupo (inclui o líder de cada shape)
+    matched = np.flatnonzero(np.isfinite(np.asarray(columns.get("shape_dist_m", ()), dtype=np.float64)))
+    m_line = np.searchsorted(names, columns["line_c"][matched].astype(str))
+    m_line = np.minimum(m_line, len(names) - 1)
+    m_ok = (names[m_line] == columns["line_c"][matched].astype(str)) & (direction[matched] >= 0)
+    m_group = m_line[m_ok].astype(np.int64) * N_DIRECTIONS + direction[matched][m_ok]
+    vehicles = np.zeros(len(keys), dtype=np.int64)
+    np.add.at(vehicles, np.searchsorted(keys, m_group[np.isin(m_group, keys)]), 1)
+
+    rep = rows[first]
+    scheduled = np.full(len(keys), -1, dtype=np.int64)
+    if scheduled_index is not None:
+        secs = snapshot_seconds(columns)
+        scheduled = scheduled_index.headway(np.asarray(route_idx)[rep], direction[rep], secs)
+    has_schedule = scheduled > 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(has_schedule, p50 / scheduled, np.nan)
+    bunched_pairs = np.zeros(len(keys), dtype=np.int64)
+    limit = np.repeat(np.where(has_schedule, scheduled * bunching_ratio, -np.inf), gaps)
+    np.add.at(bunched_pairs, np.repeat(np.arange(len(keys)), gaps), h < limit)
+    bunched = np.where(has_schedule, bunched_pairs, None).astype(object)
+
+    return {
+        "fetch_time": columns["fetch_time"][rep],
+        "hr": columns["hr"][rep],
+        "line_c": columns["line_c"][rep],
+        "line_sl": columns["line_sl"][rep],
+        "vehicles": vehicles.astype(object),
+        "gaps": gaps.astype(object),
+        "headway_p50_s": p50,
+        "headway_mean_s": mean,
+        "headway_min_s": h[first],
+        "headway_max_s": h[last],
+        "headway_cv": cv,
+        "scheduled_headway_s": np.where(has_schedule, scheduled, None).astype(object),
+        "headway_ratio": ratio,
+        "bunched": bunched,
+    }
@@ -0,0 +1,71 @@
+# core/line_index.py
+import os
+import sqlite3
+from datetime import datetime, timezone
+
+
+def _hoje():
+    # Mesmo dia de CURRENT_DATE() do BigQuery (UTC)
+    return datetime.now(timezone.utc).date().isoformat()
+
+
+class LineIndex:
+    """Índice local (SQLite, WAL) das linhas vistas no dia, compartilhado entre processos.
+
+    main_posicoes registra os line_c de cada /Posicao, enrich_linhas registra os pares
+    (line_c, cl) de /Linha/Buscar; enrich_linhas e enrich_paradas leem daqui em vez de
+    consultar sptrans_posicoes/sptrans_linhas. Dias anteriores são descartados (rollover).
+    """
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS linhas (
+                dia TEXT NOT NULL, line_c TEXT NOT NULL,
+                PRIMARY KEY (dia, line_c)
+            ) WITHOUT ROWID
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS linhas_cl (
+                dia TEXT NOT NULL, line_c TEXT NOT NULL, cl INTEGER NOT NULL,
+                PRIMARY KEY (dia, line_c, cl)
+            ) WITHOUT ROWID
+        """)
+        self._conn.commit()
+        self._dia = None
+
+    def _rollover(self, dia):
+        if dia != self._dia:
+            self._conn.execute("DELETE FROM linhas WHERE dia < ?", (dia,))
+            self._conn.execute("DELETE FROM linhas_cl WHERE dia < ?", (dia,))
+            self._dia = dia
+
+    def add_linhas(self, line_cs, dia=None):
+        dia = dia or _hoje()
+        with self._conn:
+            self._rollover(dia)
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO linhas (dia, line_c) VALUES (?, ?)",
+                [(dia, line_c) for line_c in line_cs if line_c is not None]
+            )
+
+    def add_linhas_cl(self, pares, dia=None):
+        dia = dia or _hoje()
+        with self._conn:
+            self._rollover(dia)
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO linhas_cl (dia, line_c, cl) VALUES (?, ?, ?)",
+                [(dia, line_c, cl) for line_c, cl in pares if line_c is not None and cl is not None]
+            )
+
+    def linhas(self, dia=None):
+        """line_c vistos hoje (equivale ao SELECT DISTINCT line_c de sptrans_posicoes)"""
+        rows = self._conn.execute("SELECT line_c FROM linhas WHERE dia = ? ORDER BY line_c", (dia or _hoje(),))
+        return [r[0] for r in rows]
+
+    def linhas_com_cl(self, dia=None):
+        """(line_c, cl) vistos hoje (equivale ao SELECT DISTINCT line_c, cl de sptrans_linhas)"""
+        rows = self._conn.execute("SELECT line_c, cl FROM linhas_cl WHERE dia = ? ORDER BY line_c, cl", (dia or _hoje(),))
+        return [(r[0], r[1]) for r in rows]
@@ -1,20 +1,134 @@
 # core/load_job.py
+import io
 import json
 import tempfile
+import time
 import os
+from datetime import datetime, timezone
 from google.cloud import bigquery
 
-def load_json_to_bigquery(client, table_id, rows, mode='append'):
-    """LOAD JOB via JSON temporário (FREE TIER)"""
-    if not rows:
+try:
+    import orjson  # Encoder rápido (opcional)
+except ImportError:
+    orjson = None
+
+try:
+    import pyarrow as pa  # Formato colunar Parquet (opcional)
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# === STREAMING NDJSON ===
+ENCODE_BATCH_SIZE = 5000               # Linhas codificadas por lote
+SPOOL_MAX_BYTES = 64 * 1024 * 1024     # Acima disso o buffer transborda para disco
+
+
+class LoadSpool:
+    """Buffer binário em memória que transborda para disco acima de max_bytes."""
+
+    def __init__(self, max_bytes=SPOOL_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._buf = io.BytesIO()
+
+    @property
+    def on_disk(self):
+        return not isinstance(self._buf, io.BytesIO)
+
+    @property
+    def closed(self):
+        return self._buf.closed
+
+    def tell(self):
+        return self._buf.tell()
+
+    def flush(self):
+        self._buf.flush()
+
+    def write(self, data):
+        self._buf.write(data)
+        self.nbytes += len(data)
+        if not self.on_disk and self.nbytes > self.max_bytes:
+            disk = tempfile.TemporaryFile()  # Anônimo: some sozinho ao fechar
+            with self._buf.getbuffer() as view:
+                disk.write(view)
+            self._buf = disk
+
+    def rewind(self):
+        """Volta ao início e devolve o próprio arquivo (sem cópia) para upload"""
+        self._buf.seek(0)
+        return self._buf
+
+    def close(self):
+        self._buf.close()
+
+
+def num_rows(rows):
+    """Nº de linhas de uma lista de dicts ou de um dict de colunas"""
+    if isinstance(rows, dict):
+        return len(next(iter(rows.values()), ()))
+    return len(rows)
+
+
+def columns_to_rows(columns):
+    """Dict de colunas (ex.: core/flatten_posicao.py) → lista de dicts; NaN vira None"""
+    values = []
+    for col in columns.values():
+        if getattr(col, 'dtype', None) is not None and col.dtype.kind == 'f':
+            obj = col.astype(object)
+            obj[col != col] = None  # NaN
+            col = obj
+        values.append(col.tolist() if hasattr(col, 'tolist') else list(col))
+    names = list(columns)
+    return [dict(zip(names, vals)) for vals in zip(*values)]
+
+
+def _encode_batch(batch):
+    if orjson is not None:
+        return b"\n".join([orjson.dumps(row, option=orjson.OPT_SERIALIZE_NUMPY) for row in batch]) + b"\n"
+    return ("\n".join([json.dumps(row, ensure_ascii=False) for row in batch]) + "\n").encode('utf-8')
+
+
+def encode_ndjson(rows, batch_size=ENCODE_BATCH_SIZE, max_bytes=SPOOL_MAX_BYTES):
+    """Codifica rows em NDJSON por lotes num LoadSpool. Retorna (spool, segundos)"""
+    t0 = time.perf_counter()
+    spool = LoadSpool(max_bytes=max_bytes)
+    for i in range(0, len(rows), batch_size):
+        spool.write(_encode_batch(rows[i:i + batch_size]))
+    return spool, time.perf_counter() - t0
+
+
+def _load_stats(rows, nbytes, encode_s, load_s, spilled, error=None):
+    return {
+        "rows": num_rows(rows),
+        "bytes": nbytes,
+        "encode_s": encode_s,
+        "load_s": load_s,
+        "spilled": spilled,
+        "error": error,
+    }
+
+
+def load_json_to_bigquery(client, table_id, rows, mode='append', streaming=True,
+                          source_format='ndjson', schema=None):
+    """LOAD JOB via NDJSON (FREE TIER).
+
+    streaming=True codifica em lotes num buffer em memória (transborda para disco
+    acima de SPOOL_MAX_BYTES) entregue direto ao load_table_from_file.
+    streaming=False mantém o caminho antigo (json.dumps por linha + arquivo temporário).
+    source_format='parquet' (exige schema) carrega via Arrow/Parquet.
+    rows pode ser lista de dicts ou dict de colunas (core/flatten_posicao.py).
+    Retorna um dict com linhas, bytes, tempo de encode e de load.
+    """
+    if not num_rows(rows):
         print("Nenhum dado para load.")
-        return
+        return None
 
-    # JSON temporário (NDJSON)
-    with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.json', encoding='utf-8') as f:
-        for row in rows:
-            f.write(json.dumps(row, ensure_ascii=False) + '\n')
-        temp_path = f.name
+    if source_format == 'parquet':
+        return load_parquet_to_bigquery(client, table_id, rows, schema, mode=mode)
+    if isinstance(rows, dict):
+        rows = columns_to_rows(rows)
 
     # Config
     job_config = bigquery.LoadJobConfig(
@@ -23,13 +137,162 @@ def load_json_to_bigquery(client, table_id, rows, mode='append'):
         autodetect=False  # Usa schema da tabela
     )
 
+    if streaming:
+        return _load_streaming(client, table_id, rows, mode, job_config)
+    return _load_tempfile(client, table_id, rows, mode, job_config)
+
+
+def _load_streaming(client, table_id, rows, mode, job_config):
+    spool, encode_s = encode_ndjson(rows)
+    stats = None
+    t0 = time.perf_counter()
+    try:
+        job = client.load_table_from_file(spool.rewind(), table_id, job_config=job_config, size=spool.nbytes)
+        job.result()  # Espera
+        stats = _load_stats(rows, spool.nbytes, encode_s, time.perf_counter() - t0, spool.on_disk)
+        print(f"LOAD JOB: {num_rows(rows)} linhas em {table_id} ({mode}) | "
+              f"{spool.nbytes / 1e6:.2f} MB | encode {encode_s * 1000:.0f} ms | load {stats['load_s']:.1f}s")
+    except Exception as e:
+        stats = _load_stats(rows, spool.nbytes, encode_s, time.perf_counter() - t0, spool.on_disk, str(e))
+        print(f"Erro LOAD JOB: {e}")
+    finally:
+        spool.close()
+    return stats
+
+
+def _load_tempfile(client, table_id, rows, mode, job_config):
+    # JSON temporário (NDJSON)
+    t0 = time.perf_counter()
+    with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.json', encoding='utf-8') as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False) + '\n')
+        temp_path = f.name
+    encode_s = time.perf_counter() - t0
+    nbytes = os.path.getsize(temp_path)
+
     # Executa
+    stats = None
+    t0 = time.perf_counter()
     try:
         with open(temp_path, 'rb') as f:
             job = client.load_table_from_file(f, table_id, job_config=job_config)
         job.result()  # Espera
-        print(f"LOAD JOB: {len(rows)} linhas em {table_id} ({mode})")
+        stats = _load_stats(rows, nbytes, encode_s, time.perf_counter() - t0, True)
+        print(f"LOAD JOB: {num_rows(rows)} linhas em {table_id} ({mode}) | "
+              f"{nbytes / 1e6:.2f} MB | encode {encode_s * 1000:.0f} ms | load {stats['load_s']:.1f}s")
     except Exception as e:
+        stats = _load_stats(rows, nbytes, encode_s, time.perf_counter() - t0, True, str(e))
         print(f"Erro LOAD JOB: {e}")
     finally:
-        os.unlink(temp_path)  # Delete temp
\ No newline at end of file
+        os.unlink(temp_path)  # Delete temp
+    return stats
+
+
+# === PARQUET / ARROW ===
+def _arrow_type(field_type):
+    return {
+        "STRING": pa.string(),
+        "GEOGRAPHY": pa.string(),  # WKT
+        "INTEGER": pa.int64(),
+        "INT64": pa.int64(),
+        "FLOAT": pa.float64(),
+        "FLOAT64": pa.float64(),
+        "BOOL": pa.bool_(),
+        "BOOLEAN": pa.bool_(),
+        "TIMESTAMP": pa.timestamp('us', tz='UTC'),
+        "DATE": pa.date32(),
+    }[field_type.upper()]
+
+
+def arrow_schema(schema):
+    """Converte lista de SchemaField (core/schemas.py) em pa.Schema"""
+    return pa.schema([pa.field(f.name, _arrow_type(f.field_type)) for f in schema])
+
+
+def _arrow_column(values, field_type, arrow_type):
+    field_type = field_type.upper()
+    if getattr(values, 'dtype', None) is not None:
+        if values.dtype.kind in 'fiub':
+            return pa.array(values, type=arrow_type, from_pandas=True)  # NaN vira null
+        values = values.tolist()
+    if field_type in ("STRING", "GEOGRAPHY"):
+        # API devolve alguns códigos como int (ex.: vehicle_p)
+        values = [v if v is None or isinstance(v, str) else str(v) for v in values]
+    elif field_type in ("TIMESTAMP", "DATE") and any(isinstance(v, str) for v in values):
+        return pa.array(values, type=pa.string()).cast(arrow_type)
+    return pa.array(values, type=arrow_type)
+
+
+def rows_to_record_batch(rows, schema):
+    """Monta um pa.RecordBatch tipado direto dos dicts (sem DataFrame)"""
+    pa_schema = arrow_schema(schema)
+    arrays = [
+        _arrow_column([row.get(f.name) for row in rows], f.field_type, pa_schema.field(f.name).type)
+        for f in schema
+    ]
+    return pa.RecordBatch.from_arrays(arrays, schema=pa_schema)
+
+
+def columns_to_record_batch(columns, schema):
+    """Monta um pa.RecordBatch tipado a partir de um dict de colunas (coluna ausente vira null)"""
+    pa_schema = arrow_schema(schema)
+    n = num_rows(columns)
+    arrays = [
+        _arrow_column(columns[f.name], f.field_type, pa_schema.field(f.name).type) if f.name in columns
+        else pa.nulls(n, type=pa_schema.field(f.name).type)
+        for f in schema
+    ]
+    return pa.RecordBatch.from_arrays(arrays, schema=pa_schema)
+
+
+def encode_parquet(rows, schema, batch_size=ENCODE_BATCH_SIZE, max_bytes=SPOOL_MAX_BYTES):
+    """Escreve rows (dicts ou colunas) como Parquet (snappy) num LoadSpool. Retorna (spool, segundos)"""
+    if pa is None:
+        raise ImportError("pyarrow não instalado: pip install pyarrow")
+    t0 = time.perf_counter()
+    spool = LoadSpool(max_bytes=max_bytes)
+    with pq.ParquetWriter(spool, arrow_schema(schema), compression='snappy') as writer:
+        for i in range(0, num_rows(rows), batch_size):
+            if isinstance(rows, dict):
+                batch = columns_to_record_batch({k: v[i:i + batch_size] for k, v in rows.items()}, schema)
+            else:
+                batch = rows_to_record_batch(rows[i:i + batch_size], schema)
+            writer.write_batch(batch)
+    return spool, time.perf_counter() - t0
+
+
+def load_parquet_to_bigquery(client, table_id, rows, schema, mode='append'):
+    """LOAD JOB via Parquet montado com Arrow a partir do schema da tabela"""
+    if not num_rows(rows):
+        print("Nenhum dado para load.")
+        return None
+    if schema is None:
+        raise ValueError("source_format='parquet' exige o schema da tabela (core/schemas.py)")
+
+    job_config = bigquery.LoadJobConfig(
+        source_format=bigquery.SourceFormat.PARQUET,
+        write_disposition='WRITE_APPEND' if mode == 'append' else 'WRITE_TRUNCATE',
+    )
+
+    spool, encode_s = encode_parquet(rows, schema)
+    stats = None
+    t0 = time.perf_counter()
+    try:
+        job = client.load_table_from_file(spool.rewind(), table_id, job_config=job_config, size=spool.nbytes)
+        job.result()  # Espera
+        stats = _load_stats(rows, spool.nbytes, encode_s, time.perf_counter() - t0, spool.on_disk)
+        print(f"LOAD JOB PARQUET: {num_rows(rows)} linhas em {table_id} ({mode}) | "
+              f"{spool.nbytes / 1e6:.2f} MB | encode {encode_s * 1000:.0f} ms | load {stats['load_s']:.1f}s")
+    except Exception as e:
+        stats = _load_stats(rows, spool.nbytes, encode_s, time.perf_counter() - t0, spool.on_disk, str(e))
+        print(f"Erro LOAD JOB PARQUET: {e}")
+    finally:
+        spool.close()
+    return stats
+
+
+# === PARTIÇÕES ===
+def partition_table_id(table_id, day=None):
+    """table_id$YYYYMMDD: WRITE_TRUNCATE substitui só a partição do dia (UTC)"""
+    day = day or datetime.now(timezone.utc).date()
+    return f"{table_id}${day:%Y%m%d}"
@@ -0,0 +1,187 @@
+# core/map_match.py
+import numpy as np
+
+from core.geo import LocalProjection, haversine_m
+from core.simplify import douglas_peucker_runs
+
+DEFAULT_CELL_M = 200.0
+DEFAULT_MAX_SNAP_M = 150.0
+DEFAULT_SIMPLIFY_M = 2.0
+N_DIRECTIONS = 2  # direction_id 0/1 (GTFS) == sl 1/2 (Olho Vivo)
+
+
+def sl_to_direction(line_sl):
+    """line_sl do Olho Vivo (1 = ida, 2 = volta) → direction_id GTFS (0/1); -1 se ausente"""
+    return np.fromiter((s - 1 if s in (1, 2) else -1 for s in line_sl), dtype=np.int64, count=len(line_sl))
+
+
+def _point_segment(px, py, ax, ay, bx, by):
+    """(distância ao segmento, fração t em [0, 1] do pé da perpendicular), vetorizado"""
+    dx, dy = bx - ax, by - ay
+    seg2 = dx * dx + dy * dy
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.where(seg2 > 0, ((px - ax) * dx + (py - ay) * dy) / seg2, 0.0)
+    t = np.clip(t, 0.0, 1.0)
+    return np.hypot(px - (ax + t * dx), py - (ay + t * dy)), t
+
+
+class ShapeMatcher:
+    """Map-matching em lote das posições sobre os shapes GTFS do store (core/gtfs_store.py).
+
+    Cada (rota, sentido) vira um grupo com os segmentos de todos os shapes das suas
+    viagens (trips.txt). Os shapes são simplificados (Douglas–Peucker, simplify_m) e
+    cada segmento é registrado nas células da grade cobertas pela sua caixa expandida
+    em max_snap_m: uma posição só precisa olhar a própria célula do seu grupo para
+    achar todos os segmentos a menos de max_snap_m. A distância ao longo do shape
+    usa o comprimento acumulado do traçado original (haversine).
+    """
+
+    def __init__(self, store, cell_m=DEFAULT_CELL_M, max_snap_m=DEFAULT_MAX_SNAP_M, simplify_m=DEFAULT_SIMPLIFY_M):
+        if not store.has_shapes:
+            raise LookupError("Store GTFS sem shapes.txt")
+        self.store = store
+        self.cell_m = float(cell_m)
+        self.max_snap_m = float(max_snap_m)
+        a = store.a
+        pt_shape = np.asarray(a['shape_pt_shape'], dtype=np.int64)
+        lat, lon = np.asarray(a['shape_pt_lat']), np.asarray(a['shape_pt_lon'])
+        self.projection = LocalProjection(lat.mean(), lon.mean())
+        x, y = self.projection.to_xy(lat, lon)
+
+        # Comprimento acumulado por shape (zera na primeira amostra de cada shape)
+        self.shape_sid, start = np.unique(pt_shape, return_index=True)
+        end = np.append(start[1:], len(pt_shape))
+        step = np.zeros(len(pt_shape))
+        step[1:] = haversine_m(lat[:-1], lon[:-1], lat[1:], lon[1:])
+        step[start] = 0.0
+        cum = np.cumsum(step)
+        cum -= np.repeat(cum[start], end - start)
+        self.shape_length_m = cum[end - 1] if len(end) else np.empty(0)
+
+        # Segmentos dos shapes simplificados, contíguos por shape (CSR em seg_off)
+        keep = douglas_peucker_runs(x, y, start, end, simplify_m) if simplify_m else np.ones(len(x), dtype=bool)
+        kept = np.flatnonzero(keep)
+        same = pt_shape[kept[:-1]] == pt_shape[kept[1:]]
+        ia, ib = kept[:-1][same], kept[1:][same]
+        self.seg_ax, self.seg_ay, self.seg_bx, self.seg_by = x[ia], y[ia], x[ib], y[ib]
+        self.seg_cum_a, self.seg_cum_b = cum[ia], cum[ib]
+        self.seg_shape = np.searchsorted(self.shape_sid, pt_shape[ia])  # posição em shape_sid
+        seg_off = np.searchsorted(self.seg_shape, np.arange(len(self.shape_sid) + 1))
+
+        # (rota, sentido) → shapes das viagens; direction_id ausente vale para os dois sentidos
+        trip_shape = np.asarray(a['trip_shape_id'], dtype=np.int64)
+        shape_pos = np.minimum(np.searchsorted(self.shape_sid, trip_shape), max(len(self.shape_sid) - 1, 0))
+        has_shape = (len(self.shape_sid) > 0) & (self.shape_sid[shape_pos] == trip_shape)
+        route = np.asarray(a['trip_route'], dtype=np.int64)[has_shape]
+        direction = np.asarray(a['trip_direction'], dtype=np.int64)[has_shape]
+        shape_pos = shape_pos[has_shape]
+        both = direction < 0
+        groups = np.concatenate([route[~both] * N_DIRECTIONS + direction[~both],
+                                 route[both] * N_DIRECTIONS, route[both] * N_DIRECTIONS + 1])
+        shapes = np.concatenate([shape_pos[~both], shape_pos[both], shape_pos[both]])
+        n_shapes = max(len(self.shape_sid), 1)
+        pairs = np.unique(groups * n_shapes + shapes)
+        pair_group, pair_shape = pairs // n_shapes, pairs % n_shapes
+        self.n_groups = len(a['route_id']) * N_DIRECTIONS
+
+        # Entradas (grupo, segmento): todos os segmentos de cada shape do grupo
+        counts = seg_off[pair_shape + 1] - seg_off[pair_shape]
+        entry_group = np.repeat(pair_group, counts)
+        entry_seg = np.repeat(seg_off[pair_shape] - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())
+
+        # Caixa de cada segmento expandida em max_snap_m → intervalo de células
+        r = self.max_snap_m
+        self.x0 = float(x.min()) - r if len(x) else 0.0
+        self.y0 = float(y.min()) - r if len(y) else 0.0
+        self.nx = int((float(x.max()) + r - self.x0) // self.cell_m) + 1 if len(x) else 1
+        self.ny = int((float(y.max()) + r - self.y0) // self.cell_m) + 1 if len(y) else 1
+        ax, ay = self.seg_ax[entry_seg], self.seg_ay[entry_seg]
+        bx, by = self.seg_bx[entry_seg], self.seg_by[entry_seg]
+        cx0 = np.floor((np.minimum(ax, bx) - r - self.x0) / self.cell_m).astype(np.int64)
+        cx1 = np.floor((np.maximum(ax, bx) + r - self.x0) / self.cell_m).astype(np.int64)
+        cy0 = np.floor((np.minimum(ay, by) - r - self.y0) / self.cell_m).astype(np.int64)
+        cy1 = np.floor((np.maximum(ay, by) + r - self.y0) / self.cell_m).astype(np.int64)
+        ncy = cy1 - cy0 + 1
+        ncells = (cx1 - cx0 + 1) * ncy
+        rep = np.repeat(np.arange(len(entry_seg)), ncells)
+        local = np.arange(ncells.sum()) - np.repeat(np.cumsum(ncells) - ncells, ncells)
+        cx = cx0[rep] + local // ncy[rep]
+        cy = cy0[rep] + local % ncy[rep]
+        keys = (entry_group[rep] * self.nx + cx) * self.ny + cy
+        order = np.argsort(keys, kind='stable')
+        self._seg = entry_seg[rep][order]
+        self._cells, self._start = np.unique(keys[order], return_index=True)
+        self._end = np.append(self._start[1:], len(order))
+
+    def __len__(self):
+        return len(self.seg_ax)
+
+    def group_of(self, route_idx, direction):
+        """Grupo (rota, sentido) de cada posição; -1 se a rota ou o sentido são desconhecidos"""
+        route_idx = np.asarray(route_idx, dtype=np.int64)
+        direction = np.asarray(direction, dtype=np.int64)
+        ok = (route_idx >= 0) & (direction >= 0) & (direction < N_DIRECTIONS)
+        return np.where(ok, route_idx * N_DIRECTIONS + direction, -1)
+
+    def match(self, lat, lon, route_idx, direction):
+        """Projeta cada posição no shape mais próximo da sua (rota, sentido).
+
+        Devolve (id de string do shape ou -1, distância ao longo do shape em metros,
+        distância da posição ao shape em metros); NaN sem shape a até max_snap_m.
+        """
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        n = len(lat)
+        shape = np.full(n, -1, dtype=np.int64)
+        along = np.full(n, np.nan)
+        snap = np.full(n, np.nan)
+        if n == 0 or len(self._cells) == 0:
+            return shape, along, snap
+
+        qx, qy = self.projection.to_xy(lat, lon)
+        group = self.group_of(route_idx, direction)
+        valid = np.isfinite(qx) & np.isfinite(qy) & (group >= 0) & (group < self.n_groups)
+        cx = np.floor((qx - self.x0) / self.cell_m)
+        cy = np.floor((qy - self.y0) / self.cell_m)
+        valid &= (cx >= 0) & (cx < self.nx) & (cy >= 0) & (cy < self.ny)
+        q = np.flatnonzero(valid)
+        keys = (group[q] * self.nx + cx[q].astype(np.int64)) * self.ny + cy[q].astype(np.int64)
+        pos = np.minimum(np.searchsorted(self._cells, keys), len(self._cells) - 1)
+        hit = self._cells[pos] == keys
+        q, pos = q[hit], pos[hit]
+        counts = self._end[pos] - self._start[pos]
+        total = int(counts.sum())
+        if total == 0:
+            return shape, along, snap
+
+        # Pares (posição, segmento candidato) sem loop Python
+        cq = np.repeat(q, counts)
+        seg = self._seg[np.repeat(self._start[pos] - (np.cumsum(counts) - counts), counts) + np.arange(total)]
+        d, t = _point_segment(qx[cq], qy[cq], self.seg_ax[seg], self.seg_ay[seg], self.seg_bx[seg], self.seg_by[seg])
+        best_d = np.full(n, np.inf)
+        np.minimum.at(best_d, cq, d)
+        win = np.flatnonzero(d == best_d[cq])
+        # Empate (vértice comum a dois segmentos): fica o primeiro
+        win = win[np.unique(cq[win], return_index=True)[1]]
+        wq, wseg, wt = cq[win], seg[win], t[win]
+
+        sx = self.seg_ax[wseg] + wt * (self.seg_bx[wseg] - self.seg_ax[wseg])
+        sy = self.seg_ay[wseg] + wt * (self.seg_by[wseg] - self.seg_ay[wseg])
+        s_lat, s_lon = self.projection.to_latlon(sx, sy)
+        dist = haversine_m(lat[wq], lon[wq], s_lat, s_lon)
+        ok = dist <= self.max_snap_m
+        wq, wseg, wt = wq[ok], wseg[ok], wt[ok]
+        shape[wq] = self.shape_sid[self.seg_shape[wseg]]
+        along[wq] = self.seg_cum_a[wseg] + wt * (self.seg_cum_b[wseg] - self.seg_cum_a[wseg])
+        snap[wq] = dist[ok]
+        return shape, along, snap
+
+    def shape_ids(self, shape):
+        """ids de string (match) → shape_id (object, None se -1), decodificando cada id uma vez"""
+        out = np.full(len(shape), None, dtype=object)
+        found = shape >= 0
+        if found.any():
+            uniq, inv = np.unique(shape[found], return_inverse=True)
+            out[found] = np.array([self.store.strings[int(s)] for s in uniq], dtype=object)[inv]
+        return out
+
@@ -0,0 +1,358 @@
+# core/metrics.py
+import bisect
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Limites (s) dos histogramas: de 5 ms (etapas numpy) a 5 min (LOAD JOB GTFS)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+METRIC_HELP = {
+    "sptrans_cycle_duration_seconds": ("histogram", "Duração de um ciclo completo da pipeline"),
+    "sptrans_cycles_total": ("counter", "Ciclos executados por resultado (ok/error)"),
+    "sptrans_last_cycle_timestamp_seconds": ("gauge", "Fim do último ciclo (epoch)"),
+    "sptrans_stage_duration_seconds": ("histogram", "Duração de uma etapa do ciclo"),
+    "sptrans_stage_rows_total": ("counter", "Linhas processadas pela etapa"),
+    "sptrans_stage_bytes_total": ("counter", "Bytes processados pela etapa"),
+    "sptrans_api_calls_total": ("counter", "Chamadas à API Olho Vivo por endpoint e status HTTP"),
+    "sptrans_api_duration_seconds": ("histogram", "Duração de uma chamada à API Olho Vivo"),
+    "sptrans_api_bytes_total": ("counter", "Bytes de resposta da API Olho Vivo (descomprimidos)"),
+    "sptrans_api_wire_bytes_total": ("counter", "Bytes de resposta recebidos pela rede (gzip/deflate)"),
+    "sptrans_api_decode_seconds": ("histogram", "Tempo de decode do JSON de uma resposta"),
+    "sptrans_api_retries_total": ("counter", "Retries de chamadas à API por motivo (inclui budget_exhausted)"),
+    "sptrans_poll_interval_seconds": ("gauge", "Intervalo de polling atual (cadência adaptativa)"),
+    "sptrans_poll_advance_ratio": ("gauge", "Fração dos veículos conhecidos com vehicle_ta novo no último snapshot"),
+}
+
+# Ciclo em andamento na thread/contexto atual (cada job do Scheduler roda na sua thread)
+_current = contextvars.ContextVar("sptrans_metrics_cycle", default=None)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels, extra=None):
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+def _number(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Stage:
+    """Amostra de uma etapa aberta com Cycle.stage(); rows/nbytes podem ser preenchidos dentro do bloco"""
+
+    __slots__ = ("name", "rows", "nbytes", "seconds")
+
+    def __init__(self, name, rows=None, nbytes=None):
+        self.name = name
+        self.rows = rows
+        self.nbytes = nbytes
+        self.seconds = 0.0
+
+
+class Cycle:
+    """Etapas (tempo, linhas, bytes) e chamadas à API de um ciclo de pipeline.
+
+    Uso: `with metrics.cycle("posicoes") as cycle:`; dentro dele, stage() e
+    current_cycle() em qualquer função chamada na mesma thread gravam neste ciclo.
+    Cada amostra também vai para os totais do Metrics; ao sair, o resumo do ciclo
+    vira uma linha do JSONL.
+    """
+
+    def __init__(self, metrics, pipeline):
+        self.metrics = metrics
+        self.pipeline = pipeline
+        self.stages = {}
+        self.api = {}
+        self.notes = {}
+        self.error = None
+        self._lock = threading.Lock()
+        self._token = None
+        self._t0 = None
+        self._started = None
+
+    def __enter__(self):
+        self._started = time.time()
+        self._t0 = time.perf_counter()
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        if exc is not None and self.error is None:
+            self.error = str(exc)
+        self.metrics.finish_cycle(self, time.perf_counter() - self._t0)
+        return False
+
+    @contextmanager
+    def stage(self, name, rows=None, nbytes=None):
+        sample = Stage(name, rows, nbytes)
+        t0 = time.perf_counter()
+        try:
+            yield sample
+        finally:
+            sample.seconds = time.perf_counter() - t0
+            self.record(name, sample.seconds, sample.rows, sample.nbytes)
+
+    def record(self, name, seconds=None, rows=None, nbytes=None):
+        """Soma uma amostra na etapa (várias chamadas no mesmo ciclo acumulam)"""
+        with self._lock:
+            entry = self.stages.setdefault(name, {"s": 0.0, "n": 0, "rows": None, "bytes": None})
+            entry["n"] += 1
+            if seconds is not None:
+                entry["s"] += seconds
+            if rows is not None:
+                entry["rows"] = (entry["rows"] or 0) + int(rows)
+            if nbytes is not None:
+                entry["bytes"] = (entry["bytes"] or 0) + int(nbytes)
+        self.metrics.record_stage(self.pipeline, name, seconds, rows, nbytes)
+
+    def record_load(self, stats, stage="load"):
+        """Stats de load_json_to_bigquery: encode (linhas, bytes) e upload + job.result()"""
+        if not stats:
+            return
+        self.record(f"{stage}.encode", stats.get('encode_s'), stats.get('rows'), stats.get('bytes'))
+        self.record(f"{stage}.job", stats.get('load_s'))
+
+    def _api_entry(self, endpoint):
+        return self.api.setdefault(endpoint, {"calls": 0, "errors": 0, "s": 0.0, "bytes": 0, "wire_bytes": 0,
+                                              "decode_s": 0.0})
+
+    def record_api(self, endpoint, status, seconds, nbytes=0, wire_bytes=None):
+        with self._lock:
+            entry = self._api_entry(endpoint)
+            entry["calls"] += 1
+            entry["errors"] += status != 200
+            entry["s"] += seconds
+            entry["bytes"] += nbytes or 0
+            entry["wire_bytes"] += wire_bytes if wire_bytes is not None else nbytes or 0
+
+    def record_decode(self, endpoint, seconds):
+        with self._lock:
+            self._api_entry(endpoint)["decode_s"] += seconds
+
+    def note(self, key, value):
+        """Valor livre (JSON) anexado ao resumo do ciclo, ex.: decisão de cadência"""
+        with self._lock:
+            self.notes[key] = value
+
+    def fail(self, error):
+        self.error = str(error)
+
+    def summary(self, duration_s):
+        return {
+            "ts": datetime.fromtimestamp(self._started, timezone.utc).isoformat(),
+            "pipeline": self.pipeline,
+            "duration_s": round(duration_s, 6),
+            "outcome": "error" if self.error else "ok",
+            "error": self.error,
+            "stages": {name: dict(s, s=round(s["s"], 6)) for name, s in self.stages.items()},
+            "api": {name: dict(a, s=round(a["s"], 6), decode_s=round(a["decode_s"], 6)) for name, a in self.api.items()},
+            **({"notes": self.notes} if self.notes else {}),
+        }
+
+
+class _NullCycle(Cycle):
+    """Fora de um ciclo (ex.: flush no Ctrl+C, replay): amostras descartadas"""
+
+    def __init__(self):
+        super().__init__(None, None)
+
+    def record(self, name, seconds=None, rows=None, nbytes=None):
+        pass
+
+    def record_api(self, endpoint, status, seconds, nbytes=0, wire_bytes=None):
+        pass
+
+    def record_decode(self, endpoint, seconds):
+        pass
+
+    def note(self, key, value):
+        pass
+
+
+NULL_CYCLE = _NullCycle()
+
+
+def current_cycle():
+    """Ciclo aberto no contexto atual ou NULL_CYCLE (grava nada)"""
+    return _current.get() or NULL_CYCLE
+
+
+def stage(name, rows=None, nbytes=None):
+    """Atalho: current_cycle().stage(...) para funções chamadas dentro de um ciclo"""
+    return current_cycle().stage(name, rows, nbytes)
+
+
+def run_in_context(fn):
+    """Envolve fn para rodar com o contexto (ciclo atual) de quem chamou, ex.: em ThreadPoolExecutor"""
+    ctx = contextvars.copy_context()
+    return lambda *args, **kwargs: ctx.copy().run(fn, *args, **kwargs)
+
+
+class Metrics:
+    """Métricas em processo: contadores/histogramas por labels, texto Prometheus e JSONL.
+
+    O caminho quente só faz soma em dicts sob um lock (alguns µs por etapa). A saída é
+    servida sob demanda em /metrics (start_server) e um resumo por ciclo vai para um
+    JSONL com rotação por tamanho (jsonl_max_bytes, jsonl_backups arquivos antigos).
+    """
+
+    def __init__(self, jsonl_path=None, jsonl_max_bytes=10 * 1024 * 1024, jsonl_backups=5,
+                 port=None, host="127.0.0.1", buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.port = port
+        self.host = host
+        self._lock = threading.Lock()
+        self._values = {}      # (nome, labels) → valor (counter/gauge)
+        self._histograms = {}  # (nome, labels) → [contagem por bucket..., +Inf, soma]
+        self._server = None
+        self._jsonl = None
+        if jsonl_path:
+            os.makedirs(os.path.dirname(jsonl_path) or '.', exist_ok=True)
+            self._jsonl = logging.getLogger(f"sptrans.metrics.{jsonl_path}")
+            self._jsonl.propagate = False
+            self._jsonl.setLevel(logging.INFO)
+            if not self._jsonl.handlers:
+                handler = logging.handlers.RotatingFileHandler(
+                    jsonl_path, maxBytes=jsonl_max_bytes, backupCount=jsonl_backups, encoding='utf-8'
+                )
+                handler.setFormatter(logging.Formatter('%(message)s'))
+                self._jsonl.addHandler(handler)
+
+    # === PRIMITIVAS ===
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._values[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            hist[i] += 1
+            hist[-1] += value
+
+    def value(self, name, **labels):
+        return self._values.get((name, tuple(sorted(labels.items()))), 0)
+
+    # === CICLOS, ETAPAS E API ===
+    def cycle(self, pipeline):
+        return Cycle(self, pipeline)
+
+    def record_stage(self, pipeline, name, seconds=None, rows=None, nbytes=None):
+        if seconds is not None:
+            self.observe("sptrans_stage_duration_seconds", seconds, pipeline=pipeline, stage=name)
+        if rows is not None:
+            self.inc("sptrans_stage_rows_total", int(rows), pipeline=pipeline, stage=name)
+        if nbytes is not None:
+            self.inc("sptrans_stage_bytes_total", int(nbytes), pipeline=pipeline, stage=name)
+
+    def record_api(self, endpoint, status, seconds, nbytes=0, wire_bytes=None):
+        """Uma chamada HTTP à API (status 0 = exceção de rede/timeout); wire_bytes = tamanho comprimido"""
+        self.inc("sptrans_api_calls_total", endpoint=endpoint, status=str(status))
+        self.observe("sptrans_api_duration_seconds", seconds, endpoint=endpoint)
+        if nbytes:
+            self.inc("sptrans_api_bytes_total", nbytes, endpoint=endpoint)
+            self.inc("sptrans_api_wire_bytes_total", wire_bytes if wire_bytes is not None else nbytes, endpoint=endpoint)
+        current_cycle().record_api(endpoint, status, seconds, nbytes, wire_bytes)
+
+    def record_decode(self, endpoint, seconds, nbytes=0):
+        """Tempo de decode do JSON de uma resposta (SPTransClient.loads)"""
+        self.observe("sptrans_api_decode_seconds", seconds, endpoint=endpoint)
+        current_cycle().record_decode(endpoint, seconds)
+
+    def finish_cycle(self, cycle, duration_s):
+        outcome = "error" if cycle.error else "ok"
+        self.observe("sptrans_cycle_duration_seconds", duration_s, pipeline=cycle.pipeline)
+        self.inc("sptrans_cycles_total", pipeline=cycle.pipeline, outcome=outcome)
+        self.set("sptrans_last_cycle_timestamp_seconds", time.time(), pipeline=cycle.pipeline)
+        if self._jsonl is not None:
+            try:
+                self._jsonl.info(json.dumps(cycle.summary(duration_s), ensure_ascii=False))
+            except Exception as e:
+                logging.error(f"Erro ao gravar métricas em JSONL: {e}")
+
+    # === EXPORTAÇÃO ===
+    def render(self):
+        """Estado atual no formato texto do Prometheus (0.0.4)"""
+        with self._lock:
+            values = sorted(self._values.items())
+            histograms = sorted((k, list(v)) for k, v in self._histograms.items())
+        by_name = {}
+        for (name, labels), value in values:
+            by_name.setdefault(name, []).append(f"{name}{_labels(labels)} {_number(value)}")
+        for (name, labels), hist in histograms:
+            lines = by_name.setdefault(name, [])
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), hist[:-1]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels, ('le', _number(bound)))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(hist[-1])}")
+            lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+        out = []
+        for name in sorted(by_name):
+            kind, help_text = METRIC_HELP.get(name, ("untyped", name))
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+            out.extend(by_name[name])
+        return "\n".join(out) + "\n"
+
+    def start_server(self, port=None, host=None):
+        """Serve /metrics numa thread daemon; port 0/None desliga. Porta ocupada só gera aviso"""
+        port = self.port if port is None else port
+        if not port or self._server is not None:
+            return self._server
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/metrics', '/'):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        try:
+            self._server = ThreadingHTTPServer((host or self.host, port), Handler)
+        except OSError as e:
+            logging.warning(f"Endpoint de métricas não iniciado em {host or self.host}:{port}: {e}")
+            return None
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="metrics", daemon=True).start()
+        logging.info(f"Métricas Prometheus em http://{host or self.host}:{self._server.server_address[1]}/metrics")
+        return self._server
+
+    def stop_server(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
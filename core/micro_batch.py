@@ -0,0 +1,156 @@
+# core/micro_batch.py
+import glob
+import json
+import logging
+import os
+import time
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+
+def _loads(raw):
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def concat_columns(batches):
+    """Concatena uma lista de dicts de colunas; coluna ausente num lote (ex.: spool antigo) vira None"""
+    if len(batches) == 1:
+        return batches[0]
+    names = list(dict.fromkeys(name for b in batches for name in b))
+
+    def column(b, name):
+        if name in b:
+            return b[name]
+        return np.full(len(next(iter(b.values()))), None, dtype=object)
+
+    return {name: np.concatenate([column(b, name) for b in batches]) for name in names}
+
+
+class MicroBatchBuffer:
+    """Acumula snapshots (dicts de colunas) e descarrega num único LOAD JOB.
+
+    Cada snapshot é gravado no spool local (um arquivo JSON por snapshot, fsync +
+    rename atômico) antes de entrar no buffer; os arquivos só são apagados depois
+    que flush_fn confirma o load. Na inicialização, snapshots que sobraram no spool
+    (crash, Ctrl+C sem flush) são recarregados e entram no próximo flush.
+    """
+
+    def __init__(self, spool_dir, flush_fn, max_rows=150000, max_age_s=300):
+        self.spool_dir = spool_dir
+        self.flush_fn = flush_fn  # recebe dict de colunas, devolve stats de load_json_to_bigquery
+        self.max_rows = max_rows
+        self.max_age_s = max_age_s
+        self._batches = []   # [(timestamp, colunas, caminho_spool)]
+        self.rows = 0
+        os.makedirs(spool_dir, exist_ok=True)
+        self._recover()
+
+    # === SPOOL ===
+    def _spool_write(self, ts, columns):
+        path = os.path.join(self.spool_dir, f"{int(ts * 1e6)}.json")
+        payload = {
+            "dtypes": {k: v.dtype.str for k, v in columns.items()},
+            "columns": {k: v.tolist() for k, v in columns.items()},
+        }
+        tmp = path + ".tmp"
+        with open(tmp, 'wb') as f:
+            f.write(_dumps(payload))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        return path
+
+    def _spool_read(self, path):
+        with open(path, 'rb') as f:
+            payload = _loads(f.read())
+        columns = {}
+        for name, values in payload["columns"].items():
+            dtype = np.dtype(payload["dtypes"][name])
+            if dtype.kind == 'O':
+                arr = np.empty(len(values), dtype=object)
+                arr[:] = values
+            else:
+                arr = np.array(values, dtype=dtype)  # null (NaN) volta como nan
+            columns[name] = arr
+        return columns
+
+    def _recover(self):
+        for tmp in glob.glob(os.path.join(self.spool_dir, "*.tmp")):
+            os.remove(tmp)  # Escrita interrompida: snapshot nunca entrou no buffer
+        for path in sorted(glob.glob(os.path.join(self.spool_dir, "*.json"))):
+            try:
+                columns = self._spool_read(path)
+            except Exception as e:
+                logging.warning(f"Spool corrompido ignorado ({path}): {e}")
+                os.rename(path, path + ".bad")
+                continue
+            ts = int(os.path.basename(path).split('.')[0]) / 1e6
+            self._append(ts, columns, path)
+        if self._batches:
+            logging.info(f"Spool recuperado: {len(self._batches)} snapshots, {self.rows} linhas pendentes.")
+
+    # === BUFFER ===
+    def _append(self, ts, columns, path):
+        n = len(next(iter(columns.values()), ()))
+        self._batches.append((ts, columns, path))
+        self.rows += n
+
+    @property
+    def snapshots(self):
+        return len(self._batches)
+
+    def age(self, now=None):
+        if not self._batches:
+            return 0.0
+        return (now or time.time()) - self._batches[0][0]
+
+    def should_flush(self, now=None):
+        if not self._batches:
+            return False
+        return self.rows >= self.max_rows or self.age(now) >= self.max_age_s
+
+    def add(self, columns, now=None):
+        """Grava o snapshot no spool, adiciona ao buffer e descarrega se atingir os limites.
+        Retorna as stats do flush ou None se ainda acumulando."""
+        ts = now or time.time()
+        if len(next(iter(columns.values()), ())):
+            self._append(ts, columns, self._spool_write(ts, columns))
+        if self.should_flush(ts):
+            return self.flush()
+        return None
+
+    def flush_if_stale(self, now=None):
+        """Descarrega se o buffer passou dos limites sem um add() novo (API fora, cadência lenta).
+        Chamado a cada tick do ciclo, mesmo sem dados; retorna as stats do flush ou None."""
+        if self.should_flush(now):
+            logging.info(f"Buffer com {self.rows} linhas e idade {self.age(now):.0f}s sem snapshot novo: descarregando.")
+            return self.flush()
+        return None
+
+    def flush(self):
+        """Um LOAD JOB com tudo que está no buffer; mantém o spool se o load falhar"""
+        if not self._batches:
+            return None
+        columns = concat_columns([b[1] for b in self._batches])
+        stats = self.flush_fn(columns)
+        if stats is None or stats.get('error'):
+            logging.error(f"Flush falhou; {self.rows} linhas mantidas no spool para a próxima tentativa.")
+            return stats
+        for _, _, path in self._batches:
+            if os.path.exists(path):
+                os.remove(path)
+        self._batches = []
+        self.rows = 0
+        return stats
@@ -0,0 +1,109 @@
+# core/poll_cadence.py
+import logging
+import math
+import time
+from datetime import datetime
+
+import numpy as np
+
+from core.headway import SAO_PAULO_TZ
+
+HOUR_S = 3600
+
+
+def service_profile(store):
+    """Partidas programadas por hora do dia (24 valores) a partir de frequencies.txt.
+
+    Cada faixa [start, end) com headway_secs h contribui com sobreposição / h partidas
+    em cada hora que cobre; horários após 24:00:00 caem na hora do dia seguinte.
+    Soma todos os service_id (o store não tem calendar), então vale como perfil
+    relativo ao longo do dia, não como contagem absoluta.
+    """
+    start = np.asarray(store.a['freq_start'], dtype=np.float64)
+    end = np.asarray(store.a['freq_end'], dtype=np.float64)
+    headway = np.asarray(store.a['freq_headway'], dtype=np.float64)
+    ok = (end > start) & (headway > 0)
+    start, end, headway = start[ok], end[ok], headway[ok]
+    hours = np.arange(48, dtype=np.float64) * HOUR_S
+    overlap = np.clip(np.minimum(end[:, None], hours + HOUR_S) - np.maximum(start[:, None], hours), 0, None)
+    departures = (overlap / headway[:, None]).sum(axis=0)
+    return departures[:24] + departures[24:]
+
+
+class AdaptivePollCadence:
+    """Intervalo de polling do /Posicao ajustado pela taxa de mudança observada.
+
+    A cada snapshot, observe() recebe quantos veículos já conhecidos tiveram
+    vehicle_ta avançado. Se a fração que avança é f após um intervalo de g segundos,
+    o intervalo sugerido é g * target_advance / f: de madrugada (frota parada, f
+    baixo) o polling desacelera até max_s; no pico, com quase todos avançando, ele
+    acelera até perto do ritmo em que os veículos reportam (limitado por min_s).
+    Opcionalmente mistura (média geométrica com peso gtfs_weight) um intervalo
+    derivado da intensidade programada da hora atual (service_profile). O novo
+    intervalo é suavizado (smoothing = peso da sugestão) e cada decisão é logada.
+
+    interval() é o callable que o Scheduler lê a cada tick.
+    """
+
+    def __init__(self, base_s=60, min_s=20, max_s=180, target_advance=0.8, smoothing=0.5,
+                 min_vehicles=100, gtfs_weight=0.0, metrics=None):
+        if not 0 < min_s <= max_s:
+            raise ValueError(f"Limites de cadência inválidos: min_s={min_s}, max_s={max_s}")
+        self.min_s = float(min_s)
+        self.max_s = float(max_s)
+        self.target_advance = float(target_advance)
+        self.smoothing = float(smoothing)
+        self.min_vehicles = min_vehicles
+        self.gtfs_weight = float(gtfs_weight)
+        self.metrics = metrics
+        self.current_s = self._clamp(base_s)
+        self.profile = None  # partidas por hora (service_profile), ou None sem store GTFS
+        self.last_decision = None
+        self._last_observed = None
+
+    def _clamp(self, seconds):
+        return min(self.max_s, max(self.min_s, float(seconds)))
+
+    def interval(self):
+        return self.current_s
+
+    def set_profile(self, profile):
+        self.profile = None if profile is None or not np.max(profile) > 0 else np.asarray(profile, dtype=np.float64)
+
+    def intensity(self, hour):
+        """Intensidade programada da hora (0..1, relativa à hora de pico) ou None"""
+        if self.profile is None:
+            return None
+        return float(self.profile[hour] / self.profile.max())
+
+    def observe(self, advanced, known, now=None, hour=None):
+        """Registra um snapshot e recalcula o intervalo; devolve o dict da decisão (ou None)"""
+        now = time.monotonic() if now is None else now
+        gap = now - self._last_observed if self._last_observed is not None else self.current_s
+        self._last_observed = now
+        if known < self.min_vehicles:
+            return None
+        hour = datetime.now(SAO_PAULO_TZ).hour if hour is None else hour
+        fraction = advanced / known
+        observed = self._clamp(gap * self.target_advance / fraction) if fraction > 0 else self.max_s
+        suggested = observed
+        intensity = self.intensity(hour)
+        if intensity is not None and self.gtfs_weight > 0:
+            scheduled = self.max_s - intensity * (self.max_s - self.min_s)
+            suggested = math.exp((1 - self.gtfs_weight) * math.log(observed) + self.gtfs_weight * math.log(scheduled))
+        previous = self.current_s
+        self.current_s = self._clamp(math.exp((1 - self.smoothing) * math.log(previous)
+                                              + self.smoothing * math.log(suggested)))
+
+        self.last_decision = {
+            "advanced": int(advanced), "known": int(known), "fraction": round(fraction, 4),
+            "gap_s": round(gap, 1), "hour": hour, "intensity": None if intensity is None else round(intensity, 3),
+            "observed_s": round(observed, 1), "previous_s": round(previous, 1), "interval_s": round(self.current_s, 1),
+        }
+        gtfs = f" | intensidade GTFS {intensity:.0%} às {hour}h" if intensity is not None else ""
+        logging.info(f"Cadência: {advanced}/{known} veículos avançaram ({fraction:.0%}) em {gap:.0f}s{gtfs} | "
+                     f"intervalo {previous:.0f}s → {self.current_s:.0f}s (limites {self.min_s:.0f}-{self.max_s:.0f}s).")
+        if self.metrics is not None:
+            self.metrics.set("sptrans_poll_interval_seconds", self.current_s, pipeline="posicoes")
+            self.metrics.set("sptrans_poll_advance_ratio", fraction, pipeline="posicoes")
+        return self.last_decision
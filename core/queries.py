@@ -0,0 +1,38 @@
+# core/queries.py
+from google.cloud import bigquery
+
+# === SQL DAS PIPELINES (também usado em ingest/report_bytes_scanned.py) ===
+
+
+def sql_linhas_unicas(posicoes_table):
+    return f"""
+    SELECT DISTINCT line_c
+    FROM `{posicoes_table}`
+    WHERE line_c IS NOT NULL
+      AND DATE(fetch_time) = CURRENT_DATE()  -- Free tier: só hoje
+    """
+
+
+def sql_linhas_com_cl(linhas_table):
+    return f"""
+    SELECT DISTINCT line_c, cl
+    FROM `{linhas_table}`
+    WHERE cl IS NOT NULL
+      AND DATE(fetch_time) = CURRENT_DATE()  -- Free tier: só hoje
+    """
+
+
+def sql_posicoes_linha_hoje(posicoes_table, line_c='8000-10'):
+    """Padrão das VIEWs: posições de hoje filtradas/juntadas por line_c"""
+    return f"""
+    SELECT fetch_time, line_c, vehicle_p, vehicle_py, vehicle_px
+    FROM `{posicoes_table}`
+    WHERE DATE(fetch_time) = CURRENT_DATE()
+      AND line_c = '{line_c}'
+    """
+
+
+def dry_run_bytes(client, query):
+    """Bytes que a query processaria (dry run, sem custo e sem cache)"""
+    job_config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False)
+    return client.query(query, job_config=job_config).total_bytes_processed
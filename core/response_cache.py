@@ -0,0 +1,80 @@
+# core/response_cache.py
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class ResponseCache:
+    """Cache local persistente (SQLite) de respostas da API, com hash do conteúdo e TTL.
+
+    Cada chave (ex.: cl da linha) guarda o JSON da resposta, o sha256 do conteúdo
+    canônico e o instante da busca. get() só devolve entradas dentro do TTL, a não ser
+    com allow_stale=True (útil como fallback quando a API falha). Entradas vencidas
+    só são removidas após max_stale_s (padrão: o próprio TTL), para o fallback
+    continuar valendo enquanto a API estiver fora.
+    """
+
+    def __init__(self, path, ttl_s, max_stale_s=None):
+        self.path = path
+        self.ttl_s = ttl_s
+        self.max_stale_s = max(ttl_s, max_stale_s if max_stale_s is not None else ttl_s)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                body TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                fetched_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    @staticmethod
+    def content_hash(response):
+        canonical = json.dumps(response, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def get(self, key, allow_stale=False, now=None):
+        """Resposta em cache ou None se ausente/expirada"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body, fetched_at FROM responses WHERE key = ?", (str(key),)
+            ).fetchone()
+        if row is None:
+            return None
+        body, fetched_at = row
+        if not allow_stale and (now or time.time()) - fetched_at > self.ttl_s:
+            return None
+        return json.loads(body)
+
+    def put(self, key, response, now=None):
+        """Grava a resposta; devolve True se o conteúdo mudou (ou é novo)"""
+        new_hash = self.content_hash(response)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content_hash FROM responses WHERE key = ?", (str(key),)
+            ).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, body, content_hash, fetched_at) VALUES (?, ?, ?, ?)",
+                (str(key), json.dumps(response, ensure_ascii=False), new_hash, now or time.time())
+            )
+            self._conn.commit()
+        return row is None or row[0] != new_hash
+
+    def evict_expired(self, now=None):
+        """Remove entradas além de max_stale_s (não mais usáveis nem como fallback); devolve quantas saíram"""
+        with self._lock:
+            cur = self._conn.execute(
+                "DELETE FROM responses WHERE fetched_at < ?", ((now or time.time()) - self.max_stale_s,)
+            )
+            self._conn.commit()
+        return cur.rowcount
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
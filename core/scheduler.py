@@ -0,0 +1,132 @@
+# core/scheduler.py
+import logging
+import math
+import threading
+import time
+
+
+class Job:
+    """Tarefa periódica. overlap='skip' descarta o tick se o ciclo anterior ainda roda;
+    overlap='coalesce' junta os ticks perdidos numa única execução logo após o término.
+    interval_s é um número ou um callable sem argumentos (cadência adaptativa), relido
+    a cada tick e ao fim de cada execução."""
+
+    def __init__(self, name, fn, interval_s, overlap='skip', run_at_start=True):
+        if overlap not in ('skip', 'coalesce'):
+            raise ValueError(f"overlap inválido: {overlap}")
+        self.name = name
+        self.fn = fn
+        self.interval_s = interval_s
+        self.overlap = overlap
+        self.next_run = time.monotonic() + (0 if run_at_start else self.interval())
+        self.last_tick = None  # next_run da última execução disparada
+        self.running = False
+        self.pending = False
+        self.runs = 0
+        self.skipped = 0
+        self.last_duration = None
+        self._thread = None
+
+    @property
+    def adaptive(self):
+        return callable(self.interval_s)
+
+    def interval(self):
+        return float(self.interval_s() if self.adaptive else self.interval_s)
+
+    def describe(self):
+        return f"{self.interval():.0f}s (adaptativo)" if self.adaptive else f"{self.interval_s}s"
+
+
+class Scheduler:
+    """Agendador em processo: uma thread por execução, horário sem drift.
+
+    O próximo disparo é sempre next_run + k * interval (não "agora + interval"),
+    então a duração do ciclo não acumula atraso. Ticks perdidos por overrun são
+    pulados ou coalescidos conforme Job.overlap, nunca executados em paralelo.
+    Com intervalo adaptativo, o próximo disparo é reancorado no tick da execução
+    que acabou de terminar, já com o intervalo que ela decidiu.
+    """
+
+    def __init__(self):
+        self.jobs = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+
+    def add(self, name, fn, interval_s, overlap='skip', run_at_start=True):
+        job = Job(name, fn, interval_s, overlap=overlap, run_at_start=run_at_start)
+        self.jobs.append(job)
+        return job
+
+    def _run(self, job):
+        while True:
+            start = time.monotonic()
+            try:
+                job.fn()
+            except Exception as e:
+                logging.error(f"[{job.name}] Erro não tratado no ciclo: {e}")
+            job.last_duration = time.monotonic() - start
+            job.runs += 1
+            with self._lock:
+                if job.pending and not self._stop.is_set():
+                    job.pending = False
+                    logging.info(f"[{job.name}] Executando ciclo coalescido após overrun ({job.last_duration:.1f}s).")
+                    continue
+                job.running = False
+                if job.adaptive:
+                    self._advance(job, job.last_tick, time.monotonic())
+                break
+        self._wake.set()
+
+    def _dispatch(self, job, now):
+        with self._lock:
+            if job.running:
+                job.skipped += 1
+                if job.overlap == 'coalesce':
+                    job.pending = True
+                logging.warning(f"[{job.name}] Ciclo anterior ainda em execução: tick "
+                                f"{'coalescido' if job.overlap == 'coalesce' else 'pulado'}.")
+            else:
+                job.running = True
+                job.last_tick = job.next_run
+                job._thread = threading.Thread(target=self._run, args=(job,), name=job.name, daemon=True)
+                job._thread.start()
+            self._advance(job, job.next_run, now)
+
+    @staticmethod
+    def _advance(job, anchor, now):
+        # Sem drift: avança em múltiplos inteiros do intervalo a partir do agendamento original
+        interval = job.interval()
+        missed = max(1, math.floor((now - anchor) / interval) + 1)
+        job.next_run = anchor + missed * interval
+
+    def run_forever(self):
+        logging.info("Scheduler iniciado: " + ", ".join(f"{j.name} a cada {j.describe()}" for j in self.jobs))
+        while not self._stop.is_set():
+            now = time.monotonic()
+            for job in self.jobs:
+                if now >= job.next_run:
+                    self._dispatch(job, now)
+            wait = min(job.next_run for job in self.jobs) - time.monotonic()
+            self._wake.wait(timeout=max(0.0, wait))
+            self._wake.clear()
+
+    def stop(self, timeout=None):
+        """Para de disparar e aguarda os ciclos em andamento"""
+        self._stop.set()
+        self._wake.set()
+        for job in self.jobs:
+            if job._thread is not None:
+                job._thread.join(timeout)
+
+
+def run_periodically(name, fn, interval_s):
+    """Modo standalone das pipelines: um único job no Scheduler até Ctrl+C (interval_s pode ser callable)"""
+    scheduler = Scheduler()
+    scheduler.add(name, fn, interval_s)
+    try:
+        scheduler.run_forever()
+    except KeyboardInterrupt:
+        scheduler.stop()
+        raise
@@ -0,0 +1,111 @@
+# core/schemas.py
+from google.cloud import bigquery
+from google.cloud.bigquery import SchemaField
+
+# === SCHEMAS DAS TABELAS BRONZE (OLHO VIVO) ===
+SCHEMA_POSICOES = [
+    SchemaField("fetch_time", "TIMESTAMP", mode="NULLABLE"),
+    SchemaField("hr", "STRING", mode="NULLABLE"),
+    SchemaField("line_c", "STRING", mode="NULLABLE"),
+    SchemaField("line_cl", "INTEGER", mode="NULLABLE"),
+    SchemaField("line_sl", "INTEGER", mode="NULLABLE"),
+    SchemaField("line_lt0", "STRING", mode="NULLABLE"),
+    SchemaField("line_lt1", "STRING", mode="NULLABLE"),
+    SchemaField("vehicle_p", "STRING", mode="NULLABLE"),
+    SchemaField("vehicle_a", "BOOL", mode="NULLABLE"),
+    SchemaField("vehicle_ta", "STRING", mode="NULLABLE"),
+    SchemaField("vehicle_py", "FLOAT", mode="NULLABLE"),
+    SchemaField("vehicle_px", "FLOAT", mode="NULLABLE"),
+    # Enriquecimento local (core/spatial_index.py): parada GTFS mais próxima
+    SchemaField("nearest_stop_id", "INTEGER", mode="NULLABLE"),
+    SchemaField("distance_m", "FLOAT", mode="NULLABLE"),
+    # Velocidade (km/h) e rumo (graus, 0 = norte) observados (core/vehicle_state.py)
+    SchemaField("speed_kmh", "FLOAT", mode="NULLABLE"),
+    SchemaField("speed_smooth_kmh", "FLOAT", mode="NULLABLE"),
+    SchemaField("heading_deg", "FLOAT", mode="NULLABLE"),
+    SchemaField("heading_smooth_deg", "FLOAT", mode="NULLABLE"),
+    # Map-matching (core/map_match.py): shape da linha/sentido, distância ao longo e ao shape
+    SchemaField("shape_id", "STRING", mode="NULLABLE"),
+    SchemaField("shape_dist_m", "FLOAT", mode="NULLABLE"),
+    SchemaField("snap_dist_m", "FLOAT", mode="NULLABLE")
+]
+
+SCHEMA_LINHAS = [
+    SchemaField("fetch_time", "TIMESTAMP", mode="NULLABLE"),
+    SchemaField("line_c", "STRING", mode="NULLABLE"),
+    SchemaField("cl", "INTEGER", mode="NULLABLE"),
+    SchemaField("lc", "BOOL", mode="NULLABLE"),
+    SchemaField("lt", "STRING", mode="NULLABLE"),
+    SchemaField("tl", "INTEGER", mode="NULLABLE"),
+    SchemaField("sl", "INTEGER", mode="NULLABLE"),
+    SchemaField("tp", "STRING", mode="NULLABLE"),
+    SchemaField("ts", "STRING", mode="NULLABLE")
+]
+
+SCHEMA_PARADAS = [
+    SchemaField("fetch_time", "TIMESTAMP", mode="NULLABLE"),
+    SchemaField("line_c", "STRING", mode="NULLABLE"),
+    SchemaField("cl", "INTEGER", mode="NULLABLE"),
+    SchemaField("cp", "INTEGER", mode="NULLABLE"),
+    SchemaField("np", "STRING", mode="NULLABLE"),
+    SchemaField("py", "FLOAT", mode="NULLABLE"),
+    SchemaField("px", "FLOAT", mode="NULLABLE")
+]
+
+# Aderência de headway por linha/sentido, um snapshot por linha (core/headway.py)
+SCHEMA_HEADWAY = [
+    SchemaField("fetch_time", "TIMESTAMP", mode="NULLABLE"),
+    SchemaField("hr", "STRING", mode="NULLABLE"),
+    SchemaField("line_c", "STRING", mode="NULLABLE"),
+    SchemaField("line_sl", "INTEGER", mode="NULLABLE"),
+    SchemaField("vehicles", "INTEGER", mode="NULLABLE"),
+    SchemaField("gaps", "INTEGER", mode="NULLABLE"),
+    SchemaField("headway_p50_s", "FLOAT", mode="NULLABLE"),
+    SchemaField("headway_mean_s", "FLOAT", mode="NULLABLE"),
+    SchemaField("headway_min_s", "FLOAT", mode="NULLABLE"),
+    SchemaField("headway_max_s", "FLOAT", mode="NULLABLE"),
+    SchemaField("headway_cv", "FLOAT", mode="NULLABLE"),
+    SchemaField("scheduled_headway_s", "INTEGER", mode="NULLABLE"),
+    SchemaField("headway_ratio", "FLOAT", mode="NULLABLE"),
+    SchemaField("bunched", "INTEGER", mode="NULLABLE")
+]
+
+# === GTFS DERIVADO (ingest/ingest_shapes.py) ===
+SCHEMA_SHAPES_SIMPLIFIED = [
+    SchemaField("load_date", "DATE", mode="NULLABLE"),
+    SchemaField("shape_id", "STRING", mode="NULLABLE"),
+    SchemaField("geom", "GEOGRAPHY", mode="NULLABLE"),  # LINESTRING simplificada (WKT)
+    SchemaField("points_original", "INTEGER", mode="NULLABLE"),
+    SchemaField("points_simplified", "INTEGER", mode="NULLABLE"),
+    SchemaField("length_m", "FLOAT", mode="NULLABLE"),
+    SchemaField("tolerance_m", "FLOAT", mode="NULLABLE")
+]
+
+# === PARTICIONAMENTO + CLUSTERING ===
+# Pipelines e VIEWs filtram DATE(fetch_time) = CURRENT_DATE() e fazem JOIN por line_c
+PARTITION_FIELD = "fetch_time"
+CLUSTERING_FIELDS = {
+    "sptrans_posicoes": ["line_c", "vehicle_p"],
+    "sptrans_linhas": ["line_c"],
+    "sptrans_linhas_changes": ["line_c"],
+    "sptrans_paradas": ["line_c"],
+    "sptrans_headway": ["line_c"],
+    "gtfs_shapes_simplified": ["shape_id"],
+}
+
+
+def partitioned_table(table_ref, schema, clustering_fields=None):
+    """bigquery.Table particionada por dia em fetch_time e clusterizada"""
+    table = bigquery.Table(table_ref, schema=schema)
+    table.time_partitioning = bigquery.TimePartitioning(
+        type_=bigquery.TimePartitioningType.DAY,
+        field=PARTITION_FIELD
+    )
+    if clustering_fields:
+        table.clustering_fields = clustering_fields
+    return table
+
+
+def is_partitioned(table):
+    tp = table.time_partitioning
+    return tp is not None and tp.field == PARTITION_FIELD
@@ -0,0 +1,71 @@
+# core/simplify.py
+import numpy as np
+
+from core.geo import LocalProjection, haversine_m
+
+
+def douglas_peucker_runs(x, y, starts, ends, tolerance_m):
+    """Máscara dos pontos mantidos pelo Douglas–Peucker em várias polilinhas de uma vez.
+
+    x, y em metros; a polilinha k ocupa [starts[k], ends[k]). Os trechos pendentes de
+    todas as polilinhas são processados juntos, um nível de subdivisão por iteração
+    (distâncias e máximos por trecho em lote); primeiro e último ponto sempre ficam.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    keep = np.zeros(len(x), dtype=bool)
+    nonempty = ends > starts
+    keep[starts[nonempty]] = keep[ends[nonempty] - 1] = True
+    i, j = starts[nonempty], ends[nonempty] - 1
+    while True:
+        pending = j - i >= 2
+        i, j = i[pending], j[pending]
+        if not len(i):
+            return keep
+        counts = j - i - 1
+        offsets = np.cumsum(counts) - counts
+        run = np.repeat(np.arange(len(i)), counts)
+        p = np.repeat(i + 1 - offsets, counts) + np.arange(counts.sum())  # pontos internos de cada trecho
+        ax, ay, bx, by = x[i][run], y[i][run], x[j][run], y[j][run]
+        dx, dy = bx - ax, by - ay
+        seg2 = dx * dx + dy * dy
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = np.where(seg2 > 0, np.clip(((x[p] - ax) * dx + (y[p] - ay) * dy) / seg2, 0.0, 1.0), 0.0)
+        d = np.hypot(x[p] - (ax + t * dx), y[p] - (ay + t * dy))
+        dmax = np.maximum.reduceat(d, offsets)
+        # Primeiro ponto com a distância máxima de cada trecho
+        win = np.flatnonzero(d == dmax[run])
+        win = win[np.unique(run[win], return_index=True)[1]]
+        split = dmax > tolerance_m
+        k = p[win][split]
+        keep[k] = True
+        i, j = np.concatenate([i[split], k]), np.concatenate([k, j[split]])
+
+
+def douglas_peucker(x, y, tolerance_m):
+    """Máscara dos pontos mantidos pelo Douglas–Peucker (x, y em metros)"""
+    return douglas_peucker_runs(x, y, [0], [len(x)], tolerance_m)
+
+
+def simplify_polyline(lat, lon, tolerance_m):
+    """Douglas–Peucker em lat/lon (projeção local em metros); devolve (lat, lon) simplificados"""
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    if len(lat) < 3 or not tolerance_m:
+        return lat, lon
+    x, y = LocalProjection(lat.mean(), lon.mean()).to_xy(lat, lon)
+    keep = douglas_peucker(x, y, tolerance_m)
+    return lat[keep], lon[keep]
+
+
+def polyline_length_m(lat, lon):
+    if len(lat) < 2:
+        return 0.0
+    return float(haversine_m(lat[:-1], lon[:-1], lat[1:], lon[1:]).sum())
+
+
+def linestring_wkt(lat, lon, precision=6):
+    """WKT LINESTRING(lon lat, ...) para coluna GEOGRAPHY"""
+    return "LINESTRING(" + ", ".join(f"{x:.{precision}f} {y:.{precision}f}" for y, x in zip(lat, lon)) + ")"
@@ -0,0 +1,181 @@
+# core/snapshot_archive.py
+import os
+import re
+from datetime import datetime, timezone
+
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Índice: um registro de tamanho fixo por snapshot, na ordem de escrita
+INDEX_DTYPE = np.dtype([("ts_us", "<i8"), ("offset", "<u8"), ("length", "<u4"), ("raw_length", "<u4")])
+SEGMENT_RE = re.compile(r"^(?P<prefix>.+)-(?P<start>\d{8}T\d{6})\.zst$")
+
+
+def to_us(ts):
+    """datetime (aware ou UTC ingênuo) ou epoch em segundos → microssegundos epoch"""
+    if isinstance(ts, datetime):
+        if ts.tzinfo is None:
+            ts = ts.replace(tzinfo=timezone.utc)
+        ts = ts.timestamp()
+    return int(round(ts * 1e6))
+
+
+def from_us(ts_us):
+    return datetime.fromtimestamp(ts_us / 1e6, tz=timezone.utc)
+
+
+class SnapshotArchive:
+    """Arquivo local append-only de respostas brutas (ex.: /Posicao), comprimidas com zstd.
+
+    Segmentos por janela de segment_s segundos (UTC): `<prefix>-YYYYMMDDTHHMMSS.zst`
+    guarda um frame zstd independente por snapshot e o `.idx` ao lado um registro
+    INDEX_DTYPE (timestamp, offset, tamanho) por frame. O frame é gravado antes do
+    índice; ao reabrir um segmento, bytes sem registro no índice (escrita interrompida)
+    são descartados. Leituras usam o índice para ir direto aos frames do intervalo.
+    """
+
+    def __init__(self, root, prefix="posicoes", segment_s=3600, level=3, fsync=True):
+        if zstandard is None:
+            raise RuntimeError("zstandard não instalado (pip install zstandard)")
+        self.root = root
+        self.prefix = prefix
+        self.segment_s = int(segment_s)
+        self.fsync = fsync
+        self._compressor = zstandard.ZstdCompressor(level=level)
+        self._decompressor = zstandard.ZstdDecompressor()
+        self._segment = None  # (início do segmento em s, arquivo de dados, arquivo de índice)
+        os.makedirs(root, exist_ok=True)
+
+    # === ESCRITA ===
+    def _paths(self, start_s):
+        name = f"{self.prefix}-{datetime.fromtimestamp(start_s, tz=timezone.utc):%Y%m%dT%H%M%S}"
+        return os.path.join(self.root, name + ".zst"), os.path.join(self.root, name + ".idx")
+
+    def _repair(self, data_path, index_path):
+        """Descarta registro parcial no fim do índice e bytes de dados sem registro"""
+        if not os.path.exists(index_path):
+            if os.path.exists(data_path):
+                os.truncate(data_path, 0)
+            return
+        size = os.path.getsize(index_path)
+        whole = size - size % INDEX_DTYPE.itemsize
+        index = np.fromfile(index_path, dtype=INDEX_DTYPE, count=whole // INDEX_DTYPE.itemsize)
+        data_size = os.path.getsize(data_path) if os.path.exists(data_path) else 0
+        ends = index["offset"] + index["length"]
+        valid = int(np.searchsorted(ends > data_size, True))  # registros cujo frame está inteiro
+        if whole != size or valid != len(index):
+            os.truncate(index_path, valid * INDEX_DTYPE.itemsize)
+        end = int(ends[valid - 1]) if valid else 0
+        if data_size > end:
+            os.truncate(data_path, end)
+
+    def _open_segment(self, start_s):
+        self.close()
+        data_path, index_path = self._paths(start_s)
+        self._repair(data_path, index_path)
+        self._segment = (start_s, open(data_path, 'ab'), open(index_path, 'ab'))
+
+    def append(self, raw, ts):
+        """Grava um snapshot bruto (bytes) com o seu timestamp; devolve o tamanho comprimido"""
+        ts_us = to_us(ts)
+        start_s = (ts_us // 1_000_000) // self.segment_s * self.segment_s
+        if self._segment is None or self._segment[0] != start_s:
+            self._open_segment(start_s)
+        _, data_f, index_f = self._segment
+        frame = self._compressor.compress(raw)
+        offset = data_f.tell()
+        data_f.write(frame)
+        data_f.flush()
+        if self.fsync:
+            os.fsync(data_f.fileno())
+        record = np.array([(ts_us, offset, len(frame), len(raw))], dtype=INDEX_DTYPE)
+        index_f.write(record.tobytes())
+        index_f.flush()
+        if self.fsync:
+            os.fsync(index_f.fileno())
+        return len(frame)
+
+    def close(self):
+        if self._segment is not None:
+            for f in self._segment[1:]:
+                f.close()
+            self._segment = None
+
+    # === LEITURA ===
+    def segments(self):
+        """[(início em s, caminho dos dados, caminho do índice)] em ordem de tempo"""
+        out = []
+        for name in os.listdir(self.root):
+            m = SEGMENT_RE.match(name)
+            if not m or m.group("prefix") != self.prefix:
+                continue
+            start = datetime.strptime(m.group("start"), "%Y%m%dT%H%M%S").replace(tzinfo=timezone.utc)
+            data_path = os.path.join(self.root, name)
+            out.append((int(start.timestamp()), data_path, data_path[:-4] + ".idx"))
+        return sorted(out)
+
+    def _segment_index(self, index_path, data_path):
+        if not os.path.exists(index_path):
+            return np.empty(0, dtype=INDEX_DTYPE)
+        size = os.path.getsize(index_path)
+        index = np.fromfile(index_path, dtype=INDEX_DTYPE, count=size // INDEX_DTYPE.itemsize)
+        # Segmento em escrita por outro processo: só frames já gravados por inteiro
+        data_size = os.path.getsize(data_path)
+        return index[index["offset"] + index["length"] <= data_size]
+
+    def index(self, start=None, end=None):
+        """Registros do índice em [start, end) com o caminho do segmento: [(caminho, registros)]"""
+        start_us = to_us(start) if start is not None else None
+        end_us = to_us(end) if end is not None else None
+        out = []
+        for seg_start, data_path, index_path in self.segments():
+            if end_us is not None and seg_start * 1_000_000 >= end_us:
+                break
+            if start_us is not None and (seg_start + self.segment_s) * 1_000_000 <= start_us:
+                continue
+            records = self._segment_index(index_path, data_path)
+            if start_us is not None:
+                records = records[records["ts_us"] >= start_us]
+            if end_us is not None:
+                records = records[records["ts_us"] < end_us]
+            if len(records):
+                out.append((data_path, records))
+        return out
+
+    def iter_snapshots(self, start=None, end=None):
+        """(datetime UTC, bytes brutos) de cada snapshot em [start, end), em ordem de gravação"""
+        for data_path, records in self.index(start, end):
+            with open(data_path, 'rb') as f:
+                for ts_us, offset, length, raw_length in records.tolist():
+                    f.seek(offset)
+                    raw = self._decompressor.decompress(f.read(length), max_output_size=raw_length)
+                    yield from_us(ts_us), raw
+
+    def prune(self, keep_s, now=None):
+        """Apaga segmentos que terminaram há mais de keep_s segundos; devolve quantos"""
+        now_s = to_us(now or datetime.now(timezone.utc)) // 1_000_000
+        removed = 0
+        current = self._segment[0] if self._segment is not None else None
+        for seg_start, data_path, index_path in self.segments():
+            if seg_start + self.segment_s + keep_s > now_s or seg_start == current:
+                continue
+            for path in (data_path, index_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            removed += 1
+        return removed
+
+    def stats(self):
+        """Nº de segmentos, snapshots e bytes comprimidos/brutos no disco"""
+        segments, snapshots, compressed, raw = 0, 0, 0, 0
+        for _, data_path, index_path in self.segments():
+            records = self._segment_index(index_path, data_path)
+            segments += 1
+            snapshots += len(records)
+            compressed += int(records["length"].sum())
+            raw += int(records["raw_length"].sum())
+        return {"segments": segments, "snapshots": snapshots, "compressed_bytes": compressed, "raw_bytes": raw}
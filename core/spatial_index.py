@@ -0,0 +1,150 @@
+# core/spatial_index.py
+import math
+
+import numpy as np
+
+from core.geo import LocalProjection, haversine_m
+
+DEFAULT_CELL_M = 250.0
+DEFAULT_MAX_DIST_M = 1000.0
+# Margem para o erro da projeção local ao decidir que nenhuma célula não visitada tem ponto mais perto
+PROJECTION_SLACK = 0.99
+
+
+def _ring_offsets(r):
+    """(dx, dy) das células com max(|dx|, |dy|) == r"""
+    if r == 0:
+        return [(0, 0)]
+    return [(dx, dy) for dx in range(-r, r + 1) for dy in range(-r, r + 1) if max(abs(dx), abs(dy)) == r]
+
+
+class GridIndex:
+    """Índice em grade (buckets de cell_m metros) para vizinho mais próximo vetorizado.
+
+    Os pontos são projetados em metros (core/geo.py), agrupados por célula e ordenados
+    por chave (grupo, célula). Uma consulta visita anéis de células em volta de cada
+    query, só para as queries ainda sem resposta garantida: após o anel r, qualquer
+    ponto não visitado está a pelo menos r * cell_m (menos o erro da projeção).
+    groups (ex.: rota) restringe a busca aos pontos do mesmo grupo da query.
+    """
+
+    def __init__(self, lat, lon, groups=None, cell_m=DEFAULT_CELL_M, projection=None):
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        self.cell_m = float(cell_m)
+        self.projection = projection or LocalProjection(np.nanmean(lat), np.nanmean(lon))
+        x, y = self.projection.to_xy(lat, lon)
+        groups = np.zeros(len(lat), dtype=np.int64) if groups is None else np.asarray(groups, dtype=np.int64)
+
+        self.x0, self.y0 = float(x.min()), float(y.min())
+        ix = np.floor((x - self.x0) / self.cell_m).astype(np.int64)
+        iy = np.floor((y - self.y0) / self.cell_m).astype(np.int64)
+        self.nx, self.ny = int(ix.max()) + 1, int(iy.max()) + 1
+        self.n_groups = int(groups.max()) + 1 if len(groups) else 0
+
+        keys = (groups * self.nx + ix) * self.ny + iy
+        order = np.argsort(keys, kind='stable')
+        self.point = order  # posição ordenada → índice original do ponto
+        self._lat, self._lon = lat[order], lon[order]
+        self._cells, self._start = np.unique(keys[order], return_index=True)
+        self._end = np.append(self._start[1:], len(order))
+
+    def __len__(self):
+        return len(self.point)
+
+    def _candidates(self, q, qg, cx, cy):
+        """Pares (query, ponto ordenado) das células (cx, cy) do grupo qg"""
+        ok = (cx >= 0) & (cx < self.nx) & (cy >= 0) & (cy < self.ny)
+        q, keys = q[ok], (qg[ok] * self.nx + cx[ok]) * self.ny + cy[ok]
+        pos = np.minimum(np.searchsorted(self._cells, keys), len(self._cells) - 1)
+        hit = self._cells[pos] == keys
+        q, pos = q[hit], pos[hit]
+        counts = self._end[pos] - self._start[pos]
+        total = int(counts.sum())
+        if total == 0:
+            return None, None
+        # Expande cada célula no intervalo [start, end) sem loop Python
+        base = np.repeat(self._start[pos] - (np.cumsum(counts) - counts), counts)
+        return np.repeat(q, counts), base + np.arange(total)
+
+    def query(self, lat, lon, groups=None, max_dist_m=DEFAULT_MAX_DIST_M):
+        """Vizinho mais próximo de cada (lat, lon): (índice do ponto ou -1, distância em metros ou NaN)"""
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        n = len(lat)
+        qg = np.zeros(n, dtype=np.int64) if groups is None else np.asarray(groups, dtype=np.int64)
+        qx, qy = self.projection.to_xy(lat, lon)
+        best_d = np.full(n, np.inf)
+        best = np.full(n, -1, dtype=np.int64)
+        if len(self) == 0:
+            return best, np.full(n, np.nan)
+
+        valid = np.isfinite(qx) & np.isfinite(qy) & (qg >= 0) & (qg < self.n_groups)
+        active = np.flatnonzero(valid)
+        qix = np.zeros(n, dtype=np.int64)
+        qiy = np.zeros(n, dtype=np.int64)
+        qix[valid] = np.floor((qx[valid] - self.x0) / self.cell_m)
+        qiy[valid] = np.floor((qy[valid] - self.y0) / self.cell_m)
+
+        for r in range(int(math.ceil(max_dist_m / (self.cell_m * PROJECTION_SLACK))) + 1):
+            if active.size == 0:
+                break
+            q_parts, p_parts = [], []
+            for dx, dy in _ring_offsets(r):
+                q, p = self._candidates(active, qg[active], qix[active] + dx, qiy[active] + dy)
+                if q is not None:
+                    q_parts.append(q)
+                    p_parts.append(p)
+            if q_parts:
+                q, p = np.concatenate(q_parts), np.concatenate(p_parts)
+                # Ordena pela distância real (haversine): a projeção só define as células
+                d = haversine_m(lat[q], lon[q], self._lat[p], self._lon[p])
+                np.minimum.at(best_d, q, d)
+                win = d == best_d[q]
+                best[q[win]] = p[win]
+            active = active[best_d[active] > r * self.cell_m * PROJECTION_SLACK]
+
+        dist = best_d.copy()
+        found = (best >= 0) & (dist <= max_dist_m)
+        idx = np.full(n, -1, dtype=np.int64)
+        idx[found] = self.point[best[found]]
+        dist[~found] = np.nan
+        return idx, dist
+
+
+class NearestStopIndex:
+    """Parada mais próxima de cada veículo a partir do store GTFS (core/gtfs_store.py).
+
+    per_route=True (exige stop_times no store) restringe a busca às paradas da rota
+    do veículo; veículos de linhas fora do GTFS caem no índice de todas as paradas.
+    """
+
+    def __init__(self, store, per_route=False, cell_m=DEFAULT_CELL_M):
+        self.stop_id = np.asarray(store.a['stop_id'])
+        lat, lon = np.asarray(store.a['stop_lat']), np.asarray(store.a['stop_lon'])
+        self.all_stops = GridIndex(lat, lon, cell_m=cell_m)
+        self.by_route = None
+        if per_route and store.has_stop_times:
+            n_stops = len(self.stop_id)
+            st_stop = np.asarray(store.a['st_stop'], dtype=np.int64)
+            st_route = np.asarray(store.a['trip_route'])[store.a['st_trip']].astype(np.int64)
+            keep = st_stop >= 0
+            pairs = np.unique(st_route[keep] * n_stops + st_stop[keep])
+            self._route_stop = pairs % n_stops
+            self.by_route = GridIndex(lat[self._route_stop], lon[self._route_stop], groups=pairs // n_stops,
+                                      cell_m=cell_m, projection=self.all_stops.projection)
+
+    def nearest(self, lat, lon, route_idx=None, max_dist_m=DEFAULT_MAX_DIST_M):
+        """(stop_id ou -1, distância em metros ou NaN) por posição"""
+        if self.by_route is None or route_idx is None:
+            idx, dist = self.all_stops.query(lat, lon, max_dist_m=max_dist_m)
+        else:
+            lat, lon = np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64)
+            route_idx = np.asarray(route_idx, dtype=np.int64)
+            pair, dist = self.by_route.query(lat, lon, groups=route_idx, max_dist_m=max_dist_m)
+            idx = np.where(pair >= 0, self._route_stop[np.maximum(pair, 0)], -1)
+            fallback = route_idx < 0
+            if fallback.any():
+                idx[fallback], dist[fallback] = self.all_stops.query(lat[fallback], lon[fallback], max_dist_m=max_dist_m)
+        stop_id = np.where(idx >= 0, self.stop_id[np.maximum(idx, 0)], -1)
+        return stop_id, dist
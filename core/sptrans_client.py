@@ -1,16 +1,172 @@
 # sptrans_client.py
+import json
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
 import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import orjson  # Decoder rápido (opcional)
+except ImportError:
+    orjson = None
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+def loads(raw):
+    """JSON de bytes/str: orjson se instalado, senão json da stdlib"""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+class RetryBudget:
+    """Orçamento de retries compartilhado por todas as chamadas do cliente (token bucket).
+
+    Cada requisição deposita `ratio` fichas (até `burst`) e cada retry gasta uma: em
+    regime, no máximo ratio x requisições viram retry. Com a API fora do ar no meio de
+    milhares de chamadas do FetchEngine, o orçamento acaba e as falhas voltam na hora
+    em vez de multiplicar a carga.
+    """
+
+    def __init__(self, ratio=0.1, burst=10):
+        self.ratio = float(ratio)
+        self.burst = float(burst)
+        self._tokens = self.burst
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def withdraw(self):
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
 
 class SPTransClient:
-    def __init__(self, base_url, token, proxies=None):
+    """Cliente da API Olho Vivo sobre uma requests.Session com transporte explícito.
+
+    Um HTTPAdapter com pool de pool_maxsize conexões keep-alive atende todos os
+    endpoints (o FetchEngine usa o mesmo pool); respostas gzip/deflate são
+    descomprimidas pelo urllib3. Cada requisição tem timeout (conexão, leitura) e
+    até max_retries novas tentativas em erro de rede, 429 e 5xx, com backoff
+    exponencial com jitter e limitadas pelo RetryBudget. 401/403 reautentica uma
+    única vez por chamada (sem recursão).
+    """
+
+    def __init__(self, base_url, token, proxies=None, metrics=None, pool_maxsize=16,
+                 timeout=(5, 30), max_retries=3, backoff_s=0.5, backoff_max_s=10.0,
+                 retry_budget=None):
         self.base_url = base_url
         self.token = token
         self.proxies = proxies
+        self.metrics = metrics  # core/metrics.py (opcional): chamadas por endpoint/status
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_s = backoff_s
+        self.backoff_max_s = backoff_max_s
+        self.retry_budget = retry_budget or RetryBudget()
+        self.pool_maxsize = pool_maxsize
         self.session = requests.Session()
+        self.session.headers["Accept-Encoding"] = "gzip, deflate"
+        # Retries ficam em send() (orçamento + métricas), não no urllib3
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._base_path = urlparse(base_url).path.rstrip('/')
+
+    def endpoint(self, url):
+        """Endpoint da URL sem base_url e query (ex.: 'Linha/Buscar'), para métricas"""
+        path = urlparse(url).path
+        if path.startswith(self._base_path):
+            path = path[len(self._base_path):]
+        return path.strip('/')
+
+    def record_call(self, url, status, seconds, nbytes=0, wire_bytes=None):
+        if self.metrics is not None:
+            self.metrics.record_api(self.endpoint(url), status, seconds, nbytes, wire_bytes)
+
+    # === TRANSPORTE ===
+    def _backoff(self, attempt, response=None):
+        delay = random.uniform(0, min(self.backoff_max_s, self.backoff_s * 2 ** attempt))  # full jitter
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, min(float(retry_after), self.backoff_max_s))
+        time.sleep(delay)
+
+    def _retry(self, url, attempt, reason, response=None):
+        """True se ainda cabe um retry (tentativas e orçamento); dorme o backoff antes"""
+        if attempt >= self.max_retries:
+            return False
+        if not self.retry_budget.withdraw():
+            print(f"Orçamento de retries esgotado ({reason}) em {self.endpoint(url)}.")
+            if self.metrics is not None:
+                self.metrics.inc("sptrans_api_retries_total", endpoint=self.endpoint(url), reason="budget_exhausted")
+            return False
+        if self.metrics is not None:
+            self.metrics.inc("sptrans_api_retries_total", endpoint=self.endpoint(url), reason=reason)
+        self._backoff(attempt, response)
+        return True
 
+    def send(self, method, url, timeout=None, before_attempt=None):
+        """Uma requisição com timeout e retries limitados (rede, 429, 5xx); devolve a Response.
+
+        before_attempt (ex.: TokenBucket.acquire do FetchEngine) é chamado antes de cada
+        tentativa, retries inclusive, para que eles também respeitem o rate limit.
+        Erro de rede que esgota as tentativas é relançado; status de erro volta na Response.
+        """
+        self.retry_budget.deposit()
+        attempt = 0
+        while True:
+            if before_attempt is not None:
+                before_attempt()
+            t0 = time.perf_counter()
+            try:
+                response = self.session.request(method, url, proxies=self.proxies, timeout=timeout or self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.record_call(url, 0, time.perf_counter() - t0)
+                if not self._retry(url, attempt, type(e).__name__):
+                    raise
+                attempt += 1
+                continue
+            content = response.content  # lê o corpo (já descomprimido) dentro da medição
+            self.record_call(url, response.status_code, time.perf_counter() - t0, len(content), self.wire_bytes(response))
+            if response.status_code in RETRY_STATUS and self._retry(url, attempt, str(response.status_code), response):
+                attempt += 1
+                continue
+            return response
+
+    @staticmethod
+    def wire_bytes(response):
+        """Bytes recebidos pela rede (comprimidos, se gzip/deflate), ou None se indisponível"""
+        tell = getattr(response.raw, 'tell', None)
+        if tell is not None:
+            try:
+                return int(tell())
+            except Exception:
+                pass
+        length = response.headers.get("Content-Length")
+        return int(length) if length and length.isdigit() else None
+
+    def loads(self, raw, endpoint=None):
+        """Decodifica um corpo JSON e registra o tempo de decode por endpoint"""
+        t0 = time.perf_counter()
+        data = loads(raw)
+        if self.metrics is not None and endpoint:
+            self.metrics.record_decode(endpoint, time.perf_counter() - t0, len(raw))
+        return data
+
+    # === ENDPOINTS ===
     def authenticate(self):
         auth_url = f"{self.base_url}/Login/Autenticar?token={self.token}"
-        response = self.session.post(auth_url, proxies=self.proxies)
+        response = self.send("POST", auth_url)
         if response.text.strip().lower() == "true":
             print("Autenticação bem-sucedida.")
             return True
@@ -18,13 +174,18 @@ class SPTransClient:
             raise Exception(f"Falha na autenticação: {response.text}")
 
     def get_posicao(self):
+        return self.loads(self.get_posicao_bytes(), "Posicao")
+
+    def get_posicao_bytes(self):
+        """Corpo bruto de /Posicao (bytes), para arquivar antes de decodificar"""
         url = f"{self.base_url}/Posicao"
-        response = self.session.get(url, proxies=self.proxies)
-        if response.status_code == 200:
-            return response.json()
-        elif response.status_code in [401, 403]:
-            print("Sessão expirada. Reautenticando...")
-            self.authenticate()
-            return self.get_posicao()
-        else:
-            raise Exception(f"Erro ao acessar /Posicao: {response.status_code} - {response.text}")
\ No newline at end of file
+        for attempt in range(2):
+            response = self.send("GET", url)
+            if response.status_code == 200:
+                return response.content
+            if response.status_code in (401, 403) and attempt == 0:
+                print("Sessão expirada. Reautenticando...")
+                self.authenticate()
+                continue
+            break
+        raise Exception(f"Erro ao acessar /Posicao: {response.status_code} - {response.text[:200]}")
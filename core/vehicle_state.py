@@ -0,0 +1,215 @@
+# core/vehicle_state.py
+import numpy as np
+
+from core.geo import bearing_deg, haversine_m
+
+NO_TA = np.iinfo(np.int64).min  # vehicle_ta ausente/inválido
+KINEMATIC_COLUMNS = ["speed_kmh", "speed_smooth_kmh", "heading_deg", "heading_smooth_deg"]
+_STATE_ARRAYS = ("keys", "seen_ta", "emit_ta", "seen_py", "seen_px", "emit_py", "emit_px", "last_poll",
+                 "ring_ta", "ring_py", "ring_px", "ring_head", "ring_len")
+
+
+def vehicle_keys(vehicle_p):
+    """vehicle_p (prefixo, inteiro na API) → chaves int64; prefixos não numéricos viram hash"""
+    try:
+        return np.asarray(vehicle_p, dtype=object).astype(np.int64)
+    except (ValueError, TypeError):
+        return np.fromiter((hash(str(p)) for p in vehicle_p), dtype=np.int64, count=len(vehicle_p))
+
+
+def parse_ta(vehicle_ta):
+    """vehicle_ta ISO-8601 ('2024-01-01T12:00:00Z') → segundos epoch int64 (NO_TA se inválido)"""
+    raw = [t[:19] if isinstance(t, str) else 'NaT' for t in vehicle_ta]
+    try:
+        secs = np.array(raw, dtype='datetime64[s]').astype(np.int64)
+    except ValueError:
+        secs = np.array([_parse_one(t) for t in raw], dtype=np.int64)
+    secs[secs == np.datetime64('NaT').astype(np.int64)] = NO_TA
+    return secs
+
+
+def _parse_one(t):
+    try:
+        return np.datetime64(t, 's').astype(np.int64)
+    except ValueError:
+        return NO_TA
+
+
+class VehicleStateTable:
+    """Último estado conhecido de cada veículo (vehicle_p), em arrays ordenados por chave.
+
+    update() recebe as colunas de um snapshot (core/flatten_posicao.py) e devolve a
+    máscara das linhas que devem ser carregadas:
+    - duplicata exata (vehicle_ta e posição iguais ao último poll) é descartada;
+    - com min_move_m > 0, deslocamento menor que min_move_m desde a última posição
+      emitida também é descartado, salvo a cada heartbeat_s (tempo do veículo), para
+      o veículo parado continuar aparecendo no dia.
+    Veículos sem poll há mais de evict_after_s saem da tabela.
+
+    Cada veículo tem também um ring buffer (ring_size amostras) dos últimos
+    (vehicle_ta, py, px) distintos; com kinematics=True, update() anexa ao snapshot
+    velocidade/rumo instantâneos (duas últimas amostras) e suavizados (percurso das
+    amostras dentro de window_s), calculados em lote para a frota inteira.
+    """
+
+    def __init__(self, min_move_m=0.0, heartbeat_s=300, evict_after_s=6 * 3600,
+                 ring_size=5, window_s=600, max_speed_kmh=120.0, min_heading_m=10.0):
+        self.min_move_m = float(min_move_m or 0.0)
+        self.heartbeat_s = heartbeat_s
+        self.evict_after_s = evict_after_s
+        self.ring_size = max(2, int(ring_size))
+        self.window_s = window_s
+        self.max_speed_kmh = max_speed_kmh
+        self.min_heading_m = min_heading_m  # abaixo disso o rumo é ruído de GPS
+        self.keys = np.empty(0, dtype=np.int64)
+        self.seen_ta = np.empty(0, dtype=np.int64)     # último vehicle_ta observado
+        self.seen_py = np.empty(0, dtype=np.float64)
+        self.seen_px = np.empty(0, dtype=np.float64)
+        self.emit_ta = np.empty(0, dtype=np.int64)     # último vehicle_ta carregado
+        self.emit_py = np.empty(0, dtype=np.float64)
+        self.emit_px = np.empty(0, dtype=np.float64)
+        self.last_poll = np.empty(0, dtype=np.float64)  # relógio do poll (evicção)
+        self.ring_ta = np.empty((0, self.ring_size), dtype=np.int64)
+        self.ring_py = np.empty((0, self.ring_size), dtype=np.float64)
+        self.ring_px = np.empty((0, self.ring_size), dtype=np.float64)
+        self.ring_head = np.empty(0, dtype=np.int64)    # posição da amostra mais recente
+        self.ring_len = np.empty(0, dtype=np.int64)
+        self.last_stats = {}
+        self.totals = {"rows": 0, "kept": 0, "duplicates": 0, "collapsed": 0}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _lookup(self, keys):
+        pos = np.searchsorted(self.keys, keys)
+        pos_c = np.minimum(pos, max(len(self.keys) - 1, 0))
+        known = (pos < len(self.keys)) & (self.keys[pos_c] == keys) if len(self.keys) else np.zeros(len(keys), bool)
+        return pos_c, known
+
+    def _insert(self, keys):
+        """Acrescenta chaves novas mantendo os arrays ordenados"""
+        n = len(keys)
+        merged = np.concatenate([self.keys, keys])
+        order = np.argsort(merged, kind='stable')
+        self.keys = merged[order]
+        for name, fill in (("seen_ta", NO_TA), ("emit_ta", NO_TA), ("seen_py", np.nan), ("seen_px", np.nan),
+                           ("emit_py", np.nan), ("emit_px", np.nan), ("last_poll", 0.0),
+                           ("ring_ta", NO_TA), ("ring_py", np.nan), ("ring_px", np.nan),
+                           ("ring_head", 0), ("ring_len", 0)):
+            arr = getattr(self, name)
+            setattr(self, name, np.concatenate([arr, np.full((n,) + arr.shape[1:], fill, dtype=arr.dtype)])[order])
+
+    def _evict(self, now):
+        if self.evict_after_s is None or not len(self.keys):
+            return 0
+        keep = self.last_poll >= now - self.evict_after_s
+        evicted = int(len(keep) - keep.sum())
+        if evicted:
+            for name in _STATE_ARRAYS:
+                setattr(self, name, getattr(self, name)[keep])
+        return evicted
+
+    def _push(self, pos, ta, py, px):
+        """Acrescenta uma amostra ao ring buffer de cada veículo em pos (posições únicas)"""
+        head = (self.ring_head[pos] + 1) % self.ring_size
+        self.ring_ta[pos, head], self.ring_py[pos, head], self.ring_px[pos, head] = ta, py, px
+        self.ring_head[pos] = head
+        self.ring_len[pos] = np.minimum(self.ring_len[pos] + 1, self.ring_size)
+
+    def kinematics(self, pos):
+        """Velocidade (km/h) e rumo (graus) instantâneos e suavizados para os veículos em pos"""
+        n, k = len(pos), self.ring_size
+        j = np.arange(k)
+        idx = (self.ring_head[pos][:, None] - j[None, :]) % k  # coluna 0 = amostra mais recente
+        rows = pos[:, None]
+        t, la, lo = self.ring_ta[rows, idx], self.ring_py[rows, idx], self.ring_px[rows, idx]
+        valid = j[None, :] < self.ring_len[pos][:, None]
+        if self.window_s:
+            valid &= (t[:, :1] - t) <= self.window_s
+
+        seg = haversine_m(la[:, :-1], lo[:, :-1], la[:, 1:], lo[:, 1:])  # metros entre amostras vizinhas
+        seg_valid = valid[:, 1:]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            dt_inst = (t[:, 0] - t[:, 1]).astype(np.float64)
+            speed = np.where(seg_valid[:, 0] & (dt_inst > 0), seg[:, 0] / dt_inst * 3.6, np.nan)
+            heading = np.where(seg_valid[:, 0] & (seg[:, 0] >= self.min_heading_m),
+                               bearing_deg(la[:, 1], lo[:, 1], la[:, 0], lo[:, 0]), np.nan)
+
+            oldest = np.maximum(valid.sum(axis=1) - 1, 0)
+            r = np.arange(n)
+            dt_smooth = (t[:, 0] - t[r, oldest]).astype(np.float64)
+            path = np.where(seg_valid, seg, 0.0).sum(axis=1)
+            speed_smooth = np.where((oldest > 0) & (dt_smooth > 0), path / dt_smooth * 3.6, np.nan)
+            disp = haversine_m(la[r, oldest], lo[r, oldest], la[:, 0], lo[:, 0])
+            heading_smooth = np.where((oldest > 0) & (disp >= self.min_heading_m),
+                                      bearing_deg(la[r, oldest], lo[r, oldest], la[:, 0], lo[:, 0]), np.nan)
+
+        if self.max_speed_kmh:
+            # Salto de GPS: velocidade implausível vira NaN
+            speed[speed > self.max_speed_kmh] = np.nan
+            speed_smooth[speed_smooth > self.max_speed_kmh] = np.nan
+        return {"speed_kmh": speed, "speed_smooth_kmh": speed_smooth,
+                "heading_deg": heading, "heading_smooth_deg": heading_smooth}
+
+    def update(self, columns, now, kinematics=False):
+        """Atualiza o estado com um snapshot e devolve a máscara booleana das linhas a manter.
+
+        Com kinematics=True, as colunas de KINEMATIC_COLUMNS são anexadas a `columns`
+        (uma por linha do snapshot, antes de aplicar a máscara).
+        """
+        n = len(columns["vehicle_p"])
+        keys = vehicle_keys(columns["vehicle_p"])
+        ta = parse_ta(columns["vehicle_ta"])
+        py = np.asarray(columns["vehicle_py"], dtype=np.float64)
+        px = np.asarray(columns["vehicle_px"], dtype=np.float64)
+
+        # Veículo repetido no mesmo snapshot: vale a última ocorrência para o estado
+        rev_unique, rev_idx = np.unique(keys[::-1], return_index=True)
+        last = n - 1 - rev_idx
+        new_keys = rev_unique[~self._lookup(rev_unique)[1]]
+        if len(new_keys):
+            self._insert(new_keys)
+        pos, _ = self._lookup(keys)
+        was_seen = self.seen_ta[pos] != NO_TA
+
+        same_ta = was_seen & (ta != NO_TA) & (ta == self.seen_ta[pos])
+        duplicate = same_ta & (py == self.seen_py[pos]) & (px == self.seen_px[pos])
+        advanced = was_seen & (ta != NO_TA) & (ta > self.seen_ta[pos])
+
+        collapsed = np.zeros(n, dtype=bool)
+        if self.min_move_m > 0:
+            emitted = self.emit_ta[pos] != NO_TA
+            moved = haversine_m(self.emit_py[pos], self.emit_px[pos], py, px)
+            heartbeat = (ta - self.emit_ta[pos]) >= self.heartbeat_s if self.heartbeat_s else np.zeros(n, bool)
+            collapsed = ~duplicate & emitted & (ta != NO_TA) & (moved < self.min_move_m) & ~heartbeat
+
+        keep = ~duplicate & ~collapsed
+
+        # Estado: última ocorrência de cada veículo no snapshot
+        lpos = pos[last]
+        prev_ta = self.seen_ta[lpos]
+        new_sample = (ta[last] != NO_TA) & ((prev_ta == NO_TA) | (ta[last] > prev_ta))
+        self._push(lpos[new_sample], ta[last][new_sample], py[last][new_sample], px[last][new_sample])
+        self.seen_ta[lpos], self.seen_py[lpos], self.seen_px[lpos] = ta[last], py[last], px[last]
+        self.last_poll[lpos] = now
+        emit_last = last[keep[last]]
+        epos = pos[emit_last]
+        self.emit_ta[epos], self.emit_py[epos], self.emit_px[epos] = ta[emit_last], py[emit_last], px[emit_last]
+        if kinematics:
+            columns.update(self.kinematics(pos))
+        evicted = self._evict(now)
+
+        self.last_stats = {
+            "rows": n,
+            "kept": int(keep.sum()),
+            "duplicates": int(duplicate.sum()),
+            "collapsed": int(collapsed.sum()),
+            "advanced": int(advanced.sum()),  # vehicle_ta avançou desde o último poll
+            "known": int(was_seen.sum()),
+            "new_vehicles": len(new_keys),
+            "evicted": evicted,
+            "tracked": len(self.keys),
+        }
+        for k in self.totals:
+            self.totals[k] += self.last_stats[k]
+        return keep
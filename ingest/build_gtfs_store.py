@@ -0,0 +1,40 @@
+# ingest/build_gtfs_store.py
+"""Compila data/gtfs/*.txt no store local memory-mapped (core/gtfs_store.py).
+
+Uso:
+    python ingest/build_gtfs_store.py [--gtfs-dir data/gtfs] [--out data/gtfs_store]
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from core.config_loader import load_config
+from core.gtfs_store import build_store, GtfsStore
+
+config = load_config(os.path.join(project_root, "core", "config.json")) or {}
+STORE_PATH = os.path.join(project_root, config.get('gtfs', {}).get('store_path', 'data/gtfs_store'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--gtfs-dir", default=os.path.join(project_root, "data", "gtfs"))
+    parser.add_argument("--out", default=STORE_PATH)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s | %(levelname)s | %(message)s')
+    meta = build_store(args.gtfs_dir, args.out)
+    counts = ", ".join(f"{k}={v}" for k, v in meta["counts"].items())
+    logging.info(f"Store GTFS compilado em {meta['build_s']:.2f}s → {args.out} ({counts})")
+
+    t0 = time.perf_counter()
+    GtfsStore(args.out)
+    logging.info(f"Abertura (mmap): {(time.perf_counter() - t0) * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
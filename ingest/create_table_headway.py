@@ -0,0 +1,37 @@
+# ingest/create_table_headway.py
+import sys
+import os
+from google.cloud import bigquery
+from google.api_core.exceptions import NotFound
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from core.config_loader import load_config
+from core.schemas import SCHEMA_HEADWAY, CLUSTERING_FIELDS, partitioned_table, is_partitioned
+
+config_path = os.path.join(project_root, "core", "config.json")
+config = load_config(config_path)
+if config is None:
+    raise FileNotFoundError(f"config.json não encontrado em {config_path}")
+
+client = bigquery.Client.from_service_account_json(config['bigquery']['credentials_file'])
+project_id = config['bigquery']['project_id']
+dataset_id = config['bigquery']['dataset_id']
+table_id = config.get('posicoes', {}).get('headway', {}).get('table_id', "sptrans_headway")
+full_table_id = f"{project_id}.{dataset_id}.{table_id}"
+
+schema = SCHEMA_HEADWAY
+
+dataset_ref = client.dataset(dataset_id)
+table_ref = dataset_ref.table(table_id)
+
+try:
+    existing = client.get_table(table_ref)
+    print(f"Tabela {full_table_id} já existe.")
+    if not is_partitioned(existing):
+        print("  Sem partição por fetch_time: rode ingest/migrate_partitioning.py para migrar.")
+except NotFound:
+    table = partitioned_table(table_ref, schema, CLUSTERING_FIELDS.get("sptrans_headway"))
+    client.create_table(table)
+    print(f"Tabela {full_table_id} criada com sucesso (partição diária em fetch_time).")
@@ -2,7 +2,6 @@
 import sys
 import os
 from google.cloud import bigquery
-from google.cloud.bigquery import SchemaField
 from google.api_core.exceptions import NotFound  # Import para exceção
 
 # === CORREÇÃO DE PATH E IMPORTS ===
@@ -10,6 +9,7 @@ project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(project_root)
 
 from core.config_loader import load_config
+from core.schemas import SCHEMA_LINHAS, CLUSTERING_FIELDS, partitioned_table, is_partitioned
 
 # === CARREGAR CONFIG ===
 config_path = os.path.join(project_root, "core", "config.json")
@@ -22,29 +22,25 @@ client = bigquery.Client.from_service_account_json(config['bigquery']['credentia
 project_id = config['bigquery']['project_id']
 dataset_id = config['bigquery']['dataset_id']
 table_id = "sptrans_linhas"
-full_table_id = f"{project_id}.{dataset_id}.{table_id}"
 
 # === SCHEMA ===
-schema = [
-    SchemaField("fetch_time", "TIMESTAMP", mode="NULLABLE"),
-    SchemaField("line_c", "STRING", mode="NULLABLE"),
-    SchemaField("cl", "INTEGER", mode="NULLABLE"),
-    SchemaField("lc", "BOOL", mode="NULLABLE"),
-    SchemaField("lt", "STRING", mode="NULLABLE"),
-    SchemaField("tl", "INTEGER", mode="NULLABLE"),
-    SchemaField("sl", "INTEGER", mode="NULLABLE"),
-    SchemaField("tp", "STRING", mode="NULLABLE"),
-    SchemaField("ts", "STRING", mode="NULLABLE")
-]
+schema = SCHEMA_LINHAS
 
-# === CRIAR TABELA ===
+# === CRIAR TABELAS ===
+# sptrans_linhas + tabelas da carga incremental (_changes: append, _staging: merge)
 dataset_ref = client.dataset(dataset_id)
-table_ref = dataset_ref.table(table_id)
 
-try:
-    client.get_table(table_ref)  # Usa 'client' diretamente
-    print(f"Tabela {full_table_id} já existe.")
-except NotFound:
-    table = bigquery.Table(table_ref, schema=schema)
-    client.create_table(table)
-    print(f"Tabela {full_table_id} criada com sucesso.")
\ No newline at end of file
+for name in (table_id, f"{table_id}_changes", f"{table_id}_staging"):
+    table_ref = dataset_ref.table(name)
+    try:
+        existing = client.get_table(table_ref)  # Usa 'client' diretamente
+        print(f"Tabela {project_id}.{dataset_id}.{name} já existe.")
+        if name != f"{table_id}_staging" and not is_partitioned(existing):
+            print("  Sem partição por fetch_time: rode ingest/migrate_partitioning.py para migrar.")
+    except NotFound:
+        if name == f"{table_id}_staging":
+            table = bigquery.Table(table_ref, schema=schema)  # Staging é truncada inteira a cada MERGE
+        else:
+            table = partitioned_table(table_ref, schema, CLUSTERING_FIELDS.get(name))
+        client.create_table(table)
+        print(f"Tabela {project_id}.{dataset_id}.{name} criada com sucesso.")
@@ -2,13 +2,13 @@
 import sys
 import os
 from google.cloud import bigquery
-from google.cloud.bigquery import SchemaField
 from google.api_core.exceptions import NotFound
 
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(project_root)
 
 from core.config_loader import load_config
+from core.schemas import SCHEMA_PARADAS, CLUSTERING_FIELDS, partitioned_table, is_partitioned
 
 config_path = os.path.join(project_root, "core", "config.json")
 config = load_config(config_path)
@@ -21,23 +21,17 @@ dataset_id = config['bigquery']['dataset_id']
 table_id = "sptrans_paradas"
 full_table_id = f"{project_id}.{dataset_id}.{table_id}"
 
-schema = [
-    SchemaField("fetch_time", "TIMESTAMP", mode="NULLABLE"),
-    SchemaField("line_c", "STRING", mode="NULLABLE"),
-    SchemaField("cl", "INTEGER", mode="NULLABLE"),
-    SchemaField("cp", "INTEGER", mode="NULLABLE"),
-    SchemaField("np", "STRING", mode="NULLABLE"),
-    SchemaField("py", "FLOAT", mode="NULLABLE"),
-    SchemaField("px", "FLOAT", mode="NULLABLE")
-]
+schema = SCHEMA_PARADAS
 
 dataset_ref = client.dataset(dataset_id)
 table_ref = dataset_ref.table(table_id)
 
 try:
-    client.get_table(table_ref)
+    existing = client.get_table(table_ref)
     print(f"Tabela {full_table_id} já existe.")
+    if not is_partitioned(existing):
+        print("  Sem partição por fetch_time: rode ingest/migrate_partitioning.py para migrar.")
 except NotFound:
-    table = bigquery.Table(table_ref, schema=schema)
+    table = partitioned_table(table_ref, schema, CLUSTERING_FIELDS.get(table_id))
     client.create_table(table)
-    print(f"Tabela {full_table_id} criada com sucesso.")
\ No newline at end of file
+    print(f"Tabela {full_table_id} criada com sucesso (partição diária em fetch_time).")
\ No newline at end of file
@@ -2,13 +2,13 @@
 import sys
 import os
 from google.cloud import bigquery
-from google.cloud.bigquery import SchemaField
 
 # === CORREÇÃO DE PATH E IMPORTS ===
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(project_root)
 
 from core.config_loader import load_config
+from core.schemas import SCHEMA_POSICOES, CLUSTERING_FIELDS, partitioned_table, is_partitioned
 from core.bigquery_client import BigQueryClient  # Opcional, se usar cliente customizado
 
 # === CARREGAR CONFIG ===
@@ -25,29 +25,29 @@ table_id = config['bigquery']['table_id']  # sptrans_posicoes
 full_table_id = f"{project_id}.{dataset_id}.{table_id}"
 
 # === SCHEMA ===
-schema = [
-    SchemaField("fetch_time", "TIMESTAMP", mode="NULLABLE"),
-    SchemaField("hr", "STRING", mode="NULLABLE"),
-    SchemaField("line_c", "STRING", mode="NULLABLE"),
-    SchemaField("line_cl", "INTEGER", mode="NULLABLE"),
-    SchemaField("line_sl", "INTEGER", mode="NULLABLE"),
-    SchemaField("line_lt0", "STRING", mode="NULLABLE"),
-    SchemaField("line_lt1", "STRING", mode="NULLABLE"),
-    SchemaField("vehicle_p", "STRING", mode="NULLABLE"),
-    SchemaField("vehicle_a", "BOOL", mode="NULLABLE"),
-    SchemaField("vehicle_ta", "STRING", mode="NULLABLE"),
-    SchemaField("vehicle_py", "FLOAT", mode="NULLABLE"),
-    SchemaField("vehicle_px", "FLOAT", mode="NULLABLE")
-]
+schema = SCHEMA_POSICOES
 
 # === CRIAR TABELA ===
 dataset_ref = client.dataset(dataset_id)
 table_ref = dataset_ref.table(table_id)
 
 try:
-    client.get_table(table_ref)
-    print(f"Tabela {full_table_id} já existe.")
+    existing = client.get_table(table_ref)
 except Exception:
-    table = bigquery.Table(table_ref, schema=schema)
+    existing = None
+
+if existing is not None:
+    print(f"Tabela {full_table_id} já existe.")
+    if not is_partitioned(existing):
+        print("  Sem partição por fetch_time: rode ingest/migrate_partitioning.py para migrar.")
+    # Colunas novas do schema (ex.: nearest_stop_id, speed_kmh) entram como NULLABLE
+    existing_names = {f.name for f in existing.schema}
+    missing = [f for f in schema if f.name not in existing_names]
+    if missing:
+        existing.schema = list(existing.schema) + missing
+        client.update_table(existing, ["schema"])
+        print(f"  Colunas adicionadas: {', '.join(f.name for f in missing)}")
+else:
+    table = partitioned_table(table_ref, schema, CLUSTERING_FIELDS.get(table_id))
     client.create_table(table)
-    print(f"Tabela {full_table_id} criada com sucesso.")
\ No newline at end of file
+    print(f"Tabela {full_table_id} criada com sucesso (partição diária em fetch_time).")
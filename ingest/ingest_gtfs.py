@@ -1,25 +1,34 @@
 # ingest/ingest_gtfs.py
 import sys
 import os
-import pandas as pd
 from datetime import datetime
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from google.cloud import bigquery  # ADICIONADO: Import para LoadJobConfig
 
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(project_root)
 
-from core.config_loader import load_config
-from core.bigquery_client import BigQueryClient
+from core.clients import get_config, get_bigquery_client, get_metrics
+from core.gtfs_csv import open_load_date_stream, write_temp_csv_pandas
+from core.gtfs_manifest import GtfsManifest
+from core.gtfs_store import build_store, STORE_SOURCES, OPTIONAL_SOURCES, META_FILE
+from core.metrics import current_cycle
 
-config = load_config(os.path.join(project_root, "core", "config.json"))
-bigquery_client = BigQueryClient(
-    credentials_file=config['bigquery']['credentials_file'],
-    project_id=config['bigquery']['project_id']
-)
+config = get_config()
+bigquery_client = get_bigquery_client()
+metrics = get_metrics()
 
 GTFS_PATH = os.path.join(project_root, "data", "gtfs")
 LOAD_DATE = datetime.now().date().isoformat()
+gtfs_config = config.get('gtfs', {})
+STREAMING = gtfs_config.get('streaming', True)  # False: caminho antigo via pandas + _temp.csv
+MAX_WORKERS = gtfs_config.get('max_workers', 4)  # 1 = sequencial (um job por vez)
+STORE_PATH = os.path.join(project_root, gtfs_config.get('store_path', 'data/gtfs_store'))
+manifest = GtfsManifest(os.path.join(project_root, gtfs_config.get('manifest_path', 'data/cache/gtfs_manifest.json')))
+# Entrada derivada no manifesto: fingerprint do shapes.txt já carregado em gtfs_shapes_simplified
+SIMPLIFIED_SHAPES_ENTRY = "shapes.txt#gtfs_shapes_simplified"
 
 GTFS_FILES = {
     "agency": ("agency.txt", "gtfs_agency"),
@@ -34,13 +43,8 @@ GTFS_FILES = {
     "stop_times": ("stop_times.txt", "gtfs_stop_times")
 }
 
-def load_csv_to_bigquery(csv_path, table_id):
-    """LOAD JOB direto de CSV (free tier)"""
-    if not os.path.exists(csv_path):
-        logging.warning(f"Arquivo não encontrado: {csv_path}")
-        return
-
-    job_config = bigquery.LoadJobConfig(
+def _gtfs_job_config():
+    return bigquery.LoadJobConfig(
         source_format=bigquery.SourceFormat.CSV,
         skip_leading_rows=1,  # Pula header
         write_disposition='WRITE_TRUNCATE',
@@ -49,35 +53,218 @@ def load_csv_to_bigquery(csv_path, table_id):
         field_delimiter=','
     )
 
+def submit_load(csv_path, table_id, load_date=None):
+    """Prepara o arquivo e faz o upload do LOAD JOB; devolve o job sem esperar o término.
+
+    O upload em load_table_from_file é síncrono; depois dele o job roda no BigQuery e
+    o arquivo local (stream ou _temp.csv) já pode ser descartado.
+    """
+    load_date = load_date or LOAD_DATE
+    if STREAMING:
+        with open_load_date_stream(csv_path, load_date) as stream:
+            return bigquery_client.client.load_table_from_file(stream, table_id, job_config=_gtfs_job_config())
+
+    # Adiciona load_date manualmente
+    temp_csv = write_temp_csv_pandas(csv_path, load_date)
     try:
-        with open(csv_path, 'rb') as f:
-            job = bigquery_client.client.load_table_from_file(f, table_id, job_config=job_config)
-        job.result()  # Espera
-        row_count = job.output_rows
-        logging.info(f"LOAD JOB CSV: {row_count} linhas em {table_id} (truncate)")
-    except Exception as e:
-        logging.error(f"Erro LOAD JOB CSV em {csv_path}: {e}")
+        with open(temp_csv, 'rb') as f:
+            return bigquery_client.client.load_table_from_file(f, table_id, job_config=_gtfs_job_config())
+    finally:
+        if os.path.exists(temp_csv):
+            os.remove(temp_csv)  # Limpa temp mesmo se o upload falhar
+
+def _job_seconds(job):
+    started, ended = getattr(job, 'started', None), getattr(job, 'ended', None)
+    if started and ended:
+        return (ended - started).total_seconds()
+    return None
+
+def _table_seconds(job, upload_s, t0):
+    """Duração da própria tabela: upload + job (started/ended do BigQuery).
+
+    Os jobs são esperados em ordem de submissão, então o relógio local após o
+    job.result() incluiria a espera por tabelas mais lentas; ele só é usado se o
+    job não trouxer os horários.
+    """
+    job_s = _job_seconds(job)
+    if job_s is None:
+        return time.monotonic() - t0
+    return upload_s + job_s
+
+def _load_result(table_name, rows=None, upload_s=None, job_s=None, duration_s=None, error=None):
+    return {"table": table_name, "rows": rows, "upload_s": upload_s, "job_s": job_s,
+            "duration_s": duration_s, "error": error}
 
-def parse_and_load():
-    logging.info("Carregando GTFS offline de CSV...")
+def _timed_submit(csv_path, table_id, load_date):
+    t0 = time.monotonic()
+    job = submit_load(csv_path, table_id, load_date)
+    return job, t0, time.monotonic() - t0
+
+def _pending_files(files=None):
+    """(file_name, table_name, csv_path, table_id) dos arquivos presentes em GTFS_PATH"""
+    pending = []
     for file_name, table_name in GTFS_FILES.values():
+        if files is not None and file_name not in files:
+            continue
         csv_path = os.path.join(GTFS_PATH, file_name)
         table_id = f"{config['bigquery']['project_id']}.{config['bigquery']['dataset_id']}.{table_name}"
         
         if not os.path.exists(csv_path):
             logging.warning(f"Arquivo {file_name} não encontrado em {GTFS_PATH}. Pulando...")
             continue
-        
-        # Adiciona load_date manualmente
-        df = pd.read_csv(csv_path, dtype=str, low_memory=False)  # low_memory=False para arquivos grandes
-        df['load_date'] = LOAD_DATE
-        temp_csv = csv_path.replace('.txt', '_temp.csv')
-        df.to_csv(temp_csv, index=False)
-        
-        load_csv_to_bigquery(temp_csv, table_id)
-        if os.path.exists(temp_csv):
-            os.remove(temp_csv)  # Limpa temp
+        pending.append((file_name, table_name, csv_path, table_id))
+    return pending
+
+def record_metrics(results):
+    """Upload e job de cada tabela como etapas do ciclo de métricas (upload.<tabela>, job.<tabela>)"""
+    cycle = current_cycle()
+    for r in results:
+        if r['upload_s'] is not None:
+            cycle.record(f"upload.{r['table']}", r['upload_s'])
+        if r['job_s'] is not None or r['rows'] is not None:
+            cycle.record(f"job.{r['table']}", r['job_s'], r['rows'])
+        if r['error']:
+            cycle.fail(f"{r['table']}: {r['error']}")
+
+def log_report(results, elapsed):
+    for r in sorted(results, key=lambda r: -(r['duration_s'] or 0)):
+        if r['error']:
+            logging.error(f"  {r['table']:<22} ERRO: {r['error']}")
+            continue
+        job_s = f"{r['job_s']:.1f}s" if r['job_s'] is not None else "-"
+        logging.info(f"  {r['table']:<22} {r['rows'] or 0:>10} linhas | upload {r['upload_s']:.1f}s | "
+                     f"job {job_s} | total {r['duration_s']:.1f}s")
+    soma = sum(r['duration_s'] or 0 for r in results)
+    falhas = sum(1 for r in results if r['error'])
+    logging.info(f"GTFS: {len(results)} tabelas em {elapsed:.1f}s (soma sequencial {soma:.1f}s, {falhas} falha(s))")
+
+def parse_and_load(max_workers=None, files=None):
+    """Carrega os arquivos GTFS; devolve um resultado por tabela (linhas, tempos, erro).
+
+    Com max_workers > 1 a preparação + upload de até max_workers arquivos roda em
+    paralelo e os jobs são esperados juntos: a janela fica perto da tabela mais lenta
+    em vez da soma. files restringe a carga a esses nomes de arquivo.
+    """
+    max_workers = max_workers or MAX_WORKERS
+    load_date = datetime.now().date().isoformat()  # run_all roda por dias no mesmo processo
+    pending = _pending_files(files)
+    logging.info(f"Carregando GTFS offline de CSV ({'stream' if STREAMING else 'pandas'}, "
+                 f"{len(pending)} arquivos, até {max_workers} em paralelo)...")
+    start = time.monotonic()
+    results = []
+    submitted = []  # (table_name, job, t0, upload_s)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="gtfs") as pool:
+        futures = {pool.submit(_timed_submit, csv_path, table_id, load_date): (file_name, table_name)
+                   for file_name, table_name, csv_path, table_id in pending}
+        for future in as_completed(futures):
+            file_name, table_name = futures[future]
+            try:
+                job, t0, upload_s = future.result()
+                submitted.append((table_name, job, t0, upload_s))
+            except Exception as e:
+                logging.error(f"Erro LOAD JOB CSV em {file_name}: {e}")
+                results.append(_load_result(table_name, error=str(e)))
+
+    # Jobs já rodam no BigQuery em paralelo; aqui só esperamos todos
+    for table_name, job, t0, upload_s in submitted:
+        try:
+            job.result()
+            results.append(_load_result(table_name, rows=job.output_rows, upload_s=upload_s,
+                                        job_s=_job_seconds(job), duration_s=_table_seconds(job, upload_s, t0)))
+            logging.info(f"LOAD JOB CSV: {job.output_rows} linhas em {table_name} (truncate)")
+        except Exception as e:
+            logging.error(f"Erro LOAD JOB CSV em {table_name}: {e}")
+            results.append(_load_result(table_name, upload_s=upload_s, job_s=_job_seconds(job),
+                                        duration_s=_table_seconds(job, upload_s, t0), error=str(e)))
+
+    log_report(results, time.monotonic() - start)
+    record_metrics(results)
+    return results
+
+def ingest_changed(force=False):
+    """Recarrega só os arquivos GTFS cujo conteúdo mudou desde o último ingest.
+
+    O manifesto (sha256, tamanho, mtime) só é atualizado para tabelas carregadas sem
+    erro, então um restart ou várias chamadas no mesmo dia não recarregam nada.
+    """
+    with metrics.cycle("gtfs"):
+        return _ingest_changed(force)
+
+def _ingest_changed(force=False):
+    cycle = current_cycle()
+    paths = [os.path.join(GTFS_PATH, file_name) for file_name, _ in GTFS_FILES.values()
+             if os.path.exists(os.path.join(GTFS_PATH, file_name))]
+    with cycle.stage("manifest", rows=len(paths)):
+        changed, current = manifest.changed(paths)
+    if force:
+        changed = list(current)
+    # Conteúdo igual com mtime/tamanho novos: só atualiza o manifesto (evita re-hash)
+    touched = {name: fp for name, fp in current.items()
+               if name not in changed and manifest.entries.get(name, {}).get('mtime_ns') != fp['mtime_ns']}
+
+    if not changed:
+        if touched:
+            manifest.commit(touched)
+        logging.info(f"GTFS sem mudanças ({len(current)} arquivos conferidos pelo manifesto).")
+        with cycle.stage("store"):
+            rebuild_store([])  # Só compila se o store local ainda não existe
+        refresh_simplified_shapes(current, force)
+        return []
+
+    logging.info(f"GTFS alterado: {', '.join(sorted(changed))}")
+    results = parse_and_load(files=changed)
+    ok_tables = {r['table'] for r in results if not r['error']}
+    table_of = {file_name: table_name for file_name, table_name in GTFS_FILES.values()}
+    loaded = {name: current[name] for name in changed if table_of[name] in ok_tables}
+    manifest.commit({**touched, **loaded})
+    with cycle.stage("store"):
+        rebuild_store(changed)
+    refresh_simplified_shapes(current, force)
+    return results
+
+def refresh_simplified_shapes(current, force=False):
+    """Recarrega gtfs_shapes_simplified se o shapes.txt atual ainda não foi carregado nela.
+
+    A entrada derivada só é gravada após um load sem erro: se ele falhar, o próximo
+    ciclo tenta de novo mesmo que shapes.txt não mude.
+    """
+    fp = current.get("shapes.txt")
+    if fp is None or (not force and manifest.entries.get(SIMPLIFIED_SHAPES_ENTRY, {}).get('sha256') == fp['sha256']):
+        return None
+    with current_cycle().stage("shapes_simplified"):
+        rows = rebuild_simplified_shapes()
+    if rows is not None:
+        manifest.commit({SIMPLIFIED_SHAPES_ENTRY: fp})
+    return rows
+
+def rebuild_simplified_shapes():
+    """Recarrega gtfs_shapes_simplified (ingest/ingest_shapes.py) após um shapes.txt novo"""
+    from ingest import ingest_shapes
+    try:
+        return ingest_shapes.build_and_load()
+    except Exception as e:
+        logging.error(f"Erro ao carregar shapes simplificados: {e}")
+        return None
+
+def rebuild_store(changed=None):
+    """Recompila o store local (core/gtfs_store.py) se algum arquivo de origem mudou"""
+    sources = set(STORE_SOURCES) | set(OPTIONAL_SOURCES)
+    if changed is not None and not sources & set(changed) and os.path.exists(os.path.join(STORE_PATH, META_FILE)):
+        return None
+    try:
+        meta = build_store(GTFS_PATH, STORE_PATH)
+        logging.info(f"Store GTFS local recompilado em {meta['build_s']:.2f}s ({STORE_PATH})")
+        return meta
+    except Exception as e:
+        logging.error(f"Erro ao compilar store GTFS local: {e}")
+        return None
 
 if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Ingest GTFS offline (data/gtfs/*.txt → BigQuery)")
+    parser.add_argument("--changed-only", action="store_true", help="só arquivos alterados desde o último ingest (manifesto)")
+    args = parser.parse_args()
+
     logging.basicConfig(level=logging.INFO, format='%(asctime)s | %(levelname)s | %(message)s')
-    parse_and_load()
\ No newline at end of file
+    ingest_changed(force=not args.changed_only)
\ No newline at end of file
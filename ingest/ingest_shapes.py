@@ -0,0 +1,120 @@
+# ingest/ingest_shapes.py
+"""Shapes simplificados: uma LINESTRING por shape_id → gtfs_shapes_simplified.
+
+Uso:
+    python ingest/ingest_shapes.py [--tolerance-m 5] [--dry-run]
+
+Lê data/gtfs/shapes.txt, simplifica cada shape com Douglas–Peucker (tolerância em
+metros) e carrega uma linha por shape_id com GEOGRAPHY + nº de pontos e extensão.
+"""
+import argparse
+import csv
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+from google.cloud import bigquery
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from core.clients import get_config, get_bigquery_client
+from core.load_job import load_json_to_bigquery
+from core.schemas import SCHEMA_SHAPES_SIMPLIFIED, CLUSTERING_FIELDS
+from core.simplify import simplify_polyline, polyline_length_m, linestring_wkt
+
+config = get_config()
+bigquery_client = get_bigquery_client()
+
+GTFS_PATH = os.path.join(project_root, "data", "gtfs")
+shapes_config = config.get('gtfs', {}).get('shapes', {})
+TOLERANCE_M = shapes_config.get('tolerance_m', 5)
+SHAPES_TABLE_NAME = shapes_config.get('table', 'gtfs_shapes_simplified')
+SHAPES_TABLE = f"{config['bigquery']['project_id']}.{config['bigquery']['dataset_id']}.{SHAPES_TABLE_NAME}"
+
+
+def read_shapes(path):
+    """(shape_id, lat, lon) ordenados por (shape_id, shape_pt_sequence)"""
+    ids, seq, lat, lon = [], [], [], []
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        for row in csv.DictReader(f):
+            ids.append(row['shape_id'])
+            seq.append(int(row['shape_pt_sequence']))
+            lat.append(float(row['shape_pt_lat']))
+            lon.append(float(row['shape_pt_lon']))
+    ids = np.array(ids, dtype=object)
+    _, id_codes = np.unique(ids, return_inverse=True)
+    order = np.lexsort((np.array(seq, dtype=np.int64), id_codes))
+    return ids[order], np.array(lat)[order], np.array(lon)[order]
+
+
+def simplified_rows(path, tolerance_m, load_date):
+    ids, lat, lon = read_shapes(path)
+    if not len(ids):
+        return []
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    ends = np.r_[starts[1:], len(ids)]
+    rows = []
+    for a, b in zip(starts, ends):
+        s_lat, s_lon = simplify_polyline(lat[a:b], lon[a:b], tolerance_m)
+        if len(s_lat) < 2:
+            continue  # LINESTRING exige 2 pontos
+        rows.append({
+            "load_date": load_date,
+            "shape_id": ids[a],
+            "geom": linestring_wkt(s_lat, s_lon),
+            "points_original": int(b - a),
+            "points_simplified": len(s_lat),
+            "length_m": round(polyline_length_m(lat[a:b], lon[a:b]), 1),
+            "tolerance_m": float(tolerance_m),
+        })
+    return rows
+
+
+def ensure_table():
+    table = bigquery.Table(SHAPES_TABLE, schema=SCHEMA_SHAPES_SIMPLIFIED)
+    table.clustering_fields = CLUSTERING_FIELDS.get(SHAPES_TABLE_NAME)
+    bigquery_client.client.create_table(table, exists_ok=True)
+
+
+def build_and_load(tolerance_m=None, dry_run=False):
+    """Simplifica shapes.txt e faz o LOAD JOB (truncate) em gtfs_shapes_simplified"""
+    tolerance_m = TOLERANCE_M if tolerance_m is None else tolerance_m
+    path = os.path.join(GTFS_PATH, "shapes.txt")
+    if not os.path.exists(path):
+        logging.warning(f"shapes.txt não encontrado em {GTFS_PATH}. Pulando shapes simplificados...")
+        return None
+
+    t0 = time.monotonic()
+    rows = simplified_rows(path, tolerance_m, datetime.now().date().isoformat())
+    original = sum(r['points_original'] for r in rows)
+    simplified = sum(r['points_simplified'] for r in rows)
+    logging.info(f"Shapes simplificados (tolerância {tolerance_m} m): {len(rows)} shapes, "
+                 f"{original} → {simplified} pontos ({simplified / max(original, 1):.1%}) em {time.monotonic() - t0:.1f}s")
+    if dry_run or not rows:
+        return rows
+
+    ensure_table()
+    stats = load_json_to_bigquery(
+        client=bigquery_client.client,
+        table_id=SHAPES_TABLE,
+        rows=rows,
+        mode='truncate',  # Substitui a cada ingest do GTFS
+        source_format='ndjson'  # GEOGRAPHY em WKT
+    )
+    if stats and stats['error']:
+        raise RuntimeError(f"LOAD JOB de {SHAPES_TABLE} falhou: {stats['error']}")
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tolerance-m", type=float, default=None, help=f"tolerância Douglas–Peucker (padrão {TOLERANCE_M} m)")
+    parser.add_argument("--dry-run", action="store_true", help="só simplifica e mostra as estatísticas")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s | %(levelname)s | %(message)s')
+    build_and_load(args.tolerance_m, dry_run=args.dry_run)
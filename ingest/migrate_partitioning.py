@@ -0,0 +1,76 @@
+# ingest/migrate_partitioning.py
+"""Migra tabelas existentes sem partição para partição diária em fetch_time + clustering.
+
+Para cada tabela: copia para <tabela>_bkp_YYYYMMDD, recria particionada/clusterizada
+e recarrega o conteúdo com uma query (SELECT * do backup). O backup é mantido,
+a não ser com --drop-backup.
+
+    python ingest/migrate_partitioning.py [--dry-run] [--drop-backup]
+"""
+import argparse
+import sys
+import os
+from datetime import datetime
+from google.cloud import bigquery
+from google.api_core.exceptions import NotFound
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from core.config_loader import load_config
+from core.schemas import CLUSTERING_FIELDS, partitioned_table, is_partitioned
+
+config_path = os.path.join(project_root, "core", "config.json")
+config = load_config(config_path)
+if config is None:
+    raise FileNotFoundError(f"config.json não encontrado em {config_path}")
+
+client = bigquery.Client.from_service_account_json(config['bigquery']['credentials_file'])
+project_id = config['bigquery']['project_id']
+dataset_id = config['bigquery']['dataset_id']
+
+TABLES = [config['bigquery']['table_id'], "sptrans_linhas", "sptrans_linhas_changes", "sptrans_paradas"]
+
+
+def migrate(table_name, dry_run=False, drop_backup=False):
+    full_table_id = f"{project_id}.{dataset_id}.{table_name}"
+    try:
+        table = client.get_table(full_table_id)
+    except NotFound:
+        print(f"{full_table_id}: não existe. Rode ingest/create_table_*.py.")
+        return
+    if is_partitioned(table):
+        print(f"{full_table_id}: já particionada. Nada a fazer.")
+        return
+
+    backup_id = f"{full_table_id}_bkp_{datetime.now():%Y%m%d}"
+    print(f"{full_table_id}: {table.num_rows} linhas → backup {backup_id} e recriação particionada.")
+    if dry_run:
+        return
+
+    # 1. Backup
+    client.copy_table(full_table_id, backup_id).result()
+    # 2. Recria particionada + clusterizada com o mesmo schema
+    client.delete_table(full_table_id)
+    client.create_table(partitioned_table(full_table_id, table.schema, CLUSTERING_FIELDS.get(table_name)))
+    # 3. Recarrega (query com tabela destino; funciona no Sandbox)
+    job_config = bigquery.QueryJobConfig(
+        destination=full_table_id,
+        write_disposition=bigquery.WriteDisposition.WRITE_APPEND
+    )
+    job = client.query(f"SELECT * FROM `{backup_id}`", job_config=job_config)
+    job.result()
+    print(f"{full_table_id}: migrada ({client.get_table(full_table_id).num_rows} linhas).")
+
+    if drop_backup:
+        client.delete_table(backup_id)
+        print(f"Backup {backup_id} removido.")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="só mostra o que seria migrado")
+    parser.add_argument("--drop-backup", action="store_true", help="apaga o backup após migrar")
+    args = parser.parse_args()
+    for name in TABLES:
+        migrate(name, dry_run=args.dry_run, drop_backup=args.drop_backup)
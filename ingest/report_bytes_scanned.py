@@ -0,0 +1,61 @@
+# ingest/report_bytes_scanned.py
+"""Relatório de bytes processados (dry run) pelas queries das pipelines.
+
+Compara as tabelas atuais com outra versão delas (ex.: backups sem partição
+criados por migrate_partitioning.py) para medir antes/depois:
+
+    python ingest/report_bytes_scanned.py [--before-suffix _bkp_20261018]
+
+Obs.: o dry run já reflete a poda de partições; a poda por clustering só aparece
+nos bytes faturados do job real (total_bytes_billed), não na estimativa.
+"""
+import argparse
+import sys
+import os
+from google.cloud import bigquery
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from core.config_loader import load_config
+from core.queries import sql_linhas_unicas, sql_linhas_com_cl, sql_posicoes_linha_hoje, dry_run_bytes
+
+config_path = os.path.join(project_root, "core", "config.json")
+config = load_config(config_path)
+if config is None:
+    raise FileNotFoundError(f"config.json não encontrado em {config_path}")
+
+client = bigquery.Client.from_service_account_json(config['bigquery']['credentials_file'])
+prefix = f"{config['bigquery']['project_id']}.{config['bigquery']['dataset_id']}"
+posicoes_table = f"{prefix}.{config['bigquery']['table_id']}"
+linhas_table = f"{prefix}.sptrans_linhas"
+
+
+def queries(suffix=""):
+    return {
+        "get_linhas_unicas (enrich_linhas)": sql_linhas_unicas(posicoes_table + suffix),
+        "get_linhas_com_cl (enrich_paradas)": sql_linhas_com_cl(linhas_table + suffix),
+        "posições de hoje por line_c (VIEWs)": sql_posicoes_linha_hoje(posicoes_table + suffix),
+    }
+
+
+def fmt(nbytes):
+    return "n/d" if nbytes is None else f"{nbytes / 1e6:10.1f} MB"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--before-suffix", help="sufixo das tabelas 'antes' (ex.: _bkp_20261018)")
+    args = parser.parse_args()
+
+    depois = queries()
+    antes = queries(args.before_suffix) if args.before_suffix else {}
+    print(f"{'query':<40} {'antes':>13} {'depois':>13}")
+    for name, query in depois.items():
+        before = None
+        if name in antes:
+            try:
+                before = dry_run_bytes(client, antes[name])
+            except Exception as e:
+                print(f"  (antes indisponível: {e})")
+        print(f"{name:<40} {fmt(before):>13} {fmt(dry_run_bytes(client, query)):>13}")
@@ -10,10 +10,15 @@ import os
 project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.append(project_root)
 
-from core.config_loader import load_config
-from core.bigquery_client import BigQueryClient
-from core.sptrans_client import SPTransClient
-from core.load_job import load_json_to_bigquery  # NOVO: LOAD JOB FREE TIER
+from core.clients import get_config, get_sptrans_client, get_bigquery_client, get_fetch_engine, get_metrics
+from core.scheduler import run_periodically
+from core.load_job import load_json_to_bigquery, partition_table_id  # NOVO: LOAD JOB FREE TIER
+from core.queries import sql_linhas_unicas
+from core.schemas import SCHEMA_LINHAS
+from core.fingerprint_index import FingerprintIndex, rows_fingerprint
+from core.line_index import LineIndex
+from core.metrics import current_cycle
+from google.cloud import bigquery
 
 # === CONFIGURAÇÃO DE LOG (centralizado em /logs) ===
 log_path = os.path.join(project_root, "logs", "enrich_linhas.log")
@@ -21,48 +26,59 @@ logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s | %(levelname)s | %(message)s',
     handlers=[
-        logging.FileHandler(log_path, encoding='utf-8'),
+        logging.FileHandler(log_path, encoding='utf-8', delay=True),  # abre no 1º log: sem arquivo se o basicConfig for no-op
         logging.StreamHandler()
     ]
 )
 
-# === CARREGAR CONFIG ===
-config_path = os.path.join(project_root, "core", "config.json")
-config = load_config(config_path)
-if config is None:
-    raise FileNotFoundError(f"config.json não encontrado em {config_path}")
-
-# === CLIENTES ===
-sptrans_client = SPTransClient(
-    base_url=config['sptrans']['base_url'],
-    token=config['sptrans']['token'],
-    proxies=config.get('proxy')
-)
+# === CONFIG + CLIENTES COMPARTILHADOS (core/clients.py) ===
+config = get_config()
+sptrans_client = get_sptrans_client()
+bigquery_client = get_bigquery_client()
+metrics = get_metrics()
 
-bigquery_client = BigQueryClient(
-    credentials_file=config['bigquery']['credentials_file'],
-    project_id=config['bigquery']['project_id']
-)
+# Busca concorrente com rate limit (substitui o sleep fixo de 0.3s)
+fetch_engine = get_fetch_engine()
 
 # === TABELAS ===
 posicoes_table = f"{config['bigquery']['project_id']}.{config['bigquery']['dataset_id']}.{config['bigquery']['table_id']}"
 linhas_table = f"{config['bigquery']['project_id']}.{config['bigquery']['dataset_id']}.sptrans_linhas"
+load_format = config.get('load', {}).get('source_format', 'ndjson')  # 'ndjson' ou 'parquet'
+
+# Índice local de linhas do dia (substitui SELECT DISTINCT no BigQuery)
+line_index = LineIndex(os.path.join(project_root, config.get('line_index', {}).get('path', 'data/cache/line_index.sqlite')))
+
+# === CARGA INCREMENTAL (só linhas novas/alteradas entre truncates completos) ===
+linhas_config = config.get('linhas', {})
+load_mode = linhas_config.get('load_mode', 'incremental')            # 'incremental' ou 'truncate'
+incremental_strategy = linhas_config.get('incremental_strategy', 'append')  # 'append' ou 'merge'
+full_reload_every_s = linhas_config.get('full_reload_every_s', 3600)
+changes_table = f"{linhas_table}_changes"   # append: versões novas entre truncates
+staging_table = f"{linhas_table}_staging"   # merge: staging + MERGE (exige DML/billing)
+fingerprint_index = FingerprintIndex(
+    os.path.join(project_root, linhas_config.get('fingerprint_path', 'data/cache/linhas_fingerprints.sqlite'))
+)
 
 
 def get_linhas_unicas():
+    """line_c únicos de hoje: índice local alimentado por main_posicoes; BigQuery só se vazio"""
+    linhas = line_index.linhas()
+    if linhas:
+        logging.info(f"{len(linhas)} linhas únicas no índice local (hoje).")
+        return linhas
+    logging.info("Índice local vazio (cold start). Consultando BigQuery...")
+    return get_linhas_unicas_bigquery()
+
+
+def get_linhas_unicas_bigquery():
     """Busca line_c únicos da tabela de posições"""
-    query = f"""
-    SELECT DISTINCT line_c
-    FROM `{posicoes_table}`
-    WHERE line_c IS NOT NULL
-      AND DATE(fetch_time) = CURRENT_DATE()  -- Free tier: só hoje
-    """
+    query = sql_linhas_unicas(posicoes_table)
     logging.info("Buscando linhas únicas em sptrans_posicoes (hoje)...")
     try:
         job = bigquery_client.client.query(query)
         results = job.result()
         linhas = [row.line_c for row in results]
-        logging.info(f"{len(linhas)} linhas únicas encontradas.")
+        logging.info(f"{len(linhas)} linhas únicas encontradas ({(job.total_bytes_processed or 0) / 1e6:.1f} MB processados).")
         return linhas
     except Exception as e:
         logging.error(f"Erro ao buscar linhas únicas: {e}")
@@ -70,82 +86,166 @@ def get_linhas_unicas():
 
 
 def buscar_dados_linha(line_c):
-    """Chama API /Linha/Buscar?termosBusca=XXX"""
+    """Chama API /Linha/Buscar?termosBusca=XXX (via fetch_engine: rate limit + reauth única)"""
     termo = urllib.parse.quote(line_c)
     url = f"{config['sptrans']['base_url']}/Linha/Buscar?termosBusca={termo}"
-    try:
-        response = sptrans_client.session.get(url, proxies=sptrans_client.proxies, timeout=15)
-        if response.status_code == 200:
-            return response.json()
-        elif response.status_code == 401:
-            logging.warning(f"Token expirado para {line_c}. Reautenticando...")
-            sptrans_client.authenticate()
-            return buscar_dados_linha(line_c)
-        else:
-            logging.error(f"Erro {response.status_code} para {line_c}: {response.text}")
-            return None
-    except Exception as e:
-        logging.error(f"Exceção ao buscar {line_c}: {e}")
-        return None
+    return fetch_engine.get_json(url, label=line_c)
 
 
-def enrich_cycle():
-    """Um ciclo completo de enriquecimento (FREE TIER: REPLACE via LOAD JOB)"""
-    start_time = time.time()
-    logging.info("="*70)
-    logging.info(f"ENRIQUECIMENTO DE LINHAS - {datetime.now(timezone.utc)}")
-    logging.info("="*70)
+def full_reload_due(now=None):
+    """Truncate completo se nunca houve, se passou full_reload_every_s ou se virou o dia (UTC)"""
+    last = fingerprint_index.last_full_load
+    if load_mode != 'incremental' or last is None:
+        return True
+    now = now or time.time()
+    virou_dia = datetime.fromtimestamp(last, timezone.utc).date() != datetime.fromtimestamp(now, timezone.utc).date()
+    return virou_dia or now - last >= full_reload_every_s
 
-    try:
-        sptrans_client.authenticate()
-        linhas_unicas = get_linhas_unicas()
-        if not linhas_unicas:
-            logging.warning("Nenhuma linha única encontrada. Pulando ciclo.")
-            return
 
-        rows_to_insert = []
-        for i, line_c in enumerate(linhas_unicas):
-            logging.info(f"[{i+1}/{len(linhas_unicas)}] Buscando: {line_c}")
-            dados = buscar_dados_linha(line_c)
-            if dados and isinstance(dados, list):
-                for linha in dados:
-                    row = {
-                        "fetch_time": datetime.now(timezone.utc).isoformat(),
-                        "line_c": line_c,
-                        "cl": linha.get("cl"),
-                        "lc": linha.get("lc"),
-                        "lt": linha.get("lt"),
-                        "tl": linha.get("tl"),
-                        "sl": linha.get("sl"),
-                        "tp": linha.get("tp"),
-                        "ts": linha.get("ts")
-                    }
-                    rows_to_insert.append(row)
-            time.sleep(0.3)  # Respeita API
-
-        # LOAD JOB REPLACE (sobrescreve partição do dia)
-        logging.info("Iniciando LOAD JOB (truncate) via JSON temporário...")
-        load_json_to_bigquery(
+def merge_staging(changed, dia):
+    """MERGE do staging na partição `dia` de sptrans_linhas, substituindo só as line_c alteradas.
+
+    O alvo fica restrito ao dia: partições anteriores (histórico) não são lidas,
+    atualizadas nem apagadas.
+    """
+    query = f"""
+    MERGE `{linhas_table}` T
+    USING `{staging_table}` S
+    ON T.line_c = S.line_c AND T.cl = S.cl AND DATE(T.fetch_time) = @dia
+    WHEN MATCHED THEN UPDATE SET
+      fetch_time = S.fetch_time, lc = S.lc, lt = S.lt, tl = S.tl, sl = S.sl, tp = S.tp, ts = S.ts
+    WHEN NOT MATCHED BY TARGET THEN INSERT ROW
+    WHEN NOT MATCHED BY SOURCE AND DATE(T.fetch_time) = @dia AND T.line_c IN UNNEST(@changed) THEN DELETE
+    """
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[
+            bigquery.ArrayQueryParameter("changed", "STRING", changed),
+            bigquery.ScalarQueryParameter("dia", "DATE", dia),
+        ]
+    )
+    bigquery_client.client.query(query, job_config=job_config).result()
+
+
+def carregar_linhas(rows_to_insert):
+    """LOAD JOB truncate completo ou incremental (só line_c novas/alteradas)"""
+    por_linha = {}
+    for row in rows_to_insert:
+        por_linha.setdefault(row["line_c"], []).append(row)
+    fingerprints = {line_c: rows_fingerprint(rows) for line_c, rows in por_linha.items()}
+
+    # LOAD JOB REPLACE (sobrescreve só a partição do dia: tabela$YYYYMMDD)
+    if full_reload_due():
+        if not rows_to_insert:
+            logging.warning("Nenhum registro de linha para o truncate. Pulando LOAD JOB.")
+            return
+        dia = datetime.fromisoformat(rows_to_insert[0]["fetch_time"]).date()  # Partição = dia do fetch_time
+        logging.info(f"Iniciando LOAD JOB (truncate da partição {dia}) via {load_format}...")
+        stats = load_json_to_bigquery(
             client=bigquery_client.client,
-            table_id=linhas_table,
+            table_id=partition_table_id(linhas_table, dia),
             rows=rows_to_insert,
-            mode='truncate'  # REPLACE diário
+            mode='truncate',  # REPLACE diário
+            source_format=load_format,
+            schema=SCHEMA_LINHAS
         )
-        logging.info("LOAD JOB CONCLUÍDO! Linhas atualizadas (hoje).")
+        current_cycle().record_load(stats)
+        if stats and not stats['error']:
+            fingerprint_index.commit(fingerprints, replace_all=True)
+            logging.info("LOAD JOB CONCLUÍDO! Linhas atualizadas (hoje).")
+        elif stats:
+            current_cycle().fail(stats['error'])
+        return
+
+    changed = fingerprint_index.diff(fingerprints)
+    if not changed:
+        logging.info("Nenhuma linha nova ou alterada. LOAD JOB dispensado.")
+        return
+
+    rows_changed = [row for line_c in changed for row in por_linha[line_c]]
+    destino = changes_table if incremental_strategy == 'append' else staging_table
+    logging.info(f"{len(changed)} linhas novas/alteradas ({len(rows_changed)} registros) → {destino}")
+    stats = load_json_to_bigquery(
+        client=bigquery_client.client,
+        table_id=destino,
+        rows=rows_changed,
+        mode='append' if incremental_strategy == 'append' else 'truncate',
+        source_format=load_format,
+        schema=SCHEMA_LINHAS
+    )
+    current_cycle().record_load(stats)
+    if not stats or stats['error']:
+        if stats:
+            current_cycle().fail(stats['error'])
+        return
+    if incremental_strategy == 'merge':
+        with current_cycle().stage("merge"):
+            merge_staging(changed, datetime.fromisoformat(rows_changed[0]["fetch_time"]).date())
+    fingerprint_index.commit({line_c: fingerprints[line_c] for line_c in changed})
+    logging.info("LOAD JOB INCREMENTAL CONCLUÍDO!")
 
-    except Exception as e:
-        logging.error(f"Erro crítico no ciclo: {e}")
 
+def enrich_cycle():
+    """Um ciclo completo de enriquecimento (FREE TIER: REPLACE via LOAD JOB)"""
+    start_time = time.time()
+    logging.info("="*70)
+    logging.info(f"ENRIQUECIMENTO DE LINHAS - {datetime.now(timezone.utc)}")
+    logging.info("="*70)
+
+    with metrics.cycle("linhas") as cycle:
+        try:
+            with cycle.stage("auth"):
+                sptrans_client.authenticate()
+            with cycle.stage("linhas_unicas") as s:
+                linhas_unicas = get_linhas_unicas()
+                s.rows = len(linhas_unicas)
+            if not linhas_unicas:
+                logging.warning("Nenhuma linha única encontrada. Pulando ciclo.")
+                return
+
+            logging.info(f"Buscando {len(linhas_unicas)} linhas em /Linha/Buscar "
+                         f"({fetch_engine.max_workers} workers, {fetch_engine.bucket.rate:.0f} req/s)...")
+            fetch_time = datetime.now(timezone.utc).isoformat()
+            rows_to_insert = []
+            falhas = 0
+            with cycle.stage("fetch") as s:
+                for line_c, dados in fetch_engine.map(buscar_dados_linha, linhas_unicas):
+                    if dados is None:
+                        falhas += 1
+                    if dados and isinstance(dados, list):
+                        for linha in dados:
+                            row = {
+                                "fetch_time": fetch_time,
+                                "line_c": line_c,
+                                "cl": linha.get("cl"),
+                                "lc": linha.get("lc"),
+                                "lt": linha.get("lt"),
+                                "tl": linha.get("tl"),
+                                "sl": linha.get("sl"),
+                                "tp": linha.get("tp"),
+                                "ts": linha.get("ts")
+                            }
+                            rows_to_insert.append(row)
+                s.rows = len(rows_to_insert)
+            logging.info(f"{len(rows_to_insert)} registros de linha em {time.time() - start_time:.1f}s ({falhas} falhas).")
+
+            with cycle.stage("line_index"):
+                line_index.add_linhas_cl((row["line_c"], row["cl"]) for row in rows_to_insert)
+            with cycle.stage("load", rows=len(rows_to_insert)):
+                carregar_linhas(rows_to_insert)
+
+        except Exception as e:
+            cycle.fail(e)
+            logging.error(f"Erro crítico no ciclo: {e}")
+
+    # Intervalo de 60s garantido pelo Scheduler (sem drift), não por sleep aqui
     elapsed = time.time() - start_time
-    sleep_time = max(0, 60 - elapsed)
-    logging.info(f"Ciclo concluído em {elapsed:.1f}s. Aguardando {sleep_time:.1f}s até próximo...")
-    time.sleep(sleep_time)
+    logging.info(f"Ciclo concluído em {elapsed:.1f}s.")
 
 
 if __name__ == '__main__':
     logging.info("PIPELINE DE LINHAS INICIADO (a cada 60s - FREE TIER)")
+    metrics.start_server()
     try:
-        while True:
-            enrich_cycle()
+        run_periodically("linhas", enrich_cycle, config.get('scheduler', {}).get('linhas_s', 60))
     except KeyboardInterrupt:
         logging.info("Pipeline interrompido pelo usuário (Ctrl+C). Encerrando.")
\ No newline at end of file
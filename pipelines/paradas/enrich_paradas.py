@@ -9,10 +9,13 @@ import os
 project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.append(project_root)
 
-from core.config_loader import load_config
-from core.bigquery_client import BigQueryClient
-from core.sptrans_client import SPTransClient
-from core.load_job import load_json_to_bigquery  # NOVO: LOAD JOB FREE TIER
+from core.clients import get_config, get_sptrans_client, get_bigquery_client, get_fetch_engine, get_metrics
+from core.scheduler import run_periodically
+from core.load_job import load_json_to_bigquery, partition_table_id  # NOVO: LOAD JOB FREE TIER
+from core.queries import sql_linhas_com_cl
+from core.schemas import SCHEMA_PARADAS
+from core.response_cache import ResponseCache
+from core.line_index import LineIndex
 
 # === CONFIGURAÇÃO DE LOG (centralizado em /logs) ===
 log_path = os.path.join(project_root, "logs", "enrich_paradas.log")
@@ -20,51 +23,59 @@ logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s | %(levelname)s | %(message)s',
     handlers=[
-        logging.FileHandler(log_path, encoding='utf-8'),
+        logging.FileHandler(log_path, encoding='utf-8', delay=True),  # abre no 1º log: sem arquivo se o basicConfig for no-op
         logging.StreamHandler()
     ]
 )
 
-# === CARREGAR CONFIG ===
-config_path = os.path.join(project_root, "core", "config.json")
-config = load_config(config_path)
-if config is None:
-    raise FileNotFoundError(f"config.json não encontrado em {config_path}")
-
-# === CLIENTES ===
-sptrans_client = SPTransClient(
-    base_url=config['sptrans']['base_url'],
-    token=config['sptrans']['token'],
-    proxies=config.get('proxy')
-)
-
-bigquery_client = BigQueryClient(
-    credentials_file=config['bigquery']['credentials_file'],
-    project_id=config['bigquery']['project_id']
+# === CONFIG + CLIENTES COMPARTILHADOS (core/clients.py) ===
+config = get_config()
+sptrans_client = get_sptrans_client()
+bigquery_client = get_bigquery_client()
+metrics = get_metrics()
+
+# Busca concorrente com rate limit (substitui o sleep fixo de 0.3s)
+fetch_engine = get_fetch_engine()
+
+# Cache local de /Parada/BuscarParadasPorLinha por cl (paradas quase não mudam)
+paradas_config = config.get('paradas', {})
+paradas_cache = ResponseCache(
+    path=os.path.join(project_root, paradas_config.get('cache_path', 'data/cache/paradas.sqlite')),
+    ttl_s=paradas_config.get('cache_ttl_s', 604800),  # 7 dias
+    max_stale_s=paradas_config.get('cache_max_stale_s', 2592000)  # fallback com a API fora: até 30 dias
 )
 
 # === TABELAS ===
 linhas_table = f"{config['bigquery']['project_id']}.{config['bigquery']['dataset_id']}.sptrans_linhas"
 paradas_table = f"{config['bigquery']['project_id']}.{config['bigquery']['dataset_id']}.sptrans_paradas"
+load_format = config.get('load', {}).get('source_format', 'ndjson')  # 'ndjson' ou 'parquet'
+
+# Índice local de linhas do dia (substitui SELECT DISTINCT no BigQuery)
+line_index = LineIndex(os.path.join(project_root, config.get('line_index', {}).get('path', 'data/cache/line_index.sqlite')))
 
 # === INTERVALO: 24 HORAS ===
 INTERVALO_24H = 86400  # 24 horas em segundos
 
 
 def get_linhas_com_cl():
+    """(line_c, cl) de hoje: índice local alimentado por enrich_linhas; BigQuery só se vazio"""
+    linhas = line_index.linhas_com_cl()
+    if linhas:
+        logging.info(f"{len(linhas)} linhas com cl no índice local (hoje).")
+        return linhas
+    logging.info("Índice local vazio (cold start). Consultando BigQuery...")
+    return get_linhas_com_cl_bigquery()
+
+
+def get_linhas_com_cl_bigquery():
     """Pega line_c e cl da tabela sptrans_linhas (hoje)"""
-    query = f"""
-    SELECT DISTINCT line_c, cl
-    FROM `{linhas_table}`
-    WHERE cl IS NOT NULL
-      AND DATE(fetch_time) = CURRENT_DATE()  -- Free tier: só hoje
-    """
+    query = sql_linhas_com_cl(linhas_table)
     logging.info("Buscando linhas com código interno (cl) em sptrans_linhas (hoje)...")
     try:
         job = bigquery_client.client.query(query)
         results = job.result()
         linhas = [(row.line_c, row.cl) for row in results]
-        logging.info(f"{len(linhas)} linhas com cl encontradas.")
+        logging.info(f"{len(linhas)} linhas com cl encontradas ({(job.total_bytes_processed or 0) / 1e6:.1f} MB processados).")
         return linhas
     except Exception as e:
         logging.error(f"Erro ao buscar linhas com cl: {e}")
@@ -72,22 +83,9 @@ def get_linhas_com_cl():
 
 
 def buscar_paradas_por_linha(cl):
-    """Chama API /Parada/BuscarParadasPorLinha?codigoLinha=12345"""
+    """Chama API /Parada/BuscarParadasPorLinha?codigoLinha=12345 (via fetch_engine)"""
     url = f"{config['sptrans']['base_url']}/Parada/BuscarParadasPorLinha?codigoLinha={cl}"
-    try:
-        response = sptrans_client.session.get(url, proxies=sptrans_client.proxies, timeout=15)
-        if response.status_code == 200:
-            return response.json()
-        elif response.status_code == 401:
-            logging.warning(f"Token expirado para cl={cl}. Reautenticando...")
-            sptrans_client.authenticate()
-            return buscar_paradas_por_linha(cl)
-        else:
-            logging.error(f"Erro {response.status_code} para cl={cl}: {response.text}")
-            return None
-    except Exception as e:
-        logging.error(f"Exceção para cl={cl}: {e}")
-        return None
+    return fetch_engine.get_json(url, label=f"cl={cl}")
 
 
 def enrich_cycle():
@@ -98,53 +96,89 @@ def enrich_cycle():
     logging.info("PRÓXIMA EXECUÇÃO EM 24 HORAS")
     logging.info("="*70)
 
-    try:
-        sptrans_client.authenticate()
-        linhas = get_linhas_com_cl()
-        if not linhas:
-            logging.warning("Nenhuma linha com cl. Pulando ciclo.")
-            return
-
-        rows_to_insert = []
-        for i, (line_c, cl) in enumerate(linhas):
-            logging.info(f"[{i+1}/{len(linhas)}] Buscando paradas para {line_c} (cl={cl})")
-            dados = buscar_paradas_por_linha(cl)
-            if dados and isinstance(dados, list):
-                for p in dados:
-                    row = {
-                        "fetch_time": datetime.now(timezone.utc).isoformat(),
-                        "line_c": line_c,
-                        "cl": cl,
-                        "cp": p.get("cp"),
-                        "np": p.get("np"),
-                        "py": p.get("py"),
-                        "px": p.get("px")
-                    }
-                    rows_to_insert.append(row)
-            time.sleep(0.3)  # Respeita API
-
-        # LOAD JOB REPLACE (sobrescreve partição do dia)
-        logging.info("Iniciando LOAD JOB (truncate) via JSON temporário...")
-        load_json_to_bigquery(
-            client=bigquery_client.client,
-            table_id=paradas_table,
-            rows=rows_to_insert,
-            mode='truncate'  # REPLACE diário
-        )
-        logging.info("LOAD JOB CONCLUÍDO! Paradas atualizadas (hoje).")
-
-    except Exception as e:
-        logging.error(f"Erro crítico no ciclo: {e}")
-
+    with metrics.cycle("paradas") as cycle:
+        try:
+            with cycle.stage("auth"):
+                sptrans_client.authenticate()
+            with cycle.stage("linhas_com_cl") as s:
+                linhas = get_linhas_com_cl()
+                s.rows = len(linhas)
+            if not linhas:
+                logging.warning("Nenhuma linha com cl. Pulando ciclo.")
+                return
+
+            # 1. Cache: só vai à API para cl novo ou expirado
+            respostas = {}
+            pendentes = []
+            with cycle.stage("cache", rows=len(linhas)):
+                for line_c, cl in linhas:
+                    dados = paradas_cache.get(cl)
+                    if dados is None:
+                        pendentes.append(cl)
+                    else:
+                        respostas[cl] = dados
+            logging.info(f"Cache de paradas: {len(respostas)} hits, {len(pendentes)} cl para buscar na API.")
+
+            # 2. Busca concorrente dos pendentes (fallback para o cache vencido se a API falhar)
+            mudaram = 0
+            with cycle.stage("fetch", rows=len(pendentes)):
+                for cl, dados in fetch_engine.map(buscar_paradas_por_linha, list(dict.fromkeys(pendentes))):
+                    if dados is None:
+                        dados = paradas_cache.get(cl, allow_stale=True)
+                    elif paradas_cache.put(cl, dados):
+                        mudaram += 1
+                    if dados is not None:
+                        respostas[cl] = dados
+            logging.info(f"{len(pendentes)} cl buscados ({mudaram} novos/alterados).")
+
+            fetch_now = datetime.now(timezone.utc)
+            fetch_time = fetch_now.isoformat()
+            rows_to_insert = []
+            for line_c, cl in linhas:
+                dados = respostas.get(cl)
+                if dados and isinstance(dados, list):
+                    for p in dados:
+                        row = {
+                            "fetch_time": fetch_time,
+                            "line_c": line_c,
+                            "cl": cl,
+                            "cp": p.get("cp"),
+                            "np": p.get("np"),
+                            "py": p.get("py"),
+                            "px": p.get("px")
+                        }
+                        rows_to_insert.append(row)
+
+            # LOAD JOB REPLACE (sobrescreve só a partição do dia: tabela$YYYYMMDD)
+            logging.info(f"Iniciando LOAD JOB (truncate da partição {fetch_now.date()}) via {load_format}...")
+            with cycle.stage("load", rows=len(rows_to_insert)):
+                stats = load_json_to_bigquery(
+                    client=bigquery_client.client,
+                    table_id=partition_table_id(paradas_table, fetch_now.date()),
+                    rows=rows_to_insert,
+                    mode='truncate',  # REPLACE diário
+                    source_format=load_format,
+                    schema=SCHEMA_PARADAS
+                )
+            cycle.record_load(stats)
+            if stats and stats['error']:
+                cycle.fail(stats['error'])
+            logging.info("LOAD JOB CONCLUÍDO! Paradas atualizadas (hoje).")
+            paradas_cache.evict_expired()
+
+        except Exception as e:
+            cycle.fail(e)
+            logging.error(f"Erro crítico no ciclo: {e}")
+
+    # Intervalo de 24h garantido pelo Scheduler, não por sleep aqui
     elapsed = time.time() - start_time
-    logging.info(f"Ciclo concluído em {elapsed:.1f}s. Aguardando 24h...")
-    time.sleep(INTERVALO_24H)  # 24 HORAS
+    logging.info(f"Ciclo concluído em {elapsed:.1f}s.")
 
 
 if __name__ == '__main__':
     logging.info("PIPELINE DE PARADAS INICIADO (a cada 24h - FREE TIER)")
+    metrics.start_server()
     try:
-        while True:
-            enrich_cycle()
+        run_periodically("paradas", enrich_cycle, config.get('scheduler', {}).get('paradas_s', INTERVALO_24H))
     except KeyboardInterrupt:
         logging.info("Interrompido pelo usuário.")
\ No newline at end of file
@@ -4,15 +4,26 @@ import logging
 from datetime import datetime, timezone
 import sys
 import os
+import numpy as np
 
 # === CORREÇÃO DE PATH E IMPORTS ===
 project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.append(project_root)
 
-from core.config_loader import load_config
-from core.bigquery_client import BigQueryClient
-from core.sptrans_client import SPTransClient
-from core.load_job import load_json_to_bigquery  # NOVO: LOAD JOB FREE TIER
+from core.clients import get_config, get_sptrans_client, get_bigquery_client, get_gtfs_store, get_metrics
+from core.scheduler import run_periodically
+from core.load_job import load_json_to_bigquery, num_rows  # NOVO: LOAD JOB FREE TIER
+from core.flatten_posicao import flatten_posicao
+from core.micro_batch import MicroBatchBuffer
+from core.line_index import LineIndex
+from core.schemas import SCHEMA_POSICOES, SCHEMA_HEADWAY
+from core.spatial_index import NearestStopIndex
+from core.map_match import ShapeMatcher, sl_to_direction
+from core.headway import ScheduledHeadwayIndex, headway_table
+from core.snapshot_archive import SnapshotArchive
+from core.vehicle_state import VehicleStateTable
+from core.poll_cadence import AdaptivePollCadence, service_profile
+from core.metrics import current_cycle, stage
 
 # === CONFIGURAÇÃO DE LOG (centralizado em /logs) ===
 log_path = os.path.join(project_root, "logs", "etl_posicoes.log")
@@ -20,31 +31,342 @@ logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s | %(levelname)s | %(message)s',
     handlers=[
-        logging.FileHandler(log_path, encoding='utf-8'),
+        logging.FileHandler(log_path, encoding='utf-8', delay=True),  # abre no 1º log: sem arquivo se o basicConfig for no-op
         logging.StreamHandler()
     ]
 )
 
-# === CARREGAR CONFIG ===
-config_path = os.path.join(project_root, "core", "config.json")
-config = load_config(config_path)
-if config is None:
-    raise FileNotFoundError(f"config.json não encontrado em {config_path}")
-
-# === CLIENTES ===
-sptrans_client = SPTransClient(
-    base_url=config['sptrans']['base_url'],
-    token=config['sptrans']['token'],
-    proxies=config.get('proxy')
+# === CONFIG + CLIENTES COMPARTILHADOS (core/clients.py) ===
+config = get_config()
+sptrans_client = get_sptrans_client()
+bigquery_client = get_bigquery_client()
+metrics = get_metrics()
+
+# === TABELAS ===
+posicoes_table = f"{config['bigquery']['project_id']}.{config['bigquery']['dataset_id']}.{config['bigquery']['table_id']}"
+load_format = config.get('load', {}).get('source_format', 'ndjson')  # 'ndjson' ou 'parquet'
+
+# Índice local de linhas do dia (substitui SELECT DISTINCT no BigQuery)
+line_index = LineIndex(os.path.join(project_root, config.get('line_index', {}).get('path', 'data/cache/line_index.sqlite')))
+
+
+def load_posicoes(columns):
+    """LOAD JOB APPEND (FREE TIER - ZERO DML) de um lote de snapshots"""
+    stats = load_json_to_bigquery(
+        client=bigquery_client.client,
+        table_id=posicoes_table,
+        rows=columns,
+        mode='append',  # Acumula em tempo real
+        source_format=load_format,
+        schema=SCHEMA_POSICOES
+    )
+    current_cycle().record_load(stats, "load.posicoes")
+    return stats
+
+
+# === MICRO-BATCH: acumula polls e faz 1 LOAD JOB por limite de linhas/idade ===
+# Buffers criados no primeiro uso: o replay importa este módulo e não pode abrir (nem
+# recuperar/limpar) o spool do processo ao vivo
+posicoes_config = config.get('posicoes', {})
+_buffers = {}
+
+
+def micro_batch(name, spool_dir, flush_fn):
+    if name not in _buffers:
+        _buffers[name] = MicroBatchBuffer(
+            spool_dir=os.path.join(project_root, spool_dir),
+            flush_fn=flush_fn,
+            max_rows=posicoes_config.get('batch_max_rows', 150000),
+            max_age_s=posicoes_config.get('batch_max_age_s', 300)
+        )
+    return _buffers[name]
+
+
+def posicoes_buffer():
+    return micro_batch("posições", posicoes_config.get('spool_dir', 'data/spool/posicoes'), load_posicoes)
+
+# === ESTADO POR VEÍCULO: descarta polls sem vehicle_ta novo (veículo parado/fora de operação)
+# e calcula velocidade/rumo observados a partir do ring buffer de amostras ===
+dedup_config = posicoes_config.get('dedup', {})
+kinematics_config = posicoes_config.get('kinematics', {})
+vehicle_state = VehicleStateTable(
+    min_move_m=dedup_config.get('min_move_m', 0),
+    heartbeat_s=dedup_config.get('heartbeat_s', 300),
+    evict_after_s=dedup_config.get('evict_after_s', 6 * 3600),
+    ring_size=kinematics_config.get('ring_size', 5),
+    window_s=kinematics_config.get('window_s', 600),
+    max_speed_kmh=kinematics_config.get('max_speed_kmh', 120)
 )
 
-bigquery_client = BigQueryClient(
-    credentials_file=config['bigquery']['credentials_file'],
-    project_id=config['bigquery']['project_id']
+
+def update_vehicle_state(columns):
+    """Atualiza o VehicleStateTable e anexa velocidade/rumo; devolve a máscara de veículos com posição nova"""
+    t0 = time.perf_counter()
+    keep = vehicle_state.update(columns, now=time.monotonic(), kinematics=kinematics_config.get('enabled', True))
+    s = vehicle_state.last_stats
+    logging.info(f"Estado: {s['kept']}/{s['rows']} mantidos | {s['duplicates']} duplicados | "
+                 f"{s['collapsed']} colapsados (<{vehicle_state.min_move_m:.0f} m) | {s['tracked']} veículos rastreados "
+                 f"| {(time.perf_counter() - t0) * 1000:.0f} ms.")
+    return keep
+
+
+def drop_unchanged(columns, keep):
+    """Aplica a máscara do dedup depois do enriquecimento (headway usa o snapshot inteiro)"""
+    if keep is None or not dedup_config.get('enabled', True) or keep.all():
+        return columns
+    return {name: col[keep] for name, col in columns.items()}
+
+
+# === PARADA MAIS PRÓXIMA (índice em grade sobre o store GTFS local) ===
+nearest_config = posicoes_config.get('nearest_stop', {})
+_stop_index = None  # (store, NearestStopIndex): refeito quando o store é recompilado
+_store_warned = False
+
+
+def nearest_stop_index():
+    global _stop_index
+    store = get_gtfs_store()
+    if store is None:
+        return None, None
+    if _stop_index is None or _stop_index[0] is not store:
+        _stop_index = (store, NearestStopIndex(
+            store,
+            per_route=nearest_config.get('per_route', False),
+            cell_m=nearest_config.get('cell_m', 250)
+        ))
+    return _stop_index
+
+
+def add_nearest_stop(columns):
+    """Anexa nearest_stop_id e distance_m a cada veículo do snapshot (vetorizado)"""
+    global _store_warned
+    store, index = nearest_stop_index()
+    if index is None:
+        if not _store_warned:
+            logging.warning("Store GTFS não compilado (ingest/build_gtfs_store.py): sem parada mais próxima.")
+            _store_warned = True
+        return columns
+    route_idx = store.route_indices(columns["line_c"]) if index.by_route is not None else None
+    stop_id, dist = index.nearest(
+        columns["vehicle_py"], columns["vehicle_px"],
+        route_idx=route_idx, max_dist_m=nearest_config.get('max_dist_m', 1000)
+    )
+    ids = stop_id.astype(object)
+    ids[stop_id < 0] = None
+    columns["nearest_stop_id"] = ids
+    columns["distance_m"] = dist
+    return columns
+
+
+# === MAP-MATCHING (segmentos dos shapes GTFS por linha/sentido) ===
+match_config = posicoes_config.get('map_match', {})
+_shape_matcher = None  # (store, ShapeMatcher): refeito quando o store é recompilado
+
+
+def shape_matcher():
+    global _shape_matcher
+    store = get_gtfs_store()
+    if store is None or not store.has_shapes:
+        return None, None
+    if _shape_matcher is None or _shape_matcher[0] is not store:
+        t0 = time.perf_counter()
+        _shape_matcher = (store, ShapeMatcher(
+            store,
+            cell_m=match_config.get('cell_m', 200),
+            max_snap_m=match_config.get('max_snap_m', 150),
+            simplify_m=match_config.get('simplify_m', 2)
+        ))
+        logging.info(f"Índice de shapes: {len(_shape_matcher[1])} segmentos em {time.perf_counter() - t0:.1f}s.")
+    return _shape_matcher
+
+
+def add_map_match(columns):
+    """Anexa shape_id, shape_dist_m (distância ao longo do shape) e snap_dist_m (vetorizado)"""
+    store, matcher = shape_matcher()
+    if matcher is None:
+        return columns
+    shape, along, snap = matcher.match(
+        columns["vehicle_py"], columns["vehicle_px"],
+        route_idx=store.route_indices(columns["line_c"]),
+        direction=sl_to_direction(columns["line_sl"])
+    )
+    columns["shape_id"] = matcher.shape_ids(shape)
+    columns["shape_dist_m"] = along
+    columns["snap_dist_m"] = snap
+    return columns
+
+
+# === HEADWAY OBSERVADO x PROGRAMADO (frequencies.txt) → sptrans_headway ===
+headway_config = posicoes_config.get('headway', {})
+headway_table_id = f"{config['bigquery']['project_id']}.{config['bigquery']['dataset_id']}.{headway_config.get('table_id', 'sptrans_headway')}"
+_headway_index = None  # (store, ScheduledHeadwayIndex)
+
+
+def load_headway(columns):
+    """LOAD JOB APPEND de um lote da tabela de aderência de headway"""
+    stats = load_json_to_bigquery(
+        client=bigquery_client.client,
+        table_id=headway_table_id,
+        rows=columns,
+        mode='append',
+        source_format=load_format,
+        schema=SCHEMA_HEADWAY
+    )
+    current_cycle().record_load(stats, "load.headway")
+    return stats
+
+
+def headway_buffer():
+    return micro_batch("headway", headway_config.get('spool_dir', 'data/spool/headway'), load_headway)
+
+
+def scheduled_headway_index():
+    global _headway_index
+    store = get_gtfs_store()
+    if store is None:
+        return None, None
+    if _headway_index is None or _headway_index[0] is not store:
+        _headway_index = (store, ScheduledHeadwayIndex(store))
+    return _headway_index
+
+
+def add_headway(columns, sink):
+    """Headway observado entre veículos consecutivos (mesma linha/sentido) x programado, por linha"""
+    store, index = scheduled_headway_index()
+    if store is None or "shape_dist_m" not in columns:
+        return None
+    table = headway_table(
+        columns, store.route_indices(columns["line_c"]), index,
+        bunching_ratio=headway_config.get('bunching_ratio', 0.25),
+        default_speed_kmh=headway_config.get('default_speed_kmh', 15),
+        min_speed_kmh=headway_config.get('min_speed_kmh', 5)
+    )
+    if num_rows(table) and sink is not None:
+        sink(table)
+    return table
+
+
+# === ARQUIVO LOCAL DO /Posicao BRUTO (zstd, segmentos por hora) → replay_posicoes.py ===
+archive_config = posicoes_config.get('archive', {})
+_archive = None
+
+
+def open_archive():
+    global _archive
+    if _archive is None:
+        _archive = SnapshotArchive(
+            os.path.join(project_root, archive_config.get('dir', 'data/archive/posicoes')),
+            segment_s=archive_config.get('segment_s', 3600),
+            level=archive_config.get('level', 3),
+            fsync=archive_config.get('fsync', True)
+        )
+    return _archive
+
+
+def archive_snapshot(raw, fetch_dt):
+    """Grava o corpo bruto no arquivo local; falha aqui não interrompe o ciclo"""
+    try:
+        with stage("archive") as s:
+            archive = open_archive()
+            size = s.nbytes = archive.append(raw, fetch_dt)
+            retention_days = archive_config.get('retention_days', 7)
+            removed = archive.prune(retention_days * 86400) if retention_days else 0
+        logging.info(f"Arquivo: {len(raw) / 1e6:.1f} MB → {size / 1e6:.2f} MB zstd em {s.seconds * 1000:.0f} ms"
+                     + (f" | {removed} segmentos antigos removidos." if removed else "."))
+    except Exception as e:
+        logging.error(f"Erro ao arquivar /Posicao (seguindo sem): {e}")
+
+
+# === CADÊNCIA ADAPTATIVA: intervalo do /Posicao pela fração de veículos com vehicle_ta novo ===
+cadence_config = posicoes_config.get('cadence', {})
+base_interval_s = config.get('scheduler', {}).get('posicoes_s', 60)
+cadence = AdaptivePollCadence(
+    base_s=base_interval_s,
+    min_s=cadence_config.get('min_s', 20),
+    max_s=cadence_config.get('max_s', 180),
+    target_advance=cadence_config.get('target_advance', 0.8),
+    smoothing=cadence_config.get('smoothing', 0.5),
+    min_vehicles=cadence_config.get('min_vehicles', 100),
+    gtfs_weight=cadence_config.get('gtfs_weight', 0.3),
+    metrics=metrics
 )
+# Intervalo passado ao Scheduler: callable (adaptativo) ou o fixo de scheduler.posicoes_s
+poll_interval = cadence.interval if cadence_config.get('enabled', True) else base_interval_s
+_cadence_store = None
 
-# === TABELAS ===
-posicoes_table = f"{config['bigquery']['project_id']}.{config['bigquery']['dataset_id']}.{config['bigquery']['table_id']}"
+
+def update_cadence():
+    """Recalcula o intervalo com as estatísticas do último snapshot (vehicle_state.last_stats)"""
+    global _cadence_store
+    if not cadence_config.get('enabled', True) or not vehicle_state.last_stats:
+        return None
+    store = get_gtfs_store()
+    if store is not _cadence_store:
+        _cadence_store = store
+        cadence.set_profile(service_profile(store) if store is not None else None)
+    s = vehicle_state.last_stats
+    return cadence.observe(s['advanced'], s['known'])
+
+
+def enrich_snapshot(columns, headway_sink=None):
+    """Estado por veículo, parada mais próxima, map-matching e headway; devolve as linhas a carregar"""
+    keep = None
+    n = num_rows(columns)
+    if dedup_config.get('enabled', True) or kinematics_config.get('enabled', True):
+        with stage("vehicle_state", rows=n):
+            keep = update_vehicle_state(columns)
+
+    if nearest_config.get('enabled', True):
+        try:
+            with stage("nearest_stop", rows=n) as s:
+                add_nearest_stop(columns)
+            matched = int(np.count_nonzero(np.isfinite(columns.get("distance_m", ()))))
+            logging.info(f"Parada mais próxima: {matched}/{n} veículos em {s.seconds * 1000:.0f} ms.")
+        except Exception as e:
+            logging.error(f"Erro no cálculo da parada mais próxima (seguindo sem): {e}")
+
+    if match_config.get('enabled', True):
+        try:
+            with stage("map_match", rows=n) as s:
+                add_map_match(columns)
+            matched = int(np.count_nonzero(np.isfinite(columns.get("shape_dist_m", ()))))
+            logging.info(f"Map-matching: {matched}/{n} veículos em {s.seconds * 1000:.0f} ms.")
+        except Exception as e:
+            logging.error(f"Erro no map-matching (seguindo sem): {e}")
+
+    if headway_config.get('enabled', True) and headway_sink is not None:
+        try:
+            with stage("headway") as s:
+                table = add_headway(columns, headway_sink)
+                s.rows = num_rows(table) if table is not None else 0
+            if table is not None:
+                ratio = table["headway_ratio"].astype(np.float64)
+                median = np.nanmedian(ratio) if np.isfinite(ratio).any() else float('nan')
+                logging.info(f"Headway: {num_rows(table)} linhas/sentidos | razão observado/programado mediana "
+                             f"{median:.2f} em {s.seconds * 1000:.0f} ms.")
+        except Exception as e:
+            logging.error(f"Erro no cálculo de headway (seguindo sem): {e}")
+
+    return drop_unchanged(columns, keep)
+
+
+def flush_stale_buffers():
+    """Descarrega buffers que passaram de batch_max_age_s sem um add() novo"""
+    for name, buffer in list(_buffers.items()):
+        try:
+            stats = buffer.flush_if_stale()
+            if stats and stats.get('error'):
+                current_cycle().fail(stats['error'])
+            elif stats:
+                logging.info(f"LOAD JOB ({name}, buffer vencido): {stats['rows']} linhas appendadas.")
+        except Exception as e:
+            logging.error(f"Erro ao descarregar buffer vencido ({name}): {e}")
+
+
+def flush_buffers():
+    """Descarrega tudo que está nos buffers (encerramento); só os que já foram abertos"""
+    for buffer in list(_buffers.values()):
+        buffer.flush()
 
 
 def etl_cycle():
@@ -54,76 +376,88 @@ def etl_cycle():
     logging.info(f"ETL POSIÇÕES - {datetime.now(timezone.utc)}")
     logging.info("="*70)
 
-    try:
-        # 1. Autenticar (se necessário)
-        if not sptrans_client.session.cookies:
-            sptrans_client.authenticate()
-
-        # 2. Extrair dados da API /Posicao
-        logging.info("Extraindo dados da API /Posicao...")
-        data = sptrans_client.get_posicao()
-        if not data:
-            logging.warning("Nenhum dado retornado pela API. Pulando ciclo.")
-            return
-
-        hr = data.get('hr', 'N/A')
-        rows_to_insert = []
-
-        for line in data.get('l', []):
-            line_c = line.get("c")
-            line_cl = line.get("cl")
-            line_sl = line.get("sl")
-            line_lt0 = line.get("lt0")
-            line_lt1 = line.get("lt1")
-
-            for vehicle in line.get('vs', []):
-                row = {
-                    "fetch_time": datetime.now(timezone.utc).isoformat(),
-                    "hr": hr,
-                    "line_c": line_c,
-                    "line_cl": line_cl,
-                    "line_sl": line_sl,
-                    "line_lt0": line_lt0,
-                    "line_lt1": line_lt1,
-                    "vehicle_p": vehicle.get("p"),
-                    "vehicle_a": vehicle.get("a"),
-                    "vehicle_ta": vehicle.get("ta"),
-                    "vehicle_py": vehicle.get("py"),
-                    "vehicle_px": vehicle.get("px")
-                }
-                rows_to_insert.append(row)
-
-        logging.info(f"{len(rows_to_insert)} veículos extraídos.")
-
-        # 3. LOAD JOB APPEND (FREE TIER - ZERO DML)
-        logging.info("Iniciando LOAD JOB (append) via JSON temporário...")
-        load_json_to_bigquery(
-            client=bigquery_client.client,
-            table_id=posicoes_table,
-            rows=rows_to_insert,
-            mode='append'  # Acumula em tempo real
-        )
-        logging.info("LOAD JOB CONCLUÍDO! Dados appendados com sucesso.")
-
-    except Exception as e:
-        logging.error(f"Erro crítico no ciclo ETL: {e}")
+    with metrics.cycle("posicoes") as cycle:
         try:
-            logging.info("Tentando reautenticar...")
-            sptrans_client.authenticate()
-        except Exception as auth_e:
-            logging.error(f"Falha na reautenticação: {auth_e}")
+            # 1. Autenticar (se necessário)
+            if not sptrans_client.session.cookies:
+                with cycle.stage("auth"):
+                    sptrans_client.authenticate()
+
+            # 2. Extrair dados da API /Posicao
+            logging.info("Extraindo dados da API /Posicao...")
+            if archive_config.get('enabled', True):
+                with cycle.stage("fetch") as s:
+                    raw = sptrans_client.get_posicao_bytes()
+                    s.nbytes = len(raw or b"")
+                fetch_dt = datetime.now(timezone.utc)
+                if raw:
+                    archive_snapshot(raw, fetch_dt)
+                with cycle.stage("decode", nbytes=len(raw or b"")):
+                    data = sptrans_client.loads(raw, "Posicao") if raw else None
+            else:
+                with cycle.stage("fetch"):
+                    data = sptrans_client.get_posicao()
+                fetch_dt = datetime.now(timezone.utc)
+            api = cycle.api.get("Posicao")
+            if api:
+                logging.info(f"/Posicao: {api['bytes'] / 1e6:.1f} MB ({api['wire_bytes'] / 1e6:.1f} MB na rede) "
+                             f"em {api['s'] * 1000:.0f} ms | decode {api['decode_s'] * 1000:.0f} ms.")
+            if not data:
+                logging.warning("Nenhum dado retornado pela API. Pulando ciclo.")
+                return
+
+            # Achata /Posicao em colunas (fetch_time único por snapshot, o mesmo do arquivo)
+            with cycle.stage("flatten") as s:
+                columns = flatten_posicao(data, fetch_time=fetch_dt.isoformat())
+                s.rows = n_veiculos = num_rows(columns)
+            logging.info(f"{n_veiculos} veículos extraídos.")
+            with cycle.stage("line_index"):
+                line_index.add_linhas(set(columns["line_c"].tolist()))
+
+            columns = enrich_snapshot(columns, headway_sink=headway_buffer().add)
+            try:
+                decision = update_cadence()
+                if decision:
+                    cycle.note("cadence", decision)
+            except Exception as e:
+                logging.error(f"Erro na cadência adaptativa (mantendo o intervalo): {e}")
+
+            # 3. Buffer + LOAD JOB APPEND quando atingir batch_max_rows / batch_max_age_s
+            buffer = posicoes_buffer()
+            with cycle.stage("buffer", rows=num_rows(columns)):
+                stats = buffer.add(columns)
+            if stats is None:
+                logging.info(f"Buffer: {buffer.snapshots} snapshots, {buffer.rows} linhas "
+                             f"(idade {buffer.age():.0f}s). LOAD JOB adiado.")
+            elif not stats.get('error'):
+                logging.info(f"LOAD JOB CONCLUÍDO! {stats['rows']} linhas appendadas com sucesso.")
+            else:
+                cycle.fail(stats['error'])
+
+        except Exception as e:
+            cycle.fail(e)
+            logging.error(f"Erro crítico no ciclo ETL: {e}")
+            try:
+                logging.info("Tentando reautenticar...")
+                sptrans_client.authenticate()
+            except Exception as auth_e:
+                logging.error(f"Falha na reautenticação: {auth_e}")
+        finally:
+            # Sem snapshot novo (API fora, ciclo vazio) o add() não roda: idade checada a cada tick
+            flush_stale_buffers()
 
-    # === GARANTIR 60 SEGUNDOS ===
+    # Intervalo (fixo ou adaptativo) garantido pelo Scheduler, não por sleep aqui
     elapsed = time.time() - start_time
-    sleep_time = max(0, 60 - elapsed)
-    logging.info(f"Ciclo concluído em {elapsed:.1f}s. Aguardando {sleep_time:.1f}s até próximo...")
-    time.sleep(sleep_time)
+    logging.info(f"Ciclo concluído em {elapsed:.1f}s.")
 
 
 if __name__ == '__main__':
-    logging.info("PIPELINE DE POSIÇÕES INICIADO (a cada 60s - FREE TIER)")
+    logging.info(f"PIPELINE DE POSIÇÕES INICIADO (a cada {base_interval_s}s"
+                 f"{', adaptativo' if callable(poll_interval) else ''} - FREE TIER)")
+    metrics.start_server()
     try:
-        while True:
-            etl_cycle()
+        run_periodically("posicoes", etl_cycle, poll_interval)
     except KeyboardInterrupt:
-        logging.info("Pipeline interrompido pelo usuário (Ctrl+C). Encerrando.")
\ No newline at end of file
+        logging.info("Pipeline interrompido pelo usuário (Ctrl+C). Descarregando buffer...")
+        flush_buffers()
+        logging.info("Encerrando.")
\ No newline at end of file
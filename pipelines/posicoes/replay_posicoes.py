@@ -0,0 +1,141 @@
+# pipelines/posicoes/replay_posicoes.py
+"""Replay do arquivo local de /Posicao (core/snapshot_archive.py) → sptrans_posicoes.
+
+Uso:
+    python pipelines/posicoes/replay_posicoes.py --start 2024-05-01T10:00 --end 2024-05-01T12:00
+    python pipelines/posicoes/replay_posicoes.py --start 2024-05-01 --end 2024-05-02 --truncate [--headway]
+    python pipelines/posicoes/replay_posicoes.py --list
+
+Refaz flatten + enriquecimento (estado por veículo, parada mais próxima, map-matching)
+de cada snapshot arquivado no intervalo [start, end) (UTC), com o fetch_time original,
+e carrega em lotes de --batch-rows por partição diária. --truncate substitui cada
+partição do intervalo (WRITE_TRUNCATE em table$YYYYMMDD) em vez de acrescentar:
+use com dias inteiros, pois linhas do dia fora do intervalo são perdidas.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(project_root)
+
+from pipelines.posicoes import main_posicoes
+from core.flatten_posicao import flatten_posicao
+from core.load_job import load_json_to_bigquery, num_rows, partition_table_id
+from core.micro_batch import concat_columns
+from core.schemas import SCHEMA_POSICOES, SCHEMA_HEADWAY
+
+
+def parse_utc(value):
+    ts = datetime.fromisoformat(value)
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+class PartitionLoader:
+    """Acumula colunas de um dia (UTC) e carrega em lotes; o primeiro lote de cada dia trunca a partição"""
+
+    def __init__(self, table_id, schema, truncate=False, batch_rows=1_000_000, dry_run=False):
+        self.table_id = table_id
+        self.schema = schema
+        self.truncate = truncate
+        self.batch_rows = batch_rows
+        self.dry_run = dry_run
+        self.day = None
+        self.pending = []
+        self.rows = 0
+        self.loaded = 0
+        self.truncated = set()
+
+    def add(self, day, columns):
+        if self.day is not None and day != self.day:
+            self.flush()
+        self.day = day
+        self.pending.append(columns)
+        self.rows += num_rows(columns)
+        if self.rows >= self.batch_rows:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        columns = concat_columns(self.pending)
+        mode = 'append'
+        if self.truncate and self.day not in self.truncated:
+            mode = 'truncate'
+            self.truncated.add(self.day)
+        if not self.dry_run:
+            load_json_to_bigquery(
+                client=main_posicoes.bigquery_client.client,
+                table_id=partition_table_id(self.table_id, self.day),
+                rows=columns,
+                mode=mode,
+                source_format=main_posicoes.load_format,
+                schema=self.schema
+            )
+        self.loaded += self.rows
+        self.pending, self.rows = [], 0
+
+
+def replay(start, end, truncate=False, headway=False, batch_rows=1_000_000, dry_run=False):
+    archive = main_posicoes.open_archive()
+    posicoes = PartitionLoader(main_posicoes.posicoes_table, SCHEMA_POSICOES, truncate, batch_rows, dry_run)
+    headway_loader = PartitionLoader(main_posicoes.headway_table_id, SCHEMA_HEADWAY, truncate, batch_rows, dry_run)
+
+    t0 = time.perf_counter()
+    snapshots, raw_bytes = 0, 0
+    for fetch_dt, raw in archive.iter_snapshots(start, end):
+        day = fetch_dt.date()
+        sink = (lambda table: headway_loader.add(day, table)) if headway else None
+        columns = flatten_posicao(json.loads(raw), fetch_time=fetch_dt.isoformat())
+        posicoes.add(day, main_posicoes.enrich_snapshot(columns, headway_sink=sink))
+        snapshots += 1
+        raw_bytes += len(raw)
+        if snapshots % 60 == 0:
+            elapsed = time.perf_counter() - t0
+            print(f"  {fetch_dt:%Y-%m-%d %H:%M} | {snapshots} snapshots | {snapshots / elapsed:.1f} snapshots/s")
+    posicoes.flush()
+    headway_loader.flush()
+
+    elapsed = time.perf_counter() - t0
+    print(f"Replay: {snapshots} snapshots ({raw_bytes / 1e6:.0f} MB brutos) → {posicoes.loaded} posições"
+          + (f", {headway_loader.loaded} linhas de headway" if headway else "")
+          + f" em {elapsed:.1f}s ({snapshots / max(elapsed, 1e-9):.1f} snapshots/s)"
+          + (" [dry-run, sem LOAD JOB]" if dry_run else ""))
+    return posicoes.loaded
+
+
+def list_archive():
+    archive = main_posicoes.open_archive()
+    for path, records in archive.index():
+        first, last = records["ts_us"][0], records["ts_us"][-1]
+        print(f"{os.path.basename(path)}: {len(records)} snapshots | "
+              f"{datetime.fromtimestamp(first / 1e6, timezone.utc):%Y-%m-%d %H:%M:%S} → "
+              f"{datetime.fromtimestamp(last / 1e6, timezone.utc):%H:%M:%S} | "
+              f"{records['length'].sum() / 1e6:.1f} MB zstd ({records['raw_length'].sum() / 1e6:.0f} MB brutos)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--start", type=parse_utc, help="início (ISO-8601, UTC se sem fuso)")
+    parser.add_argument("--end", type=parse_utc, help="fim exclusivo (ISO-8601, UTC se sem fuso)")
+    parser.add_argument("--truncate", action="store_true", help="substitui as partições diárias do intervalo")
+    parser.add_argument("--headway", action="store_true", help="recalcula e carrega também sptrans_headway")
+    parser.add_argument("--batch-rows", type=int, default=1_000_000, help="linhas por LOAD JOB")
+    parser.add_argument("--dry-run", action="store_true", help="só lê, achata e enriquece (mede o replay)")
+    parser.add_argument("--list", action="store_true", help="lista os segmentos do arquivo")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log por snapshot")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    if args.list:
+        list_archive()
+    elif args.start is None or args.end is None:
+        parser.error("--start e --end são obrigatórios (ou use --list)")
+    else:
+        replay(args.start, args.end, truncate=args.truncate, headway=args.headway,
+               batch_rows=args.batch_rows, dry_run=args.dry_run)
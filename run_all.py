@@ -1,75 +1,57 @@
 # run_all.py
-import subprocess
 import os
-from datetime import datetime
+import sys
 import logging
 
-# Config logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s | %(levelname)s | %(message)s')
-
 # Caminhos absolutos
 project_root = os.path.dirname(os.path.abspath(__file__))
-ingest_gtfs_path = os.path.join(project_root, 'ingest', 'ingest_gtfs.py')
-flag_file = os.path.join(project_root, '.gtfs_ingested_today')
+sys.path.append(project_root)
+
+# Config logging (antes de importar as pipelines: o basicConfig delas vira no-op)
+os.makedirs(os.path.join(project_root, 'logs'), exist_ok=True)
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s | %(levelname)s | %(threadName)s | %(message)s',
+    handlers=[
+        logging.FileHandler(os.path.join(project_root, 'logs', 'run_all.log'), encoding='utf-8'),
+        logging.StreamHandler()
+    ]
+)
+
+from core.clients import get_config, get_metrics
+from core.scheduler import Scheduler
 
-# Pipelines OLHO VIVO (sempre em paralelo)
-pipelines = [
-    f"python {os.path.join(project_root, 'pipelines', 'posicoes', 'main_posicoes.py')}",
-    f"python {os.path.join(project_root, 'pipelines', 'linhas', 'enrich_linhas.py')}",
-    f"python {os.path.join(project_root, 'pipelines', 'paradas', 'enrich_paradas.py')}"
-]
 
-def should_run_gtfs():
-    """Roda GTFS apenas 1x por dia (verifica flag + data)"""
-    today = datetime.now().date().isoformat()
-    if not os.path.exists(flag_file):
-        return True
-    try:
-        with open(flag_file, 'r') as f:
-            last_date = f.read().strip()
-        return last_date != today
-    except:
-        return True
+def gtfs_task():
+    """Confere (a cada gtfs_check_s) o manifesto GTFS e recarrega só arquivos alterados"""
+    results = ingest_gtfs.ingest_changed()
+    if results:
+        logging.info(f"GTFS ingest concluído: {len(results)} tabela(s) recarregada(s).")
 
-def mark_gtfs_done():
-    """Cria/atualiza flag com data de hoje"""
-    today = datetime.now().date().isoformat()
-    with open(flag_file, 'w') as f:
-        f.write(today)
-    logging.info(f"GTFS ingest marcado como executado em {today}")
 
-# === EXECUÇÃO ===
-logging.info("Iniciando pipelines SPTrans + GTFS (se necessário)...")
+# === EXECUÇÃO (um processo, clientes compartilhados via core/clients.py) ===
+logging.info("Iniciando pipelines SPTrans + GTFS em processo único...")
+schedule = get_config().get('scheduler', {})
 
-# 1. GTFS: Apenas 1x por dia
-if should_run_gtfs():
-    logging.info("Executando ingest GTFS (1x/dia)...")
-    gtfs_cmd = f"python {ingest_gtfs_path}"
-    result = subprocess.run(gtfs_cmd, shell=True, cwd=project_root, capture_output=True, text=True)
-    if result.returncode == 0:
-        logging.info("GTFS ingest concluído com sucesso.")
-        mark_gtfs_done()
-    else:
-        logging.error(f"Erro no GTFS ingest: {result.stderr}")
-else:
-    logging.info("GTFS já executado hoje. Pulando.")
+from ingest import ingest_gtfs
+from pipelines.posicoes import main_posicoes
+from pipelines.linhas import enrich_linhas
+from pipelines.paradas import enrich_paradas
 
-# 2. OLHO VIVO: Sempre em paralelo
-logging.info("Iniciando pipelines OLHO VIVO em paralelo...")
-processes = []
-for cmd in pipelines:
-    proc = subprocess.Popen(cmd, shell=True, cwd=project_root)
-    processes.append(proc)
-    logging.info(f"Iniciado: {cmd.split('/')[-1]}")
+scheduler = Scheduler()
+scheduler.add("gtfs", gtfs_task, schedule.get('gtfs_check_s', 3600))
+scheduler.add("posicoes", main_posicoes.etl_cycle, main_posicoes.poll_interval, overlap='skip')
+scheduler.add("linhas", enrich_linhas.enrich_cycle, schedule.get('linhas_s', 60), overlap='coalesce')
+scheduler.add("paradas", enrich_paradas.enrich_cycle, schedule.get('paradas_s', 86400), overlap='skip')
 
-logging.info("Todos pipelines rodando! Ctrl+C para parar.")
+get_metrics().start_server()  # /metrics (Prometheus) em metrics.host:metrics.port
+logging.info("Todos pipelines agendados! Ctrl+C para parar.")
 
 # Mantém script vivo
 try:
-    for proc in processes:
-        proc.wait()
+    scheduler.run_forever()
 except KeyboardInterrupt:
-    logging.info("Parando pipelines...")
-    for proc in processes:
-        proc.terminate()
-    logging.info("Pipelines parados.")
\ No newline at end of file
+    logging.info("Parando pipelines (aguardando ciclos em andamento)...")
+    scheduler.stop()
+    main_posicoes.flush_buffers()
+    logging.info("Pipelines parados.")